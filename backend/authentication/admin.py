@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import UserProfile
+from django.utils import timezone
+from .models import EmailOutbox, UserProfile
 
 
 class UserProfileInline(admin.StackedInline):
@@ -17,6 +18,14 @@ class UserProfileInline(admin.StackedInline):
 class UserAdmin(BaseUserAdmin):
     inlines = (UserProfileInline,)
     list_select_related = ('userprofile',)
+    actions = ['delete_in_background']
+
+    def delete_in_background(self, request, queryset):
+        """Deactivate selected users now and delete their data in chunks"""
+        from content.deletion import queue_deletion
+        jobs = [queue_deletion(user, requested_by=request.user) for user in queryset.exclude(pk=request.user.pk)]
+        self.message_user(request, f'🗑️ Queued background deletion for {len(jobs)} users. Track progress under Deletion jobs.')
+    delete_in_background.short_description = "Delete in background (large accounts)"
 
 
 # Unregister the original User admin and register the customized one
@@ -38,3 +47,29 @@ class UserProfileAdmin(admin.ModelAdmin):
     def user_email(self, obj):
         return obj.user.email
     user_email.short_description = 'Email'
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'to']
+    readonly_fields = [field.name for field in EmailOutbox._meta.fields]
+    actions = ['retry_now']
+
+    def recipients(self, obj):
+        return ', '.join(obj.to)
+    recipients.short_description = 'To'
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_now(self, request, queryset):
+        """Requeue dead or pending messages for immediate delivery with fresh attempts"""
+        from .tasks import deliver_email_outbox
+        updated = queryset.exclude(status='sent').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now(), last_error=''
+        )
+        deliver_email_outbox.delay()
+        self.message_user(request, f'📬 Requeued {updated} emails.')
+    retry_now.short_description = "Retry delivery now"
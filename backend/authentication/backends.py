@@ -0,0 +1,48 @@
+"""
+Email + password authentication in a single indexed lookup.
+
+Emails are matched case-insensitively as LOWER(email) = LOWER(%s), the exact
+expression of the functional index added in migration 0006, so login, signup and
+password-reset lookups stay index scans as auth_user grows.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.db.models.lookups import Exact
+
+# Accounts sharing an email (differing only in case) are checked oldest first
+MAX_EMAIL_CANDIDATES = 5
+
+
+def email_matches(email):
+    """Case-insensitive email filter served by the LOWER(email) index."""
+    return Exact(Lower('email'), Lower(Value(email.strip())))
+
+
+def users_by_email(email):
+    return get_user_model().objects.filter(email_matches(email)).order_by('pk')
+
+
+class EmailBackend(ModelBackend):
+    """
+    `authenticate(request, email=..., password=...)` fetches the user and profile in
+    one query and checks the password. Username logins (admin) fall through to
+    ModelBackend unchanged.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if email is None:
+            return super().authenticate(request, username=username, password=password, **kwargs)
+        if not email or password is None:
+            return None
+
+        candidates = list(users_by_email(email).select_related('userprofile')[:MAX_EMAIL_CANDIDATES])
+        if not candidates:
+            # Run the hasher once anyway so response time doesn't reveal unknown emails
+            get_user_model()().set_password(password)
+            return None
+        for user in candidates:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
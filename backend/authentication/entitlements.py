@@ -0,0 +1,53 @@
+"""
+What a user is entitled to, resolved once per request.
+
+Everything that checks premium access goes through `entitlements_for(user)` (or
+`request.entitlements`, set lazily by EntitlementsMiddleware) instead of reading the
+profile itself. CachedTokenAuthentication preloads the result with the user.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    is_premium: bool = False
+    premium_expiry: Optional[date] = None
+
+    @property
+    def tier(self):
+        """Cache-key tier for content that differs by plan"""
+        return 'premium' if self.is_premium else 'free'
+
+    @classmethod
+    def from_profile(cls, profile):
+        # The expiry sweep (authentication/premium.py) only keeps the stored flag and its index
+        # in sync; access ends on the expiry date even if the sweep hasn't run yet
+        if profile is None:
+            return cls()
+        expiry = profile.premium_expiry
+        is_premium = profile.is_premium and (expiry is None or expiry >= timezone.now().date())
+        return cls(is_premium=is_premium, premium_expiry=expiry)
+
+
+FREE = Entitlements()
+
+
+def entitlements_for(user):
+    """Entitlements of `user`, computed from its profile at most once per user object."""
+    if user is None or not user.is_authenticated:
+        return FREE
+    cached = getattr(user, '_entitlements', None)
+    if cached is not None:
+        return cached
+
+    from .models import UserProfile
+    try:
+        profile = user.userprofile
+    except UserProfile.DoesNotExist:
+        profile = None
+    user._entitlements = Entitlements.from_profile(profile)
+    return user._entitlements
@@ -0,0 +1,184 @@
+"""
+Google sign-in: ID token verification and userinfo lookups.
+
+Google's signing certificates are fetched once per process and kept for as long as
+the certs endpoint's Cache-Control allows (refetched early only when a token names
+an unknown key id, i.e. after a key rotation). All calls go through the shared
+pooled, timeout-bounded HTTP client (utils/http_client.py). Endpoint URLs come
+from settings, so local setups and tests can point them at a stand-in server.
+"""
+import base64
+import json
+import logging
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from google.auth import jwt as google_jwt
+
+from utils.http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+DEFAULT_CERTS_MAX_AGE = 300  # seconds, when the response carries no max-age
+MIN_CERTS_REFRESH_SECONDS = 60  # unknown key ids can't force refetches more often than this
+CLOCK_SKEW_SECONDS = 10
+AVATAR_CHUNK_SIZE = 64 * 1024
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+def _client():
+    # Logins wait on these calls, so reads get a shorter budget than the default
+    return get_client('google', read_timeout=5)
+
+
+def _avatar_client():
+    # Picture hosts get their own client, so their failures can't open the sign-in breaker
+    return get_client('google-avatar')
+
+
+def cache_lifetime(headers):
+    """Seconds a response may be reused, from Cache-Control max-age minus Age."""
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    if not match:
+        return DEFAULT_CERTS_MAX_AGE
+    try:
+        age = int(headers.get('Age', 0))
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+
+class GoogleCertificates:
+    """Process-wide cache of Google's token signing certificates ({key id: PEM})."""
+
+    def __init__(self):
+        self._certs = {}
+        self._expires_at = 0.0
+        self._fetched_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def get(self, key_id=None):
+        certs = self._certs
+        if time.monotonic() < self._expires_at and (key_id is None or key_id in certs):
+            return certs
+
+        with self._lock:
+            now = time.monotonic()
+            expired = now >= self._expires_at
+            rotated = key_id is not None and key_id not in self._certs
+            if expired or (rotated and now - self._fetched_at >= MIN_CERTS_REFRESH_SECONDS):
+                self._refresh(now)
+            return self._certs
+
+    def _refresh(self, now):
+        try:
+            response = _client().get(settings.GOOGLE_CERTS_URL)
+            response.raise_for_status()
+            certs = response.json()
+        except (requests.RequestException, ValueError) as e:
+            if not self._certs:
+                raise
+            # Keys rotate slowly; keep verifying with the last set rather than failing every login
+            logger.warning(f"⚠️ Google certs refresh failed, reusing cached keys: {e}")
+            self._fetched_at = now
+            self._expires_at = now + MIN_CERTS_REFRESH_SECONDS
+            return
+        self._certs = certs
+        self._fetched_at = now
+        self._expires_at = now + cache_lifetime(response.headers)
+        logger.info(f"🔑 Fetched {len(certs)} Google signing certificate(s)")
+
+    def clear(self):
+        with self._lock:
+            self._certs, self._expires_at, self._fetched_at = {}, 0.0, float('-inf')
+
+
+certificates = GoogleCertificates()
+
+
+def _jwt_header(token):
+    """
+    Raises:
+        ValueError: If `token` is not a JWT (e.g. an OAuth access token)
+    """
+    try:
+        segment = token.split('.')[0]
+        header = json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+    except Exception as e:
+        raise ValueError('Not a JWT') from e
+    if not isinstance(header, dict) or token.count('.') != 2:
+        raise ValueError('Not a JWT')
+    return header
+
+
+def verify_id_token(token):
+    """
+    Verify a Google ID token against the cached certificates.
+
+    Returns:
+        dict: The token's claims
+
+    Raises:
+        ValueError: If the token is not a valid Google ID token for this app
+    """
+    header = _jwt_header(token)
+    certs = certificates.get(header.get('kid'))
+    claims = google_jwt.decode(
+        token,
+        certs=certs,
+        audience=settings.GOOGLE_OAUTH_CLIENT_ID,
+        clock_skew_in_seconds=CLOCK_SKEW_SECONDS,
+    )
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    return claims
+
+
+def fetch_userinfo(access_token):
+    """
+    Profile of the account an OAuth access token belongs to.
+
+    Raises:
+        ValueError: If Google rejects the token
+    """
+    response = _client().get(
+        settings.GOOGLE_USERINFO_URL,
+        headers={'Authorization': f'Bearer {access_token}'},
+    )
+    if response.status_code != 200:
+        raise ValueError('Invalid Google token')
+    return response.json()
+
+
+def download_avatar(url, max_bytes):
+    """
+    Download a profile picture, streaming so oversized files are cut off early.
+
+    Returns:
+        (bytes, str): The image data and its content type
+
+    Raises:
+        ValueError: If the URL, response or file is not acceptable (not worth retrying)
+        requests.RequestException: Network errors, so the caller can retry
+    """
+    if not url.startswith(('https://', 'http://')):
+        raise ValueError('Unsupported picture URL')
+    with _avatar_client().get(url, stream=True) as response:
+        if response.status_code == 404:
+            raise ValueError('Picture not found')
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        data = bytearray()
+        for chunk in response.iter_content(AVATAR_CHUNK_SIZE):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError('Picture too large')
+    return bytes(data), content_type
@@ -0,0 +1,27 @@
+"""
+Management command to revoke premium access whose expiry date has passed.
+
+Celery beat runs the same sweep hourly; use this from cron when beat isn't running,
+or to check what the next sweep would do.
+"""
+from django.core.management.base import BaseCommand
+
+from authentication.premium import expire_premium, expired_premium_profiles
+
+
+class Command(BaseCommand):
+    help = 'Expire premium memberships past their premium_expiry date (one set-based UPDATE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the profiles that would be expired.',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'🔎 {expired_premium_profiles().count()} premium membership(s) past expiry')
+            return
+        expired = expire_premium()
+        self.stdout.write(self.style.SUCCESS(f'✅ Expired {expired} premium membership(s)'))
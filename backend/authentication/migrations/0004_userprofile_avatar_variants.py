@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_delete_membership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive avatar variants: {size: {"width": int, "webp": path}}'),
+        ),
+    ]
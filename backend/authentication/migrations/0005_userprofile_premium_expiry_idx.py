@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_userprofile_avatar_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('is_premium', True)), fields=['premium_expiry'], name='profile_premium_expiry_idx'),
+        ),
+    ]
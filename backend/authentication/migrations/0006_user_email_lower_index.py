@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-19 13:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+INDEX_NAME = 'auth_user_email_lower_idx'
+
+
+def email_index(connection):
+    """
+    LOWER(email) where the backend supports expression indexes (PostgreSQL, SQLite >= 3.9);
+    otherwise a plain email index, which still serves exact-case lookups.
+    """
+    if connection.features.supports_expression_indexes:
+        return models.Index(Lower('email'), name=INDEX_NAME)
+    return models.Index(fields=['email'], name=INDEX_NAME)
+
+
+def add_email_index(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.add_index(User, email_index(schema_editor.connection))
+
+
+def remove_email_index(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.remove_index(User, email_index(schema_editor.connection))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_userprofile_premium_expiry_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_index, remove_email_index),
+    ]
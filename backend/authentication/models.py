@@ -8,16 +8,25 @@ from django.dispatch import receiver
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, help_text='User profile picture')
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Responsive avatar variants: {size: {"width": int, "webp": path}}')
     bio = models.TextField(blank=True, help_text='User biography')
     date_updated = models.DateTimeField(auto_now=True)
     # Flattened membership fields for unified admin and faster reads
     is_premium = models.BooleanField(default=False)
     premium_expiry = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # The hourly expiry sweep only ever scans active premium rows
+            models.Index(fields=['premium_expiry'], condition=models.Q(is_premium=True), name='profile_premium_expiry_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         """Optimize avatar before saving"""
         import logging
-        from content.image_optimizer import validate_and_optimize_image
+        from content.image_optimizer import (
+            ImageOptimizer, validate_and_optimize_image, pending_image_bytes, processed_image_fields
+        )
         
         logger = logging.getLogger(__name__)
         
@@ -36,7 +45,18 @@ class UserProfile(models.Model):
                 logger.warning(f"Avatar optimization failed for {self.user.username}: {e}")
                 # Continue with original avatar
         
+        new_avatar_bytes = pending_image_bytes(self.avatar)
+        if not self.avatar:
+            self.avatar_variants = {}
+        
         super().save(*args, **kwargs)
+        
+        if new_avatar_bytes is not None:
+            updates = processed_image_fields(
+                'avatar', new_avatar_bytes, self.avatar.name, sizes=ImageOptimizer.AVATAR_SIZES, metadata=False
+            )
+            self.avatar_variants = updates['avatar_variants']
+            UserProfile.objects.filter(pk=self.pk).update(**updates)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -71,17 +91,9 @@ User.add_to_class("avatar", property(get_avatar))
 
 # Premium helpers on User for unified access
 def get_is_premium(self):
-    """Unified premium flag from profile only (membership removed)."""
-    try:
-        prof = self.userprofile
-        if prof.is_premium:
-            if prof.premium_expiry is None:
-                return True
-            from django.utils import timezone
-            return prof.premium_expiry >= timezone.now().date()
-        return False
-    except UserProfile.DoesNotExist:
-        return False
+    """Unified premium flag (see authentication/entitlements.py)."""
+    from .entitlements import entitlements_for
+    return entitlements_for(self).is_premium
 
 
 def get_premium_expiry(self):
@@ -101,3 +113,44 @@ def create_user_related_objects(sender, instance, created, **kwargs):
     """Create UserProfile when a new User is created"""
     if created:
         UserProfile.objects.get_or_create(user=instance)
+
+
+class EmailOutbox(models.Model):
+    """
+    Transactional email waiting for delivery.
+
+    Rows are written in the request's transaction (see authentication/outbox.py) and
+    delivered by a background worker with retries; messages that keep failing end up
+    as 'dead' for inspection instead of being dropped.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text='When a pending (or stalled sending) row is next eligible')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        ordering = ['-created_at']
+        verbose_name_plural = 'Email outbox'
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
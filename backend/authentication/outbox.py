@@ -0,0 +1,197 @@
+"""
+Transactional email outbox.
+
+Views call queue_email() instead of sending: the message becomes an EmailOutbox row
+in the request's transaction (so it is only sent if the transaction commits). Once
+it commits, a task delivers just that row; the rest of the outbox (retries, rows
+whose task was lost) is drained every minute from Celery beat. Without a broker the
+task runs eagerly, so the request sends its own message once and never waits on
+other rows or retry backoff.
+
+The worker claims due rows with SELECT ... FOR UPDATE SKIP LOCKED and a lease, so
+concurrent workers never double-send and rows of a crashed worker become due again.
+Identical messages to single recipients are delivered in one batch call when
+the backend supports it (ZeptoMail). Failures retry with jittered exponential
+backoff. Rows that run out of attempts are marked 'dead'.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CLAIM_SIZE = 200
+OUTBOX_MAX_PASSES = 20
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_SECONDS = 30  # doubled per attempt, jittered
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+OUTBOX_LEASE_SECONDS = 300  # a claimed row is retried if its worker hasn't finished by then
+OUTBOX_KEEP_SENT_DAYS = 7
+
+
+def queue_email(message):
+    """
+    Store an EmailMessage for background delivery.
+
+    Returns:
+        EmailOutbox: The queued row
+    """
+    html_body = ''
+    for content, mimetype in getattr(message, 'alternatives', None) or []:
+        if mimetype == 'text/html':
+            html_body = content
+            break
+    row = EmailOutbox.objects.create(
+        from_email=message.from_email,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        subject=message.subject,
+        text_body=message.body or '',
+        html_body=html_body,
+    )
+    from .tasks import deliver_email_outbox
+    transaction.on_commit(lambda: deliver_email_outbox.delay(row.pk))
+    return row
+
+
+def build_message(row, connection=None):
+    message = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.text_body,
+        from_email=row.from_email,
+        to=row.to,
+        cc=row.cc,
+        bcc=row.bcc,
+        reply_to=row.reply_to,
+        connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, 'text/html')
+    return message
+
+
+def claim_due(limit=OUTBOX_CLAIM_SIZE, ids=None):
+    """Lease up to `limit` due rows (only `ids`, if given) to this worker; attempts are counted at claim time."""
+    now = timezone.now()
+    due = EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+        status__in=['pending', 'sending'], next_attempt_at__lte=now
+    )
+    if ids is not None:
+        due = due.filter(pk__in=ids)
+    with transaction.atomic():
+        rows = list(due.order_by('next_attempt_at')[:limit])
+        EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+        )
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def group_rows(rows, connection):
+    """Batches of rows that can go out in one API call; one row per batch without batch support."""
+    batch_limit = getattr(connection, 'BATCH_MAX_RECIPIENTS', 0)
+    if not hasattr(connection, 'send_batch') or not batch_limit:
+        return [[row] for row in rows]
+
+    groups, singles = {}, []
+    for row in rows:
+        if len(row.to) == 1 and not row.cc and not row.bcc:
+            key = (row.from_email, row.subject, row.text_body, row.html_body, tuple(row.reply_to))
+            groups.setdefault(key, []).append(row)
+        else:
+            singles.append([row])
+    batches = []
+    for group in groups.values():
+        batches.extend(group[start:start + batch_limit] for start in range(0, len(group), batch_limit))
+    return batches + singles
+
+
+def retry_delay(attempts):
+    return random.uniform(0.5, 1.0) * min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+def send_group(connection, rows):
+    """
+    Returns:
+        str: Empty on success, else the error
+    """
+    message = build_message(rows[0], connection)
+    try:
+        if len(rows) > 1:
+            sent = connection.send_batch(message, [row.to[0] for row in rows])
+        else:
+            sent = connection.send_messages([message]) == 1
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return '' if sent else 'Email backend reported the message as not sent'
+
+
+def record_results(sent_rows, failed_rows):
+    now = timezone.now()
+    if sent_rows:
+        EmailOutbox.objects.filter(pk__in=[row.pk for row in sent_rows]).update(
+            status='sent', sent_at=now, last_error=''
+        )
+    for row, error in failed_rows:
+        row.last_error = error[:2000]
+        if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            row.status = 'dead'
+            logger.error(f"💀 Email {row.pk} to {row.to} dead after {row.attempts} attempts: {error}")
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+    if failed_rows:
+        EmailOutbox.objects.bulk_update(
+            [row for row, _ in failed_rows], ['status', 'next_attempt_at', 'last_error']
+        )
+
+
+def deliver_outbox(limit=OUTBOX_CLAIM_SIZE, max_passes=OUTBOX_MAX_PASSES, ids=None):
+    """
+    Deliver due outbox rows until none are left (or `max_passes` claims were made).
+    With `ids`, only those rows are considered, in a single pass.
+
+    Returns:
+        dict: {'sent': int, 'failed': int}
+    """
+    totals = {'sent': 0, 'failed': 0}
+    connection = get_connection(fail_silently=False)
+    with connection:
+        for _ in range(max_passes):
+            rows = claim_due(limit, ids)
+            if not rows:
+                break
+            sent_rows, failed_rows = [], []
+            for group in group_rows(rows, connection):
+                error = send_group(connection, group)
+                if error:
+                    failed_rows.extend((row, error) for row in group)
+                else:
+                    sent_rows.extend(group)
+            record_results(sent_rows, failed_rows)
+            totals['sent'] += len(sent_rows)
+            totals['failed'] += len(failed_rows)
+            if ids is not None or len(rows) < limit:
+                break
+    if totals['sent'] or totals['failed']:
+        logger.info(f"📬 Email outbox: {totals['sent']} sent, {totals['failed']} failed")
+    return totals
+
+
+def purge_sent(days=OUTBOX_KEEP_SENT_DAYS):
+    """Delete delivered rows older than `days` (they hold reset links and other one-off content)."""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = EmailOutbox.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile
+from .entitlements import entitlements_for
+from content.image_optimizer import variants_srcset
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -23,12 +25,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model with optimized queries"""
     avatar = serializers.SerializerMethodField()
+    avatar_srcset = serializers.SerializerMethodField()
     is_premium = serializers.SerializerMethodField()
     premium_expiry = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'date_joined', 'avatar', 'is_premium', 'premium_expiry']
+        fields = ['id', 'username', 'email', 'date_joined', 'avatar', 'avatar_srcset', 'is_premium', 'premium_expiry']
         read_only_fields = ['id', 'date_joined', 'is_premium', 'premium_expiry']
     
     def get_avatar(self, obj):
@@ -51,18 +54,19 @@ class UserSerializer(serializers.ModelSerializer):
         # Fallback for background tasks without request
         return f'http://127.0.0.1:8000{avatar_url}' if avatar_url.startswith('/') else avatar_url
     
-    def get_is_premium(self, obj):
-        """Premium based on profile only (membership removed)."""
+    def get_avatar_srcset(self, obj):
+        """Responsive avatar URLs per format (small avatars shouldn't download the full image)"""
         try:
-            prof = obj.userprofile
-            if prof.is_premium:
-                if prof.premium_expiry is None:
-                    return True
-                from django.utils import timezone
-                return prof.premium_expiry >= timezone.now().date()
-            return False
+            profile = obj.userprofile
         except (UserProfile.DoesNotExist, AttributeError):
-            return False
+            return None
+        if not profile.avatar:
+            return None
+        return variants_srcset(profile.avatar_variants)
+    
+    def get_is_premium(self, obj):
+        """Premium from the user's entitlements (preloaded by token authentication)."""
+        return entitlements_for(obj).is_premium
 
     def get_premium_expiry(self, obj):
         try:
@@ -0,0 +1,70 @@
+"""
+Background tasks for the authentication app.
+Run eagerly in-process when no CELERY_BROKER_URL is configured.
+"""
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def expire_premium_memberships():
+    """Flip is_premium off where premium_expiry has passed (scheduled hourly by beat)."""
+    from .premium import expire_premium
+    return expire_premium()
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def ingest_google_avatar(self, user_id, picture_url):
+    """Download a new Google user's profile picture and store it as their optimized avatar."""
+    import requests
+    from django.conf import settings
+    from content.uploads import ALLOWED_UPLOAD_TYPES, optimize_upload
+    from .google import download_avatar
+    from .models import UserProfile
+
+    profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
+    if profile.avatar:
+        return  # The user set one in the meantime (or a duplicate delivery)
+
+    try:
+        data, content_type = download_avatar(picture_url, settings.MEDIA_UPLOAD_MAX_MB * 1024 * 1024)
+        if content_type not in ALLOWED_UPLOAD_TYPES:
+            raise ValueError(f'Unsupported picture type {content_type!r}')
+        optimized = optimize_upload(data, f'google-{user_id}.{ALLOWED_UPLOAD_TYPES[content_type]}', content_type)
+    except ValueError as e:
+        logger.warning(f"Skipping Google avatar for user {user_id}: {e}")
+        return
+    except requests.RequestException as e:
+        if self.request.is_eager:
+            # Running inside the sign-in request (no broker): don't retry inline. The user
+            # keeps the default avatar and can upload their own.
+            logger.warning(f"Google avatar for user {user_id} not fetched: {e}")
+            return
+        if self.request.retries >= self.max_retries:
+            logger.warning(f"Giving up on Google avatar for user {user_id}: {e}")
+            return
+        raise self.retry(exc=e)
+
+    profile.refresh_from_db(fields=['avatar'])
+    if profile.avatar:
+        return
+    profile.avatar = optimized
+    profile.save()
+    logger.info(f"🖼️ Stored Google avatar for user {user_id}")
+
+
+@shared_task
+def deliver_email_outbox(outbox_id=None):
+    """
+    Send one just-queued EmailOutbox row (on commit), or every due row and purge
+    old sent ones (every minute by beat, which also picks up retries).
+    """
+    from .outbox import deliver_outbox, purge_sent
+    if outbox_id is not None:
+        deliver_outbox(ids=[outbox_id])
+        return
+    deliver_outbox()
+    purge_sent()
@@ -1,3 +1,548 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import boto3
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.mail import EmailMultiAlternatives
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from google.auth import crypt, jwt as google_jwt
+from moto import mock_aws
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from content.tests import TEST_BUCKET, TEST_STORAGES, jpeg_bytes
+from utils.http_client import _clients
+from utils.zeptomail_backend import FakeZeptoMailBackend
+from .entitlements import Entitlements
+from .google import (
+    DEFAULT_CERTS_MAX_AGE, MIN_CERTS_REFRESH_SECONDS, cache_lifetime, certificates, download_avatar, verify_id_token,
+)
+from .models import EmailOutbox, UserProfile
+from .outbox import (
+    OUTBOX_BACKOFF_SECONDS, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, claim_due, deliver_outbox, purge_sent, queue_email,
+)
+from .premium import expire_premium
+from .tasks import ingest_google_avatar
+from .token_auth import CachedTokenAuthentication, _local_cache
+from .usernames import create_user_with_unique_username, next_free_username, username_base
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Cached entries must not outlive revocations made by other workers"""
+
+    def setUp(self):
+        _local_cache.clear()
+        self.addCleanup(_local_cache.clear)
+        self.user = User.objects.create_user(username='player', email='player@example.com', password='pw')
+        self.profile, _ = UserProfile.objects.get_or_create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.token.key)[0]
+
+    def test_hit_costs_one_query(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_token_deleted_elsewhere_is_refused(self):
+        self.authenticate()
+        # Another worker's delete: no signal reaches this process's cache
+        with mock.patch('authentication.token_auth.invalidate_user_on_commit'), \
+                mock.patch.object(_local_cache, 'discard'):
+            self.token.delete()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_user_deactivated_elsewhere_is_refused(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_profile_change_elsewhere_reloads_entitlements(self):
+        self.assertFalse(self.authenticate()._entitlements.is_premium)
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            is_premium=True,
+            premium_expiry=timezone.now().date() + timedelta(days=30),
+            date_updated=timezone.now(),
+        )
+        self.assertTrue(self.authenticate()._entitlements.is_premium)
+
+
+class PremiumExpiryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='subscriber', email='subscriber@example.com', password='pw')
+        self.profile, _ = UserProfile.objects.get_or_create(user=self.user)
+
+    def set_expiry(self, days):
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            is_premium=True, premium_expiry=timezone.now().date() + timedelta(days=days),
+        )
+        self.profile.refresh_from_db()
+
+    def test_expired_flag_is_not_trusted_before_the_sweep(self):
+        self.set_expiry(-1)
+        self.assertTrue(self.profile.is_premium)
+        self.assertFalse(Entitlements.from_profile(self.profile).is_premium)
+
+    def test_active_until_the_expiry_date(self):
+        self.set_expiry(0)
+        self.assertTrue(Entitlements.from_profile(self.profile).is_premium)
+
+    def test_sweep_clears_the_stored_flag(self):
+        self.set_expiry(-1)
+        self.assertEqual(expire_premium(), 1)
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.is_premium)
+
+
+def signing_key(key_id):
+    """An RSA key and self-signed certificate, like one entry of Google's certs endpoint."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+    now = datetime.now(dt_timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    signer = crypt.RSASigner.from_string(private_pem, key_id=key_id)
+    return signer, certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    """Serves whatever the test put in `routes`: path -> list of (status, headers, body), last one repeats."""
+    routes = {}
+    hits = []
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.hits.append((path, self.headers.get('Authorization')))
+        responses = self.routes.get(path) or [(404, {}, b'')]
+        status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        if callable(body):
+            body = body(self)
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers = {'Content-Type': 'application/json', **headers}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGoogleTestCase(TestCase):
+    """Runs a local stand-in for Google's certs, userinfo and picture endpoints."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogleHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        cls.keys = {key_id: signing_key(key_id) for key_id in ('key-1', 'key-2')}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeGoogleHandler.routes = {}
+        FakeGoogleHandler.hits = []
+        settings_override = self.settings(
+            GOOGLE_CERTS_URL=f'{self.base_url}/oauth2/v1/certs',
+            GOOGLE_USERINFO_URL=f'{self.base_url}/oauth2/v3/userinfo',
+            GOOGLE_OAUTH_CLIENT_ID='test-client-id',
+            OUTBOUND_HTTP_RETRIES=0,
+            SECURE_SSL_REDIRECT=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # A fresh client (picks up the settings above) and an empty certificate cache
+        for name in ('google', 'google-avatar'):
+            _clients.pop(name, None)
+            self.addCleanup(_clients.pop, name, None)
+        certificates.clear()
+        self.addCleanup(certificates.clear)
+
+        self.clock = time.monotonic()
+        patcher = mock.patch('authentication.google.time.monotonic', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def serve(self, path, *responses):
+        FakeGoogleHandler.routes[path] = list(responses)
+
+    def serve_certs(self, *key_ids, headers=None):
+        certs = {key_id: self.keys[key_id][1] for key_id in key_ids}
+        self.serve('/oauth2/v1/certs', (200, headers or {'Cache-Control': 'public, max-age=600'}, certs))
+
+    def hits(self, path):
+        return sum(1 for hit_path, _auth in FakeGoogleHandler.hits if hit_path == path)
+
+    def id_token(self, key_id='key-1', **claims):
+        now = int(datetime.now(dt_timezone.utc).timestamp())
+        payload = {
+            'iss': 'https://accounts.google.com',
+            'aud': 'test-client-id',
+            'sub': '1234567890',
+            'email': 'ada@example.com',
+            'name': 'Ada Lovelace',
+            'iat': now,
+            'exp': now + 3600,
+            **claims,
+        }
+        return google_jwt.encode(self.keys[key_id][0], payload).decode()
+
+
+class GoogleCertificateTests(FakeGoogleTestCase):
+    def test_certificates_are_reused_for_max_age(self):
+        self.serve_certs('key-1')
+        self.assertEqual(verify_id_token(self.id_token())['email'], 'ada@example.com')
+        self.clock += 599
+        verify_id_token(self.id_token())
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 1)
+
+        self.clock += 2
+        verify_id_token(self.id_token())
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 2)
+
+    def test_age_header_shortens_lifetime(self):
+        self.serve_certs('key-1', headers={'Cache-Control': 'max-age=600', 'Age': '590'})
+        verify_id_token(self.id_token())
+        self.clock += 11
+        verify_id_token(self.id_token())
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 2)
+
+    def test_cache_lifetime(self):
+        self.assertEqual(cache_lifetime({'Cache-Control': 'public, max-age=19845, must-revalidate'}), 19845)
+        self.assertEqual(cache_lifetime({'Cache-Control': 'max-age=100', 'Age': '30'}), 70)
+        self.assertEqual(cache_lifetime({'Cache-Control': 'max-age=100', 'Age': '300'}), 0)
+        self.assertEqual(cache_lifetime({'Cache-Control': 'no-store'}), 0)
+        self.assertEqual(cache_lifetime({}), DEFAULT_CERTS_MAX_AGE)
+
+    def test_unknown_key_id_refreshes_after_rotation(self):
+        self.serve_certs('key-1')
+        verify_id_token(self.id_token())
+        self.serve_certs('key-1', 'key-2')
+
+        # Unknown key ids can't force refetches more often than MIN_CERTS_REFRESH_SECONDS
+        with self.assertRaises(ValueError):
+            verify_id_token(self.id_token('key-2'))
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 1)
+
+        self.clock += MIN_CERTS_REFRESH_SECONDS
+        self.assertEqual(verify_id_token(self.id_token('key-2'))['sub'], '1234567890')
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 2)
+
+    def test_stale_keys_are_reused_when_refresh_fails(self):
+        self.serve_certs('key-1')
+        verify_id_token(self.id_token())
+        self.serve('/oauth2/v1/certs', (503, {}, b'unavailable'))
+
+        self.clock += 601
+        self.assertEqual(verify_id_token(self.id_token())['email'], 'ada@example.com')
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 2)
+
+        # The failed refresh is not retried on every login
+        verify_id_token(self.id_token())
+        self.assertEqual(self.hits('/oauth2/v1/certs'), 2)
+
+    def test_first_fetch_failure_is_an_error(self):
+        self.serve('/oauth2/v1/certs', (503, {}, b'unavailable'))
+        with self.assertRaises(requests.RequestException):
+            verify_id_token(self.id_token())
+
+    def test_wrong_audience_and_issuer_are_rejected(self):
+        self.serve_certs('key-1')
+        with self.assertRaises(ValueError):
+            verify_id_token(self.id_token(aud='someone-else'))
+        with self.assertRaises(ValueError):
+            verify_id_token(self.id_token(iss='https://evil.example.com'))
+
+
+class GoogleOAuthViewTests(FakeGoogleTestCase):
+    def login(self, token):
+        return APIClient().post('/api/auth/google-oauth/', {'token': token}, format='json')
+
+    def test_id_token_signup(self):
+        self.serve_certs('key-1')
+        picture = f'{self.base_url}/photo.jpg'
+        with mock.patch.object(ingest_google_avatar, 'delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.login(self.id_token(picture=picture))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(response.data['is_new'])
+        self.assertEqual(self.hits('/oauth2/v3/userinfo'), 0)
+        delay.assert_called_once_with(User.objects.get(email='ada@example.com').pk, picture)
+
+    def test_access_token_falls_back_to_userinfo(self):
+        self.serve('/oauth2/v3/userinfo', (200, {}, {'email': 'grace@example.com', 'given_name': 'Grace', 'family_name': 'Hopper'}))
+        response = self.login('ya29.opaque-access-token')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(FakeGoogleHandler.hits, [('/oauth2/v3/userinfo', 'Bearer ya29.opaque-access-token')])
+        user = User.objects.get(email='grace@example.com')
+        self.assertEqual((user.first_name, user.last_name), ('Grace', 'Hopper'))
+
+        # The same account logs in again instead of signing up twice
+        response = self.login('ya29.opaque-access-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_new'])
+
+    def test_rejected_access_token(self):
+        self.serve('/oauth2/v3/userinfo', (401, {}, {'error': 'invalid_token'}))
+        self.assertEqual(self.login('ya29.revoked').status_code, 401)
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='')
+class GoogleAvatarTests(FakeGoogleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=TEST_BUCKET)
+        cache.clear()
+        caches['media-metadata'].clear()
+        self.user = User.objects.create_user(username='ada', email='ada@example.com')
+        self.url = f'{self.base_url}/photo.jpg'
+
+    def ingest(self):
+        ingest_google_avatar.apply(args=[self.user.pk, self.url])
+        return UserProfile.objects.get(user=self.user).avatar
+
+    def test_picture_is_stored_as_avatar(self):
+        self.serve('/photo.jpg', (200, {'Content-Type': 'image/jpeg'}, jpeg_bytes()))
+        avatar = self.ingest()
+        self.assertTrue(avatar.name.startswith('avatars/'))
+
+    def test_oversized_picture_is_skipped(self):
+        self.serve('/photo.jpg', (200, {'Content-Type': 'image/jpeg'}, b'\xff' * (1024 * 1024 + 1)))
+        with self.settings(MEDIA_UPLOAD_MAX_MB=1):
+            self.assertFalse(self.ingest())
+        self.assertEqual(self.hits('/photo.jpg'), 1)  # Not retried
+
+    def test_download_stops_at_the_cap(self):
+        self.serve('/photo.jpg', (200, {'Content-Type': 'image/jpeg'}, b'\xff' * 500_000))
+        with self.assertRaisesMessage(ValueError, 'too large'):
+            download_avatar(self.url, max_bytes=100_000)
+
+    def test_unsupported_type_is_skipped(self):
+        self.serve('/photo.jpg', (200, {'Content-Type': 'text/html'}, b'<html></html>'))
+        self.assertFalse(self.ingest())
+
+    def run_in_worker(self, retries=0):
+        """Run the task body as a worker would (not eager), with retry() stubbed out."""
+        from celery.exceptions import Retry
+        ingest_google_avatar.push_request(id='avatar-task', is_eager=False, retries=retries)
+        self.addCleanup(ingest_google_avatar.pop_request)
+        with mock.patch.object(ingest_google_avatar, 'retry', side_effect=Retry) as retry:
+            try:
+                ingest_google_avatar.run(self.user.pk, self.url)
+            except Retry:
+                pass
+        return retry
+
+    def test_transient_errors_are_retried_by_a_worker(self):
+        self.serve('/photo.jpg', (503, {}, b''))
+        self.assertEqual(self.run_in_worker().call_count, 1)
+
+    def test_worker_gives_up_after_max_retries(self):
+        self.serve('/photo.jpg', (503, {}, b''))
+        self.assertEqual(self.run_in_worker(retries=ingest_google_avatar.max_retries).call_count, 0)
+        self.assertFalse(UserProfile.objects.get(user=self.user).avatar)
+
+    def test_transient_errors_are_not_retried_inline_when_eager(self):
+        self.serve('/photo.jpg', (503, {}, b''), (200, {'Content-Type': 'image/jpeg'}, jpeg_bytes()))
+        self.assertFalse(self.ingest())
+        self.assertEqual(self.hits('/photo.jpg'), 1)
+
+    def test_picture_failures_leave_the_sign_in_client_alone(self):
+        self.serve('/photo.jpg', (503, {}, b''))
+        for _ in range(10):
+            self.ingest()
+        self.assertIn('google-avatar', _clients)
+        self.assertNotIn('google', _clients)
+
+    def test_existing_avatar_is_kept(self):
+        self.serve('/photo.jpg', (200, {'Content-Type': 'image/jpeg'}, jpeg_bytes()))
+        self.ingest()
+        self.ingest()
+        self.assertEqual(self.hits('/photo.jpg'), 1)
+
+
+class UniqueUsernameTests(TestCase):
+    def make(self, *usernames):
+        for username in usernames:
+            User.objects.create_user(username=username)
+
+    def test_base_from_email(self):
+        self.assertEqual(username_base('jane.doe+quiz@example.com'), 'jane.doe+quiz')
+        self.assertEqual(username_base('ján (work)@example.com'), 'jánwork')
+        self.assertEqual(username_base('@example.com'), 'player')
+        self.assertEqual(len(username_base('x' * 300 + '@example.com')), 150 - 9)
+
+    def test_free_base_is_used_as_is(self):
+        self.make('alice1', 'alicia')
+        self.assertEqual(next_free_username('alice'), 'alice')
+
+    def test_taken_base_gets_the_next_suffix(self):
+        self.make('alice', 'alice1', 'alice7', 'alice_smith', 'alicex9')
+        self.assertEqual(next_free_username('alice'), 'alice8')
+
+    def test_base_ending_in_digits(self):
+        self.make('bob42')
+        self.assertEqual(next_free_username('bob42'), 'bob421')
+        # Suffixes are read after the whole base: "bob4299" is bob42 + 99
+        self.make('bob421', 'bob4299')
+        self.assertEqual(next_free_username('bob42'), 'bob42100')
+
+    def test_regex_metacharacters_in_the_base_are_literal(self):
+        self.make('a.b', 'axb5', 'a.b3', 'c+d', 'ccd9', 'e-f')
+        self.assertEqual(next_free_username('a.b'), 'a.b4')  # axb5 must not match "a.b"
+        self.assertEqual(next_free_username('c+d'), 'c+d1')
+        self.assertEqual(next_free_username('e-f'), 'e-f1')
+        self.assertEqual(next_free_username('e-'), 'e-')
+
+    def test_lost_race_is_retried(self):
+        from . import usernames
+        self.make('carol')
+        # The first allocation is stale: a concurrent signup took "carol" after it was read
+        stale = iter(['carol'])
+        with mock.patch.object(
+            usernames, 'next_free_username', side_effect=lambda base: next(stale, None) or next_free_username(base),
+        ) as allocate:
+            user = create_user_with_unique_username('carol', email='carol@example.com')
+        self.assertEqual(allocate.call_count, 2)
+        self.assertEqual(user.username, 'carol1')
+        self.assertEqual(user.email, 'carol@example.com')
+
+    def test_gives_up_after_every_attempt_collides(self):
+        from django.db import IntegrityError
+        from . import usernames
+        self.make('dave')
+        with mock.patch.object(usernames, 'next_free_username', return_value='dave'):
+            with self.assertRaises(IntegrityError):
+                create_user_with_unique_username('dave', attempts=3)
+        self.assertEqual(User.objects.filter(username__startswith='dave').count(), 1)
+
+
+@override_settings(EMAIL_BACKEND='utils.zeptomail_backend.FakeZeptoMailBackend')
+class EmailOutboxTests(TestCase):
+    """Outbox delivery against the local ZeptoMail stand-in"""
+
+    def setUp(self):
+        FakeZeptoMailBackend.reset()
+        self.addCleanup(FakeZeptoMailBackend.reset)
+
+    def queue(self, to='reader@example.com', subject='Reset your password', cc=None):
+        message = EmailMultiAlternatives(subject, 'Follow the link', 'noreply@example.com', [to], cc=cc)
+        message.attach_alternative('<p>Follow the link</p>', 'text/html')
+        with self.captureOnCommitCallbacks():
+            return queue_email(message)
+
+    def paths(self):
+        return [request['path'] for request in FakeZeptoMailBackend.requests]
+
+    def test_commit_delivers_only_the_queued_row(self):
+        earlier = self.queue(to='earlier@example.com')
+        message = EmailMultiAlternatives('Welcome', 'Hello', 'noreply@example.com', ['new@example.com'])
+        with self.captureOnCommitCallbacks(execute=True):
+            row = queue_email(message)
+
+        row.refresh_from_db()
+        earlier.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('sent', 1))
+        self.assertEqual(earlier.status, 'pending')
+        self.assertEqual(self.paths(), ['v1.1/email'])
+        self.assertEqual(FakeZeptoMailBackend.requests[0]['payload']['subject'], 'Welcome')
+
+    def test_claim_leases_rows(self):
+        row = self.queue()
+        self.assertEqual([claimed.pk for claimed in claim_due()], [row.pk])
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('sending', 1))
+        self.assertGreater(row.next_attempt_at, timezone.now() + timedelta(seconds=OUTBOX_LEASE_SECONDS - 5))
+        # Leased rows aren't claimed again until the lease runs out (a crashed worker)
+        self.assertEqual(claim_due(), [])
+        EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual([claimed.attempts for claimed in claim_due()], [2])
+
+    def test_identical_messages_go_out_in_one_batch(self):
+        rows = [self.queue(to=f'player{i}@example.com') for i in range(3)]
+        self.queue(to='other@example.com', subject='Something else')
+        self.queue(to='team@example.com', cc=['coach@example.com'])
+
+        self.assertEqual(deliver_outbox(), {'sent': 5, 'failed': 0})
+        self.assertEqual(sorted(self.paths()), ['v1.1/email', 'v1.1/email', 'v1.1/email/batch'])
+        batch = next(r['payload'] for r in FakeZeptoMailBackend.requests if r['path'] == 'v1.1/email/batch')
+        self.assertEqual(
+            sorted(recipient['email_address']['address'] for recipient in batch['to']),
+            sorted(row.to[0] for row in rows),
+        )
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    def test_failures_back_off(self):
+        row = self.queue()
+        FakeZeptoMailBackend.fail_next = 1
+        before = timezone.now()
+        self.assertEqual(deliver_outbox(), {'sent': 0, 'failed': 1})
+
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertIn('500', row.last_error)
+        delay = (row.next_attempt_at - before).total_seconds()
+        self.assertTrue(OUTBOX_BACKOFF_SECONDS * 0.5 - 1 <= delay <= OUTBOX_BACKOFF_SECONDS + 1, delay)
+        # Not due yet, so nothing is retried
+        self.assertEqual(deliver_outbox(), {'sent': 0, 'failed': 0})
+
+    def test_row_is_dead_after_max_attempts(self):
+        row = self.queue()
+        FakeZeptoMailBackend.fail_next = OUTBOX_MAX_ATTEMPTS
+        for attempt in range(1, OUTBOX_MAX_ATTEMPTS + 1):
+            self.assertEqual(deliver_outbox()['failed'], 1)
+            row.refresh_from_db()
+            self.assertEqual(row.attempts, attempt)
+            EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, 'dead')
+        self.assertEqual(deliver_outbox(), {'sent': 0, 'failed': 0})
+        self.assertEqual(FakeZeptoMailBackend.requests, [])
+
+    def test_purge_keeps_recent_and_undelivered_rows(self):
+        old, recent, pending = self.queue(), self.queue(), self.queue()
+        EmailOutbox.objects.filter(pk=old.pk).update(status='sent', sent_at=timezone.now() - timedelta(days=8))
+        EmailOutbox.objects.filter(pk=recent.pk).update(status='sent', sent_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(purge_sent(), 1)
+        self.assertEqual(
+            set(EmailOutbox.objects.values_list('pk', flat=True)), {recent.pk, pending.pk}
+        )
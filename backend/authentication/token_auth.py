@@ -0,0 +1,171 @@
+"""
+Token authentication with a per-process cache.
+
+DRF's TokenAuthentication runs a token+user query on every request, and the profile
+(avatar, premium) is then fetched lazily by whatever needs it. This resolves token,
+user and profile in one query and keeps the result in a bounded TTL cache.
+
+The cache is per worker, so a hit is never trusted on its own: every request still
+runs one narrow indexed query (token -> user.is_active, profile.date_updated). A
+deleted token or deactivated user is refused immediately in every worker, and a
+changed profile (premium, avatar) is reloaded. The per-user auth version kept in the
+default cache additionally drops entries after user edits (logout, password/email
+changes); with a per-process cache backend those only reach the worker that made
+them, so other workers may serve the old user fields for up to AUTH_TOKEN_CACHE_TTL.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .entitlements import Entitlements
+from .models import UserProfile
+
+
+def user_version_key(user_id):
+    return f'v1:auth:user:{user_id}:version'
+
+
+def _fresh_version():
+    # Time-based, so a version evicted from the cache is never handed out again
+    return time.time_ns()
+
+
+def user_version(user_id):
+    key = user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    """Drop cached authentication state for a user in every worker."""
+    _local_cache.discard_user(user_id)
+    try:
+        cache.incr(user_version_key(user_id))
+    except ValueError:
+        cache.set(user_version_key(user_id), _fresh_version(), timeout=None)
+
+
+def invalidate_users(user_ids):
+    """Bulk invalidate: dropping the version keys forces fresh ones, so every cached entry misses."""
+    for user_id in user_ids:
+        _local_cache.discard_user(user_id)
+    cache.delete_many([user_version_key(user_id) for user_id in user_ids])
+
+
+def invalidate_user_on_commit(user_id):
+    # Also right away, so this request doesn't keep serving the old state until commit
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (_expires, value) in self._data.items() if value[0].pk == user_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = TTLCache(
+    maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication (same header, same errors)."""
+
+    def authenticate_credentials(self, key):
+        cached = _local_cache.get(key)
+        if cached is not None:
+            user, version, profile_updated = cached
+            current = Token.objects.filter(key=key).values_list(
+                'user__is_active', 'user__userprofile__date_updated'
+            ).first()
+            if current == (True, profile_updated) and user_version(user.pk) == version:
+                # A private copy: views may modify request.user
+                return copy.deepcopy(user), key
+            _local_cache.discard(key)
+
+        token = Token.objects.select_related('user__userprofile').filter(key=key).first()
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        user = token.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        try:
+            profile = user.userprofile
+        except UserProfile.DoesNotExist:
+            profile = None
+        user._entitlements = Entitlements.from_profile(profile)
+
+        version = user_version(user.pk)
+        profile_updated = profile.date_updated if profile is not None else None
+        _local_cache.set(key, (copy.deepcopy(user), version, profile_updated))
+        return user, key
+
+
+@receiver(post_save, sender=User, dispatch_uid='token_auth_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='token_auth_user_deleted')
+def user_changed(sender, instance, **kwargs):
+    invalidate_user_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile, dispatch_uid='token_auth_profile_saved')
+def profile_changed(sender, instance, **kwargs):
+    invalidate_user_on_commit(instance.user_id)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid='token_auth_token_deleted')
+def token_deleted(sender, instance, **kwargs):
+    _local_cache.discard(instance.key)
+    invalidate_user_on_commit(instance.user_id)
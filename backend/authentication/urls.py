@@ -8,11 +8,13 @@ urlpatterns = [
     path('register/', views.register_user, name='api_register'),
     path('google-oauth/', views.google_oauth, name='google_oauth'),
     path('change-password/', views.change_password, name='change_password'),
+    path('logout/', views.logout_user, name='logout'),
     
     # User profile endpoints
     path('profile/', views.user_profile, name='user_profile'),
     path('profile/update/', views.update_profile, name='update_profile'),
     path('profile/avatar/', views.update_avatar, name='update_avatar'),
+    path('export/<str:dataset>.<str:fmt>', views.export_user_data, name='export_user_data'),
     path("password-reset/", views.PasswordResetRequestAPI.as_view(), name="password_reset_api"),
     path("password-reset-confirm/", views.PasswordResetConfirmAPI.as_view(), name="password_reset_confirm_api"),
     
@@ -0,0 +1,62 @@
+"""
+Unique username allocation for signups without a chosen username.
+
+The next free `<base><n>` is found in one query: a prefix range scan over the
+username index that returns the highest numeric suffix in use. Creation then just
+tries the INSERT and, if a concurrent signup took the name first, allocates again
+on the IntegrityError instead of checking before inserting.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Count, Max, Q, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Substr
+
+USERNAME_ATTEMPTS = 5
+MAX_SUFFIX_DIGITS = 9  # Keeps the suffix cast inside BIGINT
+FALLBACK_USERNAME = 'player'
+
+_INVALID_CHARS = re.compile(r'[^\w.@+-]')
+
+
+def username_base(email):
+    """Username stem from an email's local part, valid for Django's username validator."""
+    max_length = User._meta.get_field('username').max_length - MAX_SUFFIX_DIGITS
+    base = _INVALID_CHARS.sub('', (email or '').split('@')[0])[:max_length]
+    return base or FALLBACK_USERNAME
+
+
+def next_free_username(base):
+    """`base` if it is free, else `base` + (highest numeric suffix in use + 1)."""
+    taken = User.objects.filter(
+        username__startswith=base,
+        username__regex=rf'^{re.escape(base)}[0-9]{{0,{MAX_SUFFIX_DIGITS}}}$',
+    ).aggregate(
+        base_taken=Count('pk', filter=Q(username=base)),
+        max_suffix=Max(Cast(
+            Coalesce(NullIf(Substr('username', len(base) + 1), Value('')), Value('0')),
+            BigIntegerField(),
+        )),
+    )
+    if not taken['base_taken']:
+        return base
+    return f"{base}{(taken['max_suffix'] or 0) + 1}"
+
+
+def create_user_with_unique_username(base, attempts=USERNAME_ATTEMPTS, **fields):
+    """
+    Create a user named after `base`, retrying the allocation when a concurrent
+    signup wins the race for the same name.
+
+    Raises:
+        IntegrityError: If every attempt collided
+    """
+    for attempt in range(attempts):
+        username = next_free_username(base)
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(username=username, **fields)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
@@ -19,8 +19,10 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.core.cache import cache
 from django.contrib.auth.password_validation import validate_password
+from .backends import email_matches, users_by_email
 from .models import UserProfile
 from .serializers import UserSerializer
+from .usernames import create_user_with_unique_username, username_base
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +39,12 @@ class RegisterRateThrottle(AnonRateThrottle):
     rate = '3/min'
 
 
+# Custom throttle for data exports (each one streams a user's full history)
+class ExportRateThrottle(UserRateThrottle):
+    """Rate limit for data exports: 10 per hour"""
+    rate = '10/hour'
+
+
 class CustomAuthToken(ObtainAuthToken):
     """Custom authentication view that accepts email and password"""
     throttle_classes = [LoginRateThrottle]
@@ -54,17 +62,8 @@ class CustomAuthToken(ObtainAuthToken):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find user by email
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            return Response(
-                {'error': 'Invalid email or password'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        
-        # Authenticate user
-        user = authenticate(username=user.username, password=password)
+        # Authenticate user (one indexed lookup, see authentication/backends.py)
+        user = authenticate(request, email=email, password=password)
         if not user:
             return Response(
                 {'error': 'Invalid email or password'}, 
@@ -101,7 +100,7 @@ def register_user(request):
         )
     
     # Check if email already exists
-    if User.objects.filter(email=email).exists():
+    if User.objects.filter(email_matches(email)).exists():
         return Response(
             {'error': 'Email already exists'}, 
             status=status.HTTP_400_BAD_REQUEST
@@ -115,25 +114,20 @@ def register_user(request):
                 {'error': 'Username already exists'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-    else:
-        # Auto-generate unique username from email
-        username = email.split('@')[0]
-        counter = 1
-        original_username = username
-        
-        while User.objects.filter(username=username).exists():
-            username = f"{original_username}{counter}"
-            counter += 1
     
     try:
         with transaction.atomic():
-            user = User.objects.create_user(
-                username=username,
-                password=password,
-                email=email,
-                first_name=first_name,
-                last_name=last_name
-            )
+            user_fields = {
+                'password': password,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+            }
+            if username:
+                user = User.objects.create_user(username=username, **user_fields)
+            else:
+                # Auto-generate unique username from email
+                user = create_user_with_unique_username(username_base(email), **user_fields)
             
             # Create token
             token, created = Token.objects.get_or_create(user=user)
@@ -155,8 +149,8 @@ def register_user(request):
 @permission_classes([permissions.IsAuthenticated])
 def user_profile(request):
     """Get current user profile"""
-    # Re-fetch user with related profile in a single query
-    user = User.objects.select_related('userprofile').get(pk=request.user.pk)
+    # Token authentication already loaded the profile with the user
+    user = request.user
     logger.info(f"Profile fetched for the user")
     return Response({
         
@@ -182,7 +176,7 @@ def update_profile(request):
         user.username = data['username']
     
     if 'email' in data:
-        if User.objects.filter(email=data['email']).exclude(id=user.id).exists():
+        if User.objects.filter(email_matches(data['email'])).exclude(id=user.id).exists():
             return Response(
                 {'error': 'Email already exists'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -293,6 +287,65 @@ def change_password(request):
         'message': 'Password changed successfully'
     })
 
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def logout_user(request):
+    """Revoke the current API token (cached authentication is dropped with it)"""
+    Token.objects.filter(user=request.user).delete()
+    logger.info(f"User {request.user.id} logged out")
+    return Response({'message': 'Logged out successfully'})
+
+
+def user_export_datasets(user):
+    """Datasets a user can export about themselves: {name: (queryset, fields)}"""
+    from gameplay.models import Game, PlayedQuestion
+    from payments.models import Payment, Subscription
+
+    return {
+        'games': (
+            Game.objects.filter(player=user).order_by('date_played', 'pk'),
+            ['id', 'mode', 'date_played', 'teams'],
+        ),
+        'played_questions': (
+            PlayedQuestion.objects.filter(game__player=user).order_by('game_id', 'pk'),
+            ['game_id', 'game__date_played', 'question_id', 'question__category__name',
+             'question__text', 'question__answer', 'question__difficulty'],
+        ),
+        'payments': (
+            Payment.objects.filter(user=user).order_by('created_at', 'pk'),
+            ['order_id', 'amount', 'currency', 'status', 'product_name', 'created_at', 'paid_at'],
+        ),
+        'subscriptions': (
+            Subscription.objects.filter(user=user).order_by('created_at', 'pk'),
+            ['subscription_id', 'product_name', 'status', 'trial_ends_at', 'renews_at', 'ends_at', 'created_at'],
+        ),
+    }
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([ExportRateThrottle])
+def export_user_data(request, dataset, fmt):
+    """Stream one of the user's datasets as NDJSON or CSV (constant memory, any size)"""
+    from utils.streaming_export import EXPORT_FORMATS, export_queryset_response
+
+    datasets = user_export_datasets(request.user)
+    if dataset not in datasets:
+        return Response(
+            {'error': f'Unknown dataset. Available: {", ".join(datasets)}'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if fmt not in EXPORT_FORMATS:
+        return Response(
+            {'error': f'Unsupported format. Use one of: {", ".join(EXPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    queryset, fields = datasets[dataset]
+    logger.info(f"Data export of {dataset} ({fmt}) for user {request.user.id}")
+    return export_queryset_response(queryset, fields, fmt, filename=dataset)
+
 User = get_user_model()
 def too_many_requests(email):
     key = f"reset_rate_{email}"
@@ -313,9 +366,8 @@ class PasswordResetRequestAPI(APIView):
         if too_many_requests(email):
             return Response({"detail": "Please wait before requesting again."}, status=429)
 
-        try:
-            user = User.objects.get(email__iexact=email)
-        except User.DoesNotExist:
+        user = users_by_email(email).first()
+        if user is None:
             return Response({"detail": "If an account exists, we'll send an email."}, status=200)
 
         uid = urlsafe_base64_encode(force_bytes(user.pk))
@@ -344,21 +396,19 @@ class PasswordResetRequestAPI(APIView):
         </html>
         """
 
-        try:
-            from django.core.mail import EmailMultiAlternatives
-            msg = EmailMultiAlternatives(
-                subject="Reset your password",
-                body=f"Click the link to reset your password:\n{reset_link}\n\nIf you didn't request this, ignore it.",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[email]
-            )
-            msg.attach_alternative(html_message, "text/html")
-            msg.send(fail_silently=False)
-            logger.info(f"Password reset email sent successfully to {email}")
-        except Exception as e:
-            # Log the error but don't reveal it to user (security best practice)
-            logger.error(f"Failed to send password reset email to {email}: {str(e)}", exc_info=True)
-            # Still return success message to prevent email enumeration
+        from django.core.mail import EmailMultiAlternatives
+        from .outbox import queue_email
+        msg = EmailMultiAlternatives(
+            subject="Reset your password",
+            body=f"Click the link to reset your password:\n{reset_link}\n\nIf you didn't request this, ignore it.",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email]
+        )
+        msg.attach_alternative(html_message, "text/html")
+        # Delivered by the outbox worker with retries, so the response doesn't wait on ZeptoMail
+        with transaction.atomic():
+            queue_email(msg)
+        logger.info(f"Password reset email queued for {email}")
 
         return Response({"detail": "If an account exists, we'll send an email."}, status=200)
 
@@ -410,31 +460,17 @@ def google_oauth(request):
         )
     
     try:
-        from google.auth.transport import requests as google_requests
-        from google.oauth2 import id_token
-        import requests as req
+        from .google import fetch_userinfo, verify_id_token
 
-        idinfo = None
         payload_source = "id_token"
 
-        # First try to treat the incoming token as an ID token (JWT)
+        # First try to treat the incoming token as an ID token (JWT), verified with cached certs
         try:
-            idinfo = id_token.verify_oauth2_token(
-                token,
-                google_requests.Request(),
-                settings.GOOGLE_OAUTH_CLIENT_ID
-            )
+            idinfo = verify_id_token(token)
         except ValueError:
             # If it is not a JWT, treat it as an access token and fetch the userinfo
             payload_source = "access_token"
-            userinfo_resp = req.get(
-                "https://www.googleapis.com/oauth2/v3/userinfo",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=10,
-            )
-            if userinfo_resp.status_code != 200:
-                raise ValueError("Invalid Google token")
-            idinfo = userinfo_resp.json()
+            idinfo = fetch_userinfo(token)
 
         # Extract user info from token/userinfo
         email = idinfo.get('email')
@@ -450,32 +486,24 @@ def google_oauth(request):
             )
         
         # Check if user exists
-        user, created = User.objects.get_or_create(
-            email=email,
-            defaults={
-                'username': email.split('@')[0],
-                'first_name': name.split()[0] if name else '',
-                'last_name': ' '.join(name.split()[1:]) if len(name.split()) > 1 else '',
-            }
-        )
+        user = users_by_email(email).select_related('userprofile').first()
+        created = user is None
+        if created:
+            user = create_user_with_unique_username(
+                username_base(email),
+                email=email,
+                first_name=name.split()[0] if name else '',
+                last_name=' '.join(name.split()[1:]) if len(name.split()) > 1 else '',
+            )
         
         # Create or get token
         auth_token, _ = Token.objects.get_or_create(user=user)
         
-        # Update profile picture if new user and picture provided
+        # Ingest the Google profile picture in the background for new users
         if created and picture:
-            try:
-                import requests as req
-                from django.core.files.base import ContentFile
-                
-                response = req.get(picture)
-                if response.status_code == 200:
-                    profile, _ = UserProfile.objects.get_or_create(user=user)
-                    # Store picture URL directly (assuming CDN storage)
-                    profile.avatar = picture
-                    profile.save()
-            except Exception as e:
-                logger.warning(f"Failed to update Google profile picture: {e}")
+            from .tasks import ingest_google_avatar
+            user_id = user.id
+            transaction.on_commit(lambda: ingest_google_avatar.delay(user_id, picture))
         
         logger.info(f"Google OAuth {'signup' if created else 'login'} via {payload_source} for {email}")
         
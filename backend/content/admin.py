@@ -1,26 +1,60 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.urls import path
 from django.shortcuts import redirect
 from django.contrib import messages
-from .models import Collection, Category, Question, SavedCategory, CategoryLike
+from .models import Collection, Category, Question, SavedCategory, CategoryLike, MediaUpload, UploadSession, StorageDeletion, DeletionJob
 from .utils import shuffle_category_questions
+from .sprites import queue_sprite_rebuild
+from .search import matching_ids
+from .suggest import touch_fields
+
+ADMIN_SEARCH_LIMIT = 5000  # Best full-text matches offered to the changelist
+
+
+class FullTextSearchMixin:
+    """
+    Changelist search through the full-text index instead of LIKE '%...%' scans.
+    A numeric term also matches the primary key; `exact_search_fields` are matched case-insensitively.
+    """
+    search_kind = None
+    exact_search_fields = []
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(pk__in=matching_ids(search_term, self.search_kind, limit=ADMIN_SEARCH_LIMIT))
+        if search_term.isdigit():
+            condition |= Q(pk=int(search_term))
+        for field in self.exact_search_fields:
+            condition |= Q(**{f'{field}__iexact': search_term})
+        return queryset.filter(condition), False
 
 
 @admin.register(Collection)
 class CollectionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'order']
+    list_display = ['id', 'name', 'order', 'sprite']
     ordering = ['order', 'name']
+    actions = ['rebuild_sprites']
+
+    def rebuild_sprites(self, request, queryset):
+        """Force-rebuild the category sprite atlas for selected collections"""
+        queued = queue_sprite_rebuild(queryset.values_list('id', flat=True), force=True)
+        self.message_user(request, f'🧩 Queued sprite rebuild for {queued} collection(s).')
+    rebuild_sprites.short_description = "Rebuild sprite atlas"
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'name', 'is_hidden', 'locked', 'is_custom', 'is_approved', 'created_by', 'privacy', 'collection', 'likes_count', 'created_at']
     list_filter = ['is_hidden', 'locked', 'is_custom', 'is_approved', 'privacy', 'collection']
-    search_fields = ['id', 'name', 'description', 'created_by__username']
+    search_fields = ['id', 'name', 'description', 'created_by__username']  # Served by the full-text index
+    search_kind = 'category'
+    exact_search_fields = ['created_by__username']
     fields = ['name', 'description', 'image', 'collection', 'locked', 'is_hidden', 'is_custom', 'is_approved', 'privacy', 'created_by', 'created_at', 'updated_at']
     readonly_fields = ['created_at', 'updated_at']
-    actions = ['approve_categories', 'reject_categories', 'hide_categories', 'unhide_categories']
+    actions = ['approve_categories', 'reject_categories', 'hide_categories', 'unhide_categories', 'delete_in_background']
     inlines = []
 
     def save_model(self, request, obj, form, change):
@@ -78,31 +112,40 @@ class CategoryAdmin(admin.ModelAdmin):
     
     def approve_categories(self, request, queryset):
         """Bulk approve selected categories"""
-        updated = queryset.update(is_approved=True)
+        updated = queryset.update(is_approved=True, **touch_fields())
         self.message_user(request, f'{updated} categories have been approved.')
     approve_categories.short_description = "Approve selected categories"
     
     def reject_categories(self, request, queryset):
         """Bulk reject selected categories"""
-        updated = queryset.update(is_approved=False)
+        updated = queryset.update(is_approved=False, **touch_fields())
         self.message_user(request, f'{updated} categories have been rejected.')
     reject_categories.short_description = "Reject selected categories"
     
     def hide_categories(self, request, queryset):
         """Hide selected categories from users"""
-        updated = queryset.update(is_hidden=True)
+        updated = queryset.update(is_hidden=True, **touch_fields())
+        queue_sprite_rebuild(queryset.exclude(collection__isnull=True).values_list('collection_id', flat=True))
         self.message_user(request, f'🙈 Hidden {updated} categories from users.')
     hide_categories.short_description = "Hide selected categories"
     
     def unhide_categories(self, request, queryset):
         """Unhide selected categories"""
-        updated = queryset.update(is_hidden=False)
+        updated = queryset.update(is_hidden=False, **touch_fields())
+        queue_sprite_rebuild(queryset.exclude(collection__isnull=True).values_list('collection_id', flat=True))
         self.message_user(request, f'👁️ Unhidden {updated} categories (now visible to users).')
     unhide_categories.short_description = "Unhide selected categories"
 
+    def delete_in_background(self, request, queryset):
+        """Hide selected categories now and delete them (with all questions) in chunks"""
+        from .deletion import queue_deletion
+        jobs = [queue_deletion(category, requested_by=request.user) for category in queryset]
+        self.message_user(request, f'🗑️ Queued background deletion for {len(jobs)} categories. Track progress under Deletion jobs.')
+    delete_in_background.short_description = "Delete in background (large categories)"
+
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'text','answer', 'category', 'difficulty', 'points', 'has_image', 'has_answer_image']
     # Use field-based empty filters to emulate "has_image"/"has_answer_image" booleans
     # This avoids admin.E116 since these refer to real model fields
@@ -112,7 +155,8 @@ class QuestionAdmin(admin.ModelAdmin):
         ('image', admin.EmptyFieldListFilter),
         ('answer_image', admin.EmptyFieldListFilter),
     ]
-    search_fields = ['id', 'text', 'answer']
+    search_fields = ['id', 'text', 'text_ar', 'answer', 'answer_ar']  # Served by the full-text index
+    search_kind = 'question'
     readonly_fields = ['points']
     actions = ['duplicate_to_categories']
 
@@ -133,7 +177,7 @@ class QuestionAdmin(admin.ModelAdmin):
         
         for question in queryset:
             # Create duplicate with same category and images
-            Question.objects.create(
+            duplicate = Question(
                 category=question.category,  # Same category - you'll change it manually
                 text=question.text,
                 text_ar=question.text_ar,
@@ -148,6 +192,10 @@ class QuestionAdmin(admin.ModelAdmin):
                 image_hash=question.image_hash,
                 answer_image_hash=question.answer_image_hash,
             )
+            # Derived image data (variants, dimensions, placeholders) travels with the shared paths
+            duplicate.copy_image_fields_from(question, 'image')
+            duplicate.copy_image_fields_from(question, 'answer_image')
+            duplicate.save()
             duplicated_count += 1
         
         messages.success(request, f'✅ Successfully duplicated {duplicated_count} question(s)! Now you can edit them to change the category.')
@@ -169,6 +217,34 @@ class CategoryLikeAdmin(admin.ModelAdmin):
     search_fields = ['id', 'user__username', 'category__name']
     readonly_fields = ['created_at']
 
+@admin.register(MediaUpload)
+class MediaUploadAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'purpose', 'target_id', 'status', 'size', 'created_at']
+    list_filter = ['status', 'purpose', 'created_at']
+    search_fields = ['id', 'user__username', 'key', 'result']
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'filename', 'received', 'size', 'status', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'user__username', 'filename', 'key']
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(StorageDeletion)
+class StorageDeletionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'key', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['attempts']
+    search_fields = ['key', 'source']
+    readonly_fields = ['created_at']
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'target_type', 'target_id', 'target_label', 'status', 'progress', 'created_at', 'finished_at']
+    list_filter = ['status', 'target_type']
+    search_fields = ['target_label', 'target_id']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
 class CategoryLikeInline(admin.TabularInline):
     model = CategoryLike
     extra = 0
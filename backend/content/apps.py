@@ -6,5 +6,8 @@ class ContentConfig(AppConfig):
     name = 'content'
 
     def ready(self):
-        import helpers.cloudflare.post_delete
+        from helpers.cloudflare.post_delete import connect_file_cleanup
+        connect_file_cleanup()
+        import content.sprites  # Rebuilds collection sprites when a category is deleted
+        import content.search  # Keeps the full-text search index in sync on save
         # Signals removed - optimization now happens in model.save()
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+Chunked background deletion of users and categories.
+
+Deleting a user or a popular category in one go cascades through games, played
+questions, likes, saves, payments and questions in a single transaction, with one
+post_delete signal per row. Instead, the target is soft-hidden right away and a job
+removes dependents leaf-first in bounded chunks, each its own short transaction,
+using raw set-based deletes. Files of deleted rows are journaled set-based for the
+batched storage flush. Every step is idempotent, so a failed job can be re-run.
+"""
+import logging
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from helpers.cloudflare.post_delete import journal_files
+from .models import Category, Question, SavedCategory, CategoryLike, MediaUpload, UploadSession, DeletionJob, SearchEntry
+from .suggest import touch_fields
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 500
+
+
+def queue_deletion(target, requested_by=None):
+    """
+    Soft-hide a user or category and queue its chunked deletion.
+
+    Returns:
+        DeletionJob: The existing active job for the target, or a new one
+    """
+    target_type = 'user' if isinstance(target, User) else 'category'
+    existing = DeletionJob.objects.filter(
+        target_type=target_type, target_id=target.pk, status__in=['queued', 'running']
+    ).first()
+    if existing:
+        return existing
+
+    with transaction.atomic():
+        soft_hide(target_type, target.pk)
+        job = DeletionJob.objects.create(
+            target_type=target_type,
+            target_id=target.pk,
+            target_label=str(target)[:255],
+            requested_by=requested_by,
+        )
+        from .tasks import run_deletion_job
+        transaction.on_commit(lambda: run_deletion_job.delay(job.pk))
+    logger.info(f"🗑️ Queued deletion job {job.pk} for {target_type} {target.pk}")
+    return job
+
+
+def soft_hide(target_type, target_id):
+    """Make the target invisible immediately, before any rows are removed."""
+    if target_type == 'user':
+        from rest_framework.authtoken.models import Token
+        User.objects.filter(pk=target_id).update(is_active=False)
+        Token.objects.filter(user_id=target_id).delete()
+        Category.objects.filter(created_by_id=target_id).update(is_hidden=True, is_approved=False, **touch_fields())
+    else:
+        Category.objects.filter(pk=target_id).update(is_hidden=True, is_approved=False, **touch_fields())
+
+
+def delete_in_chunks(job, label, queryset, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    Delete every row of `queryset` in primary-key chunks with raw DELETEs
+    (no per-row collector or signals) and record progress on the job.
+    """
+    model = queryset.model
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            chunk = model._base_manager.filter(pk__in=ids)
+            journal_files(chunk)
+            deleted = chunk._raw_delete(chunk.db)
+        total += deleted
+        job.progress[label] = job.progress.get(label, 0) + deleted
+        DeletionJob.objects.filter(pk=job.pk).update(progress=job.progress)
+    return total
+
+
+def delete_category_dependents(job, category_id, chunk_size=DELETE_CHUNK_SIZE):
+    """Remove everything that references a category, leaf tables first."""
+    from gameplay.models import Game, PlayedQuestion
+
+    questions = Question.objects.filter(category_id=category_id)
+    delete_in_chunks(job, 'played_questions', PlayedQuestion.objects.filter(question__category_id=category_id), chunk_size)
+    delete_in_chunks(job, 'game_categories', Game.categories.through.objects.filter(category_id=category_id), chunk_size)
+    delete_in_chunks(job, 'saved_categories', SavedCategory.objects.filter(category_id=category_id), chunk_size)
+    delete_in_chunks(job, 'category_likes', CategoryLike.objects.filter(category_id=category_id), chunk_size)
+    delete_in_chunks(job, 'search_entries', SearchEntry.objects.filter(category_id=category_id, kind='question'), chunk_size)
+    delete_in_chunks(job, 'questions', questions, chunk_size)
+
+
+def delete_category(job, category_id, chunk_size=DELETE_CHUNK_SIZE):
+    delete_category_dependents(job, category_id, chunk_size)
+    # Only the row itself is left; a normal delete keeps its signals (image cleanup, sprite rebuild)
+    category = Category.objects.filter(pk=category_id).first()
+    if category is not None:
+        category.delete()
+        job.progress['categories'] = job.progress.get('categories', 0) + 1
+
+
+def delete_user(job, user_id, chunk_size=DELETE_CHUNK_SIZE):
+    from gameplay.models import Game, PlayedQuestion
+    from payments.models import Payment, Subscription, WebhookEvent, WebhookPayload
+
+    games = Game.objects.filter(player_id=user_id)
+    delete_in_chunks(job, 'played_questions', PlayedQuestion.objects.filter(game__player_id=user_id), chunk_size)
+    delete_in_chunks(job, 'game_categories', Game.categories.through.objects.filter(game__player_id=user_id), chunk_size)
+    delete_in_chunks(job, 'games', games, chunk_size)
+    delete_in_chunks(job, 'saved_categories', SavedCategory.objects.filter(user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'category_likes', CategoryLike.objects.filter(user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'webhook_events', WebhookEvent.objects.filter(raw__payment__user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'webhook_payloads', WebhookPayload.objects.filter(payment__user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'payments', Payment.objects.filter(user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'subscriptions', Subscription.objects.filter(user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'media_uploads', MediaUpload.objects.filter(user_id=user_id), chunk_size)
+    delete_in_chunks(job, 'upload_sessions', UploadSession.objects.filter(user_id=user_id), chunk_size)
+
+    for category_id in Category.objects.filter(created_by_id=user_id).values_list('pk', flat=True):
+        delete_category(job, category_id, chunk_size)
+
+    # What's left (profile, admin log entries, group links) is small; a normal delete handles it
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        user.delete()
+        job.progress['users'] = 1
+
+
+def run_deletion_job(job, chunk_size=DELETE_CHUNK_SIZE):
+    """Execute (or resume) a deletion job, recording progress and the outcome."""
+    job.status, job.error = 'running', ''
+    job.started_at = job.started_at or timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(status='running', error='', started_at=job.started_at)
+    logger.info(f"🗑️ Running deletion job {job.pk}: {job.target_type} {job.target_id}")
+
+    try:
+        if job.target_type == 'user':
+            delete_user(job, job.target_id, chunk_size)
+        else:
+            delete_category(job, job.target_id, chunk_size)
+    except Exception as e:
+        job.status, job.error = 'failed', str(e)
+        DeletionJob.objects.filter(pk=job.pk).update(status='failed', error=str(e)[:2000], progress=job.progress)
+        logger.error(f"❌ Deletion job {job.pk} failed: {e}", exc_info=True)
+        raise
+
+    job.status, job.finished_at = 'done', timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(status='done', finished_at=job.finished_at, progress=job.progress)
+    logger.info(f"✅ Deletion job {job.pk} done: {job.progress}")
+    return job
@@ -3,8 +3,10 @@ Image optimization utilities using pyvips for high performance and low memory us
 Optimizes images for Cloudflare R2 storage with minimal footprint.
 """
 import io
+import math
 import pyvips
 from typing import Optional, Tuple
+from django.conf import settings
 from django.core.files.base import ContentFile
 import logging
 
@@ -86,10 +88,21 @@ class ImageOptimizer:
         'large': 1280,  # Desktop (most questions don't need larger)
     }
     
+    # Avatars are rendered at 40-128px, so they get their own breakpoints
+    AVATAR_SIZES = {
+        'small': 96,
+        'medium': 256,
+        'large': 512,
+    }
+    
     # WebP quality settings (70-80 is sweet spot for size vs quality)
     WEBP_QUALITY = 70
     WEBP_EFFORT = 6  # Compression effort (0-6, higher = smaller but slower)
     
+    # AVIF (AV1 in HEIF) settings - roughly 20-30% smaller than WebP at the same quality
+    AVIF_QUALITY = 50
+    AVIF_EFFORT = 4  # Encoder speed/size trade-off (0-9); AV1 encoding is much slower than WebP
+    
     # Strip all metadata to save space
     STRIP_METADATA = True
     
@@ -161,6 +174,14 @@ class ImageOptimizer:
                     strip=strip_metadata,
                     interlace=True,  # Progressive JPEG
                 )
+            elif format.lower() == 'avif':
+                logger.debug(f'Encoding to AVIF (quality={quality}, effort={ImageOptimizer.AVIF_EFFORT})')
+                output = image.heifsave_buffer(
+                    Q=quality,
+                    compression='av1',
+                    effort=ImageOptimizer.AVIF_EFFORT,
+                    strip=strip_metadata,
+                )
             elif format.lower() == 'png':
                 output = image.pngsave_buffer(
                     compression=9,
@@ -181,35 +202,43 @@ class ImageOptimizer:
             raise Exception(f"Failed to optimize image: {str(e)}")
     
     @staticmethod
-    def create_responsive_variants(image_bytes: bytes) -> dict:
+    def create_responsive_variants(image_bytes: bytes, sizes: Optional[dict] = None, formats: Tuple[str, ...] = ('webp',)) -> dict:
         """
         Create multiple optimized variants for responsive delivery.
-        Returns dict with size names as keys and optimized bytes as values.
+        Returns dict with size names as keys; each value maps format -> encoded bytes
+        plus the actual output 'width'.
         
-        This is the most storage-efficient approach: create exactly the sizes
-        you need and delete the original.
+        Only sizes narrower than the source are produced (we never upscale), so a
+        480px-wide source yields no variants at all.
         
         Returns:
             {
-                'small': bytes,   # 480px width WebP
-                'medium': bytes,  # 768px width WebP
-                'large': bytes,   # 1280px width WebP
+                'small': {'width': 480, 'webp': bytes, 'avif': bytes},
+                'medium': {'width': 768, 'webp': bytes},
+                ...
             }
         """
+        sizes = sizes or ImageOptimizer.SIZES
+        source_width = pyvips.Image.new_from_buffer(image_bytes, '').width
         variants = {}
         
-        for size_name, width in ImageOptimizer.SIZES.items():
-            try:
-                optimized = ImageOptimizer.optimize_image(
-                    image_bytes,
-                    max_width=width,
-                    quality=ImageOptimizer.WEBP_QUALITY,
-                    format='webp',
-                    strip_metadata=ImageOptimizer.STRIP_METADATA
-                )
-                variants[size_name] = optimized
-            except Exception as e:
-                print(f"Warning: Failed to create {size_name} variant: {e}")
+        for size_name, width in sizes.items():
+            if width >= source_width:
+                continue
+            outputs = {'width': width}
+            for fmt in formats:
+                try:
+                    outputs[fmt] = ImageOptimizer.optimize_image(
+                        image_bytes,
+                        max_width=width,
+                        quality=ImageOptimizer.AVIF_QUALITY if fmt == 'avif' else ImageOptimizer.WEBP_QUALITY,
+                        format=fmt,
+                        strip_metadata=ImageOptimizer.STRIP_METADATA
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to create {size_name} {fmt} variant: {e}")
+            if len(outputs) > 1:
+                variants[size_name] = outputs
         
         return variants
     
@@ -248,3 +277,279 @@ def optimize_for_cloudflare(image_bytes: bytes) -> bytes:
         format='webp',
         strip_metadata=True
     )
+
+
+_BLURHASH_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return ''.join(
+        _BLURHASH_CHARS[(value // (83 ** (length - i - 1))) % 83]
+        for i in range(length)
+    )
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(image: 'pyvips.Image', x_components: int = 4, y_components: int = 3) -> str:
+    """
+    Encode a (small) pyvips image as a BlurHash string (https://blurha.sh).
+    4x3 components give a ~28 character placeholder clients can render instantly.
+    Callers should pass a thumbnail (~32px); cost is O(pixels * components).
+    """
+    if image.hasalpha():
+        image = image.flatten(background=[255, 255, 255])
+    image = image.colourspace('srgb').cast('uchar')
+    if image.bands > 3:
+        image = image.extract_band(0, n=3)
+    width, height = image.width, image.height
+    linear = [_srgb_to_linear(v) for v in range(256)]
+    pixels = [linear[v] for v in bytes(image.write_to_memory())]
+    
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                row = y * width * 3
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * basis_y
+                    offset = row + x * 3
+                    r += basis * pixels[offset]
+                    g += basis * pixels[offset + 1]
+                    b += basis * pixels[offset + 2]
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+    
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    
+    if ac:
+        actual_max = max(abs(channel) for factor in ac for channel in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    
+    result += _base83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    
+    def quantise(v):
+        return max(0, min(18, int(math.floor(math.copysign(abs(v / max_value) ** 0.5, v) * 9 + 9.5))))
+    
+    for r, g, b in ac:
+        result += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    
+    return result
+
+
+def image_metadata(image_bytes: bytes) -> dict:
+    """
+    Width/height plus a BlurHash placeholder for an (already optimized) image.
+    Uses shrink-on-load for the placeholder, so it's cheap even for large images.
+    
+    Returns:
+        {'width': 1280, 'height': 768, 'placeholder': 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'}
+    """
+    header = pyvips.Image.new_from_buffer(image_bytes, '')
+    thumbnail = pyvips.Image.thumbnail_buffer(image_bytes, 32, height=32)
+    return {
+        'width': header.width,
+        'height': header.height,
+        'placeholder': blurhash_encode(thumbnail),
+    }
+
+
+def pending_image_bytes(field_file) -> Optional[bytes]:
+    """
+    Return the bytes of a FieldFile that has not been uploaded to storage yet
+    (e.g. a freshly optimized ContentFile), or None once it lives in storage.
+    Reading a committed file would cost a download, so we never do that here.
+    """
+    if not field_file or getattr(field_file, '_committed', True):
+        return None
+    f = field_file.file
+    f.seek(0)
+    data = f.read()
+    f.seek(0)
+    return data
+
+
+def upload_pending_files(instances, field_names):
+    """
+    Upload the new (uncommitted) files of many model instances as one concurrent batch.
+    
+    Bulk paths (bulk_create) would otherwise upload them one by one from pre_save.
+    Uploaded fields are marked committed, so the ORM won't upload them again;
+    anything that failed is left uncommitted and falls back to the normal path.
+    
+    Returns:
+        int: Number of files uploaded
+    """
+    from helpers.cloudflare.storages import save_many
+    
+    pending = []  # (field_file, target name, bytes)
+    for instance in instances:
+        for field_name in field_names:
+            field_file = getattr(instance, field_name)
+            data = pending_image_bytes(field_file)
+            if data is None:
+                continue
+            target = field_file.field.generate_filename(instance, field_file.name)
+            pending.append((field_file, target, data))
+    if not pending:
+        return 0
+    
+    uploaded = 0
+    results = save_many([(target, data) for _file, target, data in pending])
+    for (field_file, _target, _data), result in zip(pending, results):
+        if result['error']:
+            continue
+        field_file.name = result['saved_name']
+        field_file._committed = True
+        uploaded += 1
+    return uploaded
+
+
+def save_responsive_variants(image_bytes: bytes, name: str, sizes: Optional[dict] = None) -> dict:
+    """
+    Encode and upload responsive variants for an image already stored at `name`.
+    
+    Variants go under variants/<folder>/ so they don't mix with the main uploads.
+    The largest slot always points at the main image itself (no duplicate WebP).
+    AVIF encodings are added when settings.IMAGE_VARIANTS_AVIF is enabled.
+    
+    Never raises - variants are an optimization, so failures just return {}.
+    
+    Returns:
+        {
+            'small': {'width': 480, 'webp': 'variants/questions/x-480w.webp', 'avif': '...'},
+            'medium': {'width': 768, 'webp': '...'},
+            'large': {'width': 1280, 'webp': 'questions/x.webp'},
+        }
+    """
+    from helpers.cloudflare.storages import save_many
+    
+    sizes = sizes or ImageOptimizer.SIZES
+    formats = ('webp', 'avif') if getattr(settings, 'IMAGE_VARIANTS_AVIF', False) else ('webp',)
+    
+    try:
+        source = pyvips.Image.new_from_buffer(image_bytes, '')
+        encoded = ImageOptimizer.create_responsive_variants(image_bytes, sizes=sizes, formats=formats)
+        
+        folder, _, filename = name.rpartition('/')
+        stem = filename.rsplit('.', 1)[0]
+        
+        # Collect every encoding first, then upload them as one concurrent batch
+        variants = {}
+        batch = []  # (size_name, fmt, path, bytes)
+        for size_name, outputs in encoded.items():
+            width = outputs.pop('width')
+            variants[size_name] = {'width': width}
+            for fmt, data in outputs.items():
+                batch.append((size_name, fmt, f"variants/{folder}/{stem}-{width}w.{fmt}", data))
+        
+        # Full-size slot: the first breakpoint the source doesn't exceed (or the largest)
+        full_size_name = next(
+            (size_name for size_name, width in sizes.items() if width >= source.width),
+            list(sizes)[-1]
+        )
+        variants[full_size_name] = {'width': source.width, 'webp': name}
+        if 'avif' in formats:
+            avif = ImageOptimizer.optimize_image(
+                image_bytes,
+                max_width=source.width,
+                max_height=source.height,
+                quality=ImageOptimizer.AVIF_QUALITY,
+                format='avif',
+            )
+            batch.append((full_size_name, 'avif', f"variants/{folder}/{stem}-{source.width}w.avif", avif))
+        
+        results = save_many([(path, data) for _size, _fmt, path, data in batch])
+        errors = [result['error'] for result in results if result['error']]
+        if errors:
+            raise Exception(f"{len(errors)} variant upload(s) failed: {errors[0]}")
+        for (size_name, fmt, _path, _data), result in zip(batch, results):
+            variants[size_name][fmt] = result['saved_name']
+        
+        logger.info(f'🖼️ Saved {len(variants)} responsive variants for {name}')
+        return variants
+    except Exception as e:
+        logger.warning(f"Responsive variant generation failed for {name}: {e}", exc_info=True)
+        return {}
+
+
+def variants_srcset(variants: Optional[dict]) -> Optional[dict]:
+    """
+    Turn a stored variants map into srcset strings per format, e.g.
+    {'webp': 'https://.../x-480w.webp 480w, https://.../x.webp 1280w', 'avif': '...'}
+    
+    Clients pick a format with <picture><source type="image/avif" srcset=...>.
+    Returns None when no variants were recorded (clients fall back to the plain URL).
+    """
+    if not variants:
+        return None
+    from django.core.files.storage import default_storage
+    
+    srcset = {}
+    for entry in sorted(variants.values(), key=lambda v: v.get('width', 0)):
+        for fmt in ('avif', 'webp'):
+            path = entry.get(fmt)
+            if not path:
+                continue
+            url = default_storage.url(path)
+            # Ensure it has https:// protocol
+            if url and not url.startswith('http'):
+                url = f'https://{url}'
+            srcset.setdefault(fmt, []).append(f"{url} {entry['width']}w")
+    return {fmt: ', '.join(candidates) for fmt, candidates in srcset.items()}
+
+
+def processed_image_fields(field_name: str, image_bytes: bytes, name: str, sizes: Optional[dict] = None, metadata: bool = True) -> dict:
+    """
+    Build the derived model fields for a newly stored image `name`:
+    `<field>_variants` and, when `metadata` is set, `<field>_width`,
+    `<field>_height` and `<field>_placeholder`.
+    
+    Never raises - derived fields are optional, failures leave them empty.
+    """
+    updates = {f'{field_name}_variants': save_responsive_variants(image_bytes, name, sizes=sizes)}
+    if metadata:
+        try:
+            meta = image_metadata(image_bytes)
+        except Exception as e:
+            logger.warning(f"Image metadata extraction failed for {name}: {e}")
+            meta = {'width': None, 'height': None, 'placeholder': ''}
+        updates.update({
+            f'{field_name}_width': meta['width'],
+            f'{field_name}_height': meta['height'],
+            f'{field_name}_placeholder': meta['placeholder'],
+        })
+    return updates
+
+
+def cleared_image_fields(field_name: str, metadata: bool = True) -> dict:
+    """Derived field values for an image field that has been emptied."""
+    updates = {f'{field_name}_variants': {}}
+    if metadata:
+        updates.update({
+            f'{field_name}_width': None,
+            f'{field_name}_height': None,
+            f'{field_name}_placeholder': '',
+        })
+    return updates
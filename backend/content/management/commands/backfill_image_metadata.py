@@ -0,0 +1,105 @@
+"""
+Management command to backfill stored image dimensions and BlurHash placeholders.
+
+New uploads get these at optimization time; this fills them in for rows saved before
+the fields existed. Each file is downloaded once and results are written back in batches
+with bulk_update, so model save hooks (re-optimization, variant uploads) never run.
+"""
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+
+from content.image_optimizer import image_metadata, save_responsive_variants
+from content.models import Question, Category
+
+# (model, image field) pairs to backfill
+TARGETS = [
+    (Question, "image"),
+    (Question, "answer_image"),
+    (Category, "image"),
+]
+
+
+class Command(BaseCommand):
+    help = "Compute missing image width/height/placeholder for questions and categories."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count rows that need backfilling; do not download or modify anything.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Process at most N images per field (useful for testing).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Rows per bulk_update (default: 200).",
+        )
+        parser.add_argument(
+            "--variants",
+            action="store_true",
+            help="Also generate responsive variants for rows that have none.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        limit = options["limit"]
+        batch_size = options["batch_size"]
+
+        for model, field in TARGETS:
+            label = f"{model.__name__}.{field}"
+            qs = (
+                model.objects.exclude(**{f"{field}__isnull": True})
+                .exclude(**{field: ""})
+                .filter(**{f"{field}_width__isnull": True})
+                .only("id", field, f"{field}_variants")
+                .order_by("id")
+            )
+            if limit is not None:
+                qs = qs[:limit]
+
+            if dry_run:
+                self.stdout.write(f"🔎 {label}: {qs.count()} image(s) missing metadata")
+                continue
+
+            self.stdout.write(f"🖼️ Backfilling {label}...")
+            update_fields = [f"{field}_width", f"{field}_height", f"{field}_placeholder"]
+            if options["variants"]:
+                update_fields.append(f"{field}_variants")
+
+            batch = []
+            done = failed = 0
+            for obj in qs.iterator(chunk_size=batch_size):
+                name = getattr(obj, field).name
+                try:
+                    with default_storage.open(name, "rb") as fh:
+                        data = fh.read()
+                    meta = image_metadata(data)
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"  ⚠️ {label} id={obj.id} ({name}): {e}"))
+                    continue
+
+                setattr(obj, f"{field}_width", meta["width"])
+                setattr(obj, f"{field}_height", meta["height"])
+                setattr(obj, f"{field}_placeholder", meta["placeholder"])
+                if options["variants"] and not getattr(obj, f"{field}_variants"):
+                    setattr(obj, f"{field}_variants", save_responsive_variants(data, name))
+                batch.append(obj)
+
+                if len(batch) >= batch_size:
+                    model.objects.bulk_update(batch, update_fields)
+                    done += len(batch)
+                    batch = []
+
+            if batch:
+                model.objects.bulk_update(batch, update_fields)
+                done += len(batch)
+
+            style = self.style.SUCCESS if not failed else self.style.WARNING
+            self.stdout.write(style(f"✅ {label}: {done} updated, {failed} failed"))
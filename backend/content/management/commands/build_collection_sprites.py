@@ -0,0 +1,33 @@
+"""
+Management command to build the per-collection category sprite atlases.
+
+Sprites are rebuilt automatically when a category is saved, moved, hidden or deleted;
+run this after bulk edits made outside the ORM save path, or with --force after
+changing the tile layout.
+"""
+from django.core.management.base import BaseCommand
+
+from content.sprites import rebuild_collection_sprites
+
+
+class Command(BaseCommand):
+    help = 'Build (or rebuild) the WebP sprite atlas of category thumbnails for each collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collection',
+            type=int,
+            action='append',
+            dest='collections',
+            help='Only rebuild this collection id (may be repeated).',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild even when the inputs are unchanged.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('🧩 Building collection sprites...')
+        changed = rebuild_collection_sprites(options['collections'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'✅ {changed} collection sprite(s) updated'))
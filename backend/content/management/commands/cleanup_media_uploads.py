@@ -0,0 +1,63 @@
+"""
+Management command to clear out abandoned direct-to-storage uploads.
+
+Slots that were never confirmed (or got stuck) leave staging objects under uploads/
+in the bucket, and abandoned resumable sessions leave part files on local disk and
+staged objects nobody committed. Run daily from cron.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import MediaUpload, UploadSession
+from content.uploads import discard_staging_object, discard_upload_session
+
+
+class Command(BaseCommand):
+    help = 'Delete staging objects and rows for abandoned or finished direct uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Only touch uploads older than this many hours (default: 24).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be removed without deleting anything.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        # Pending = never confirmed; processing this old = the task was lost
+        stale = MediaUpload.objects.filter(created_at__lt=cutoff, status__in=['pending', 'processing'])
+        finished = MediaUpload.objects.filter(created_at__lt=cutoff, status__in=['done', 'failed'])
+
+        # Sessions are judged by last activity so slow resumable uploads aren't cut off
+        sessions = UploadSession.objects.filter(updated_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'🔎 {stale.count()} abandoned upload(s), {finished.count()} finished upload row(s) older than {options["hours"]}h')
+            self.stdout.write(f'🔎 {sessions.count()} upload session(s) inactive for {options["hours"]}h')
+            return
+
+        removed = 0
+        for upload in stale.iterator(chunk_size=500):
+            discard_staging_object(upload)
+            removed += 1
+        stale.delete()
+        deleted_rows, _ = finished.delete()
+
+        session_count = 0
+        for session in sessions.iterator(chunk_size=500):
+            discard_upload_session(session)
+            session_count += 1
+        sessions.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Removed {removed} abandoned upload(s), {deleted_rows} finished upload row(s) '
+            f'and {session_count} upload session(s)'
+        ))
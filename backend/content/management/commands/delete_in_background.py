@@ -0,0 +1,79 @@
+"""
+Management command to delete a user or category through a chunked deletion job.
+
+The target is soft-hidden immediately; dependents are removed in bounded chunks so
+gameplay writes are never blocked behind one huge cascading transaction.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from content.deletion import queue_deletion, soft_hide, run_deletion_job
+from content.models import Category, DeletionJob
+
+
+class Command(BaseCommand):
+    help = 'Soft-hide a user or category and delete it (and its dependents) in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target_type', nargs='?', choices=['user', 'category'])
+        parser.add_argument('target_id', nargs='?', type=int)
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows per DELETE (default: 500).',
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Run the deletion in this process with progress output instead of queueing it.',
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='JOB_ID',
+            help='Re-run a failed or interrupted deletion job.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        if options['resume']:
+            job = DeletionJob.objects.filter(pk=options['resume']).first()
+            if job is None:
+                raise CommandError(f"Deletion job {options['resume']} not found")
+            if job.status == 'done':
+                self.stdout.write(self.style.WARNING(f'Job {job.pk} is already done'))
+                return
+            soft_hide(job.target_type, job.target_id)
+            return self._run(job, chunk_size)
+
+        if not options['target_type'] or not options['target_id']:
+            raise CommandError('Provide a target (user <id> | category <id>) or --resume JOB_ID')
+
+        model = User if options['target_type'] == 'user' else Category
+        target = model.objects.filter(pk=options['target_id']).first()
+        if target is None:
+            raise CommandError(f"{options['target_type']} {options['target_id']} not found")
+
+        if not options['sync']:
+            job = queue_deletion(target)
+            self.stdout.write(self.style.SUCCESS(f'✅ Queued deletion job {job.pk} for {job.target_type} "{job.target_label}"'))
+            return
+
+        # Create the job without dispatching it, then run it here
+        soft_hide(options['target_type'], target.pk)
+        job = DeletionJob.objects.create(
+            target_type=options['target_type'], target_id=target.pk, target_label=str(target)[:255]
+        )
+        self._run(job, chunk_size)
+
+    def _run(self, job, chunk_size):
+        self.stdout.write(f'🗑️ Deleting {job.target_type} "{job.target_label}" (job {job.pk})...')
+        try:
+            run_deletion_job(job, chunk_size=chunk_size)
+        except Exception as e:
+            raise CommandError(f'Deletion job {job.pk} failed: {e} (re-run with --resume {job.pk})')
+        for label, count in job.progress.items():
+            self.stdout.write(f'   {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'✅ Deletion job {job.pk} done'))
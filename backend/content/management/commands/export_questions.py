@@ -0,0 +1,66 @@
+"""
+Management command to export the question bank as a JSONL or CSV pack.
+
+Rows are streamed from the database in chunks (a server-side cursor on PostgreSQL)
+straight to the output file. With --images, every referenced image is written once
+to a zip archive under the same path the rows use, ready for import_questions.
+"""
+import sys
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from content.question_io import (
+    FORMATS, EXPORT_CHUNK_SIZE, detect_format, export_queryset, iter_export_rows, write_pack,
+)
+
+
+class Command(BaseCommand):
+    help = 'Export questions to a JSONL/CSV pack, streaming from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file (.jsonl or .csv), or - for stdout')
+        parser.add_argument('--format', choices=FORMATS, help='Pack format (default: from the file extension)')
+        parser.add_argument('--images', help='Also write referenced images to this zip archive')
+        parser.add_argument(
+            '--category',
+            type=int,
+            action='append',
+            help='Only export this category (repeatable)',
+        )
+        parser.add_argument(
+            '--official',
+            action='store_true',
+            help='Skip user-created categories',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help=f'Rows fetched per round trip (default: {EXPORT_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        to_stdout = options['path'] == '-'
+        try:
+            fmt = detect_format(options['path'], options['format'] or ('jsonl' if to_stdout else None))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = export_queryset(options['category'], official_only=options['official'])
+        rows = iter_export_rows(queryset, chunk_size=options['chunk_size'])
+        archive = zipfile.ZipFile(options['images'], 'w', zipfile.ZIP_STORED) if options['images'] else None
+        stream = sys.stdout if to_stdout else open(options['path'], 'w', encoding='utf-8', newline='')
+        try:
+            written, archived = write_pack(rows, stream, fmt, archive)
+        finally:
+            if not to_stdout:
+                stream.close()
+            if archive is not None:
+                archive.close()
+
+        if not to_stdout:
+            summary = f'✅ Exported {written} question(s) to {options["path"]}'
+            if archive is not None:
+                summary += f' and {archived} image(s) to {options["images"]}'
+            self.stdout.write(self.style.SUCCESS(summary))
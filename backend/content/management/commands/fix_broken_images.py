@@ -3,7 +3,14 @@ import unicodedata
 from django.core.management.base import BaseCommand
 from django.core.files.storage import default_storage
 from django.db import transaction
-from content.models import Question
+from content.models import Question, Category
+
+# (model, image field, storage prefix) pairs checked by --bulk
+BULK_TARGETS = [
+    (Question, "image", "questions/"),
+    (Question, "answer_image", "answers/"),
+    (Category, "image", "categories/"),
+]
 
 class Command(BaseCommand):
     help = "Detect and optionally fix questions with broken/missing image files."
@@ -20,11 +27,26 @@ class Command(BaseCommand):
             default=None,
             help="Process at most N questions (useful for testing).",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="List the bucket once and diff it against the database instead of one HEAD per question. "
+                 "Also checks answer images and category images, and reports orphaned objects.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows per set-based UPDATE in --bulk mode (default: 1000).",
+        )
 
     def handle(self, *args, **options):
         dry_run = options.get("dry_run", False)
         limit = options.get("limit")
 
+        if options.get("bulk"):
+            return self.handle_bulk(dry_run, options["chunk_size"])
+
         qs = Question.objects.only("id", "image")
         total = qs.count()
         processed = 0
@@ -61,6 +83,9 @@ class Command(BaseCommand):
             # Check existence in storage, guarding storage errors
             try:
                 exists = default_storage.exists(image_path)
+                if not exists and hasattr(default_storage, 'exists_uncached'):
+                    # Cached "missing" answers are re-checked before we null anything
+                    exists = default_storage.exists_uncached(image_path)
             except Exception as e:
                 self.stdout.write(self.style.ERROR(
                     f"[STORAGE ERROR] Question {q.id}: {image_path} -> {e}"
@@ -82,3 +107,70 @@ class Command(BaseCommand):
                 f"{'Would fix' if dry_run else 'Fixed'} {broken_count} broken image entries."
             )
         )
+
+    def handle_bulk(self, dry_run, chunk_size):
+        """
+        Bucket-diff mode:
+        1. List each media prefix page by page (1000 keys per request) into a set.
+        2. Stream DB paths with values_list().iterator() and diff against the set.
+        3. Null broken references with chunked UPDATE ... WHERE id IN (...).
+        4. Whatever listed object nothing referenced is reported as orphaned.
+        """
+        if not hasattr(default_storage, "iter_objects"):
+            self.stdout.write(self.style.ERROR("--bulk requires the R2 media storage (MediaFileStorage)."))
+            return
+
+        listed = set()
+        for prefix in sorted({prefix for _model, _field, prefix in BULK_TARGETS}):
+            before = len(listed)
+            listed.update(name for name, _size in default_storage.iter_objects(prefix))
+            self.stdout.write(f"Listed {len(listed) - before} objects under media/{prefix}")
+
+        unreferenced = set(listed)
+        total_broken = 0
+
+        for model, field, _prefix in BULK_TARGETS:
+            label = f"{model.__name__}.{field}"
+            broken_ids = []
+            rows = (
+                model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                .values_list("id", field)
+                .iterator(chunk_size=5000)
+            )
+            for pk, path in rows:
+                if unicodedata.normalize("NFC", path) != path:
+                    self.stdout.write(self.style.WARNING(f"[UNSAFE NAME] {label} {pk}: '{path}'"))
+                    broken_ids.append(pk)
+                elif path in listed:
+                    unreferenced.discard(path)
+                elif hasattr(default_storage, "exists_uncached") and default_storage.exists_uncached(path):
+                    # Uploaded after the listing was taken - not broken
+                    unreferenced.discard(path)
+                else:
+                    self.stdout.write(self.style.ERROR(f"[MISSING FILE] {label} {pk}: {path}"))
+                    broken_ids.append(pk)
+
+            if broken_ids and not dry_run:
+                # Set-based update avoids model save hooks that may touch other FileFields
+                for start in range(0, len(broken_ids), chunk_size):
+                    chunk = broken_ids[start:start + chunk_size]
+                    with transaction.atomic():
+                        model.objects.filter(id__in=chunk).update(**{field: None})
+
+            self.stdout.write(f"{label}: {len(broken_ids)} broken references")
+            total_broken += len(broken_ids)
+
+        if unreferenced:
+            self.stdout.write(self.style.WARNING(f"{len(unreferenced)} orphaned objects (not referenced by any row):"))
+            for name in sorted(unreferenced)[:50]:
+                self.stdout.write(f"  [ORPHAN] {name}")
+            if len(unreferenced) > 50:
+                self.stdout.write(f"  ... and {len(unreferenced) - 50} more")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done! Listed {len(listed)} objects. "
+                f"{'Would fix' if dry_run else 'Fixed'} {total_broken} broken image entries, "
+                f"found {len(unreferenced)} orphaned objects."
+            )
+        )
@@ -0,0 +1,38 @@
+"""
+Management command to flush the storage deletion journal.
+
+Deletes are normally flushed right after the deleting transaction commits, and the
+flush-storage-deletions beat task retries failed (and delayed) ones every few minutes;
+run this to flush by hand, or with --retry-dead to revive entries that gave up.
+"""
+from django.core.management.base import BaseCommand
+
+from content.models import StorageDeletion
+from helpers.cloudflare.post_delete import flush_storage_deletions, MAX_DELETE_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = 'Delete journaled media objects from storage in batched multi-object deletes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Objects per multi-object DELETE (max 1000).',
+        )
+        parser.add_argument(
+            '--retry-dead',
+            action='store_true',
+            help=f'Reset entries that already failed {MAX_DELETE_ATTEMPTS} times so they are tried again.',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            reset = StorageDeletion.objects.filter(attempts__gte=MAX_DELETE_ATTEMPTS).update(attempts=0)
+            self.stdout.write(f'🔁 Reset {reset} dead entries')
+
+        self.stdout.write(f'🗑️ Flushing storage deletions ({StorageDeletion.objects.count()} journaled)...')
+        deleted, failed = flush_storage_deletions(batch_size=min(options['batch_size'], 1000))
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f'✅ {deleted} deleted, {failed} failed (will retry)'))
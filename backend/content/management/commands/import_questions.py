@@ -0,0 +1,85 @@
+"""
+Management command to bulk-import a question pack (JSONL or CSV, optional images zip).
+
+The file is validated in one streaming pass first; nothing is written unless every row
+is valid. Rows are then inserted in batches (COPY on PostgreSQL) without going through
+Question.save(), each with a random_key. Images are optimized and uploaded per batch.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from content.models import Category
+from content.question_io import (
+    FORMATS, IMPORT_BATCH_SIZE, CategoryResolver, detect_format, validate_pack, import_pack, open_archive,
+)
+
+
+class Command(BaseCommand):
+    help = 'Import questions from a JSONL/CSV pack, streaming and in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Pack file (.jsonl or .csv)')
+        parser.add_argument('--format', choices=FORMATS, help='Pack format (default: from the file extension)')
+        parser.add_argument('--images', help='Zip archive holding the images referenced by the rows')
+        parser.add_argument(
+            '--category',
+            type=int,
+            help='Import every row into this category, ignoring the rows\' category column',
+        )
+        parser.add_argument(
+            '--create-categories',
+            action='store_true',
+            help='Create official categories named in the pack that do not exist yet',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help=f'Rows per insert batch (default: {IMPORT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Use bulk_create even on PostgreSQL',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only validate the pack',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fmt = detect_format(options['path'], options['format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        category = None
+        if options['category']:
+            category = Category.objects.filter(pk=options['category']).first()
+            if category is None:
+                raise CommandError(f"Category {options['category']} not found")
+        categories = CategoryResolver(category, create_missing=options['create_categories'])
+        images = open_archive(options['images'])
+
+        self.stdout.write(f"🔎 Validating {options['path']}...")
+        with open(options['path'], encoding='utf-8', newline='') as stream:
+            valid, errors = validate_pack(stream, fmt, categories, images.names() if images else None)
+        if errors:
+            for error in errors:
+                self.stdout.write(self.style.ERROR(f'   {error}'))
+            raise CommandError(f'Pack is invalid ({len(errors)} error(s) shown); nothing was imported')
+        self.stdout.write(self.style.SUCCESS(f'✅ {valid} valid question(s)'))
+        if options['dry_run']:
+            return
+
+        self.stdout.write('📥 Importing...')
+        with open(options['path'], encoding='utf-8', newline='') as stream:
+            try:
+                imported = import_pack(
+                    stream, fmt, categories, images=images,
+                    batch_size=options['batch_size'],
+                    use_copy=False if options['no_copy'] else None,
+                )
+            except Exception as e:
+                raise CommandError(f'Import failed: {e} (completed batches were kept)')
+        self.stdout.write(self.style.SUCCESS(f'✅ Imported {imported} question(s)'))
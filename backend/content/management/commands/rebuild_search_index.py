@@ -0,0 +1,28 @@
+"""
+Management command to rebuild the full-text search index.
+
+Saves keep the index current; run this after deploying the index, after raw SQL
+edits, or whenever search results look stale.
+"""
+from django.core.management.base import BaseCommand
+
+from content.search import rebuild_index, INDEX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for categories and questions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=INDEX_BATCH_SIZE,
+            help=f'Questions reindexed per transaction (default: {INDEX_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('🔎 Rebuilding search index...')
+        stats = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Indexed {stats['categories']} categories and {stats['questions']} questions"
+        ))
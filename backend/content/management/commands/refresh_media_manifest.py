@@ -0,0 +1,24 @@
+"""
+Management command to rebuild the local media object manifest from a bucket listing.
+
+Run it periodically (e.g. cron every few minutes) so CachedMediaFileStorage can answer
+exists()/size() without a HEAD request per file.
+"""
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+
+
+class Command(BaseCommand):
+    help = 'List the media bucket and rebuild the local object manifest used by the storage cache'
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'refresh_manifest'):
+            self.stdout.write(
+                self.style.WARNING('Default storage does not keep a manifest (is CachedMediaFileStorage configured?)')
+            )
+            return
+
+        self.stdout.write('📦 Listing media bucket...')
+        count = default_storage.refresh_manifest()
+        path = getattr(default_storage, 'manifest_path', '') or '(in-memory only)'
+        self.stdout.write(self.style.SUCCESS(f'✅ Manifest refreshed with {count} objects → {path}'))
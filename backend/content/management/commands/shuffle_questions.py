@@ -2,8 +2,8 @@
 Management command to shuffle questions in all categories or specific categories.
 """
 from django.core.management.base import BaseCommand
-from content.models import Category
-from content.utils import shuffle_category_questions, shuffle_all_categories
+from content.models import Category, Question
+from content.utils import shuffle_questions, shuffle_category_questions, shuffle_all_categories, SHUFFLE_CHUNK_SIZE
 
 
 class Command(BaseCommand):
@@ -20,17 +20,38 @@ class Command(BaseCommand):
             action='store_true',
             help='Shuffle all categories',
         )
+        parser.add_argument(
+            '--unshuffled',
+            action='store_true',
+            help='Only shuffle questions that never got a random key (old 0.5 default); '
+                 'combine with --category or use alone for all categories',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SHUFFLE_CHUNK_SIZE,
+            help=f'Primary-key range per UPDATE (default: {SHUFFLE_CHUNK_SIZE})',
+        )
 
     def handle(self, *args, **options):
         category_id = options.get('category')
         shuffle_all = options.get('all')
+        only_unshuffled = options.get('unshuffled')
+        chunk_size = options.get('chunk_size')
 
         if category_id:
             # Shuffle single category
             try:
                 category = Category.objects.get(pk=category_id)
                 self.stdout.write(f'🎲 Shuffling category: {category.name}...')
-                count = shuffle_category_questions(category_id)
+                if only_unshuffled:
+                    count = shuffle_questions(
+                        Question.objects.filter(category_id=category_id),
+                        only_unshuffled=True,
+                        chunk_size=chunk_size,
+                    )
+                else:
+                    count = shuffle_category_questions(category_id, chunk_size=chunk_size)
                 self.stdout.write(
                     self.style.SUCCESS(f'✅ Shuffled {count} questions in "{category.name}"')
                 )
@@ -40,10 +61,11 @@ class Command(BaseCommand):
                 )
                 return
 
-        elif shuffle_all:
-            # Shuffle all categories
-            self.stdout.write('🎲 Shuffling ALL categories...')
-            stats = shuffle_all_categories()
+        elif shuffle_all or only_unshuffled:
+            # Shuffle all categories (or just the rows that were never shuffled)
+            scope = 'unshuffled questions in ALL categories' if only_unshuffled else 'ALL categories'
+            self.stdout.write(f'🎲 Shuffling {scope}...')
+            stats = shuffle_all_categories(only_unshuffled=only_unshuffled, chunk_size=chunk_size)
             self.stdout.write(
                 self.style.SUCCESS(
                     f'✅ Shuffled {stats["total_questions"]} questions '
@@ -54,9 +76,10 @@ class Command(BaseCommand):
         else:
             self.stdout.write(
                 self.style.WARNING(
-                    'Please specify --category <id> or --all\n'
+                    'Please specify --category <id>, --all or --unshuffled\n'
                     'Examples:\n'
                     '  python manage.py shuffle_questions --category 5\n'
-                    '  python manage.py shuffle_questions --all'
+                    '  python manage.py shuffle_questions --all\n'
+                    '  python manage.py shuffle_questions --unshuffled'
                 )
             )
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_alter_question_answer_image_alter_question_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive variants: {size: {"width": int, "webp": path, "avif": path}}'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answer_image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive variants of answer_image'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive variants of image'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='sprite',
+            field=models.FileField(blank=True, editable=False, max_length=255, upload_to='sprites/'),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='sprite_map',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='{category_id: [x, y]} tile offsets in the sprite'),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='sprite_signature',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the inputs the sprite was built from', max_length=64),
+        ),
+    ]
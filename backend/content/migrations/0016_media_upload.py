@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-19 01:30
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0015_collection_sprite'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('purpose', models.CharField(choices=[('avatar', 'Avatar'), ('category_image', 'Category image'), ('question_image', 'Question image'), ('answer_image', 'Answer image')], max_length=20)),
+                ('target_id', models.PositiveBigIntegerField(blank=True, help_text='Category or question id the image is for', null=True)),
+                ('key', models.CharField(help_text='Staging object name in media storage', max_length=255)),
+                ('content_type', models.CharField(max_length=50)),
+                ('size', models.PositiveIntegerField(help_text='Declared size in bytes (signed into the upload URL)')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('result', models.CharField(blank=True, help_text='Final stored image name', max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'status'], name='content_med_user_id_93aecd_idx'), models.Index(fields=['status', 'created_at'], name='content_med_status_a5b479_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-19 02:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0016_media_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('content_type', models.CharField(max_length=50)),
+                ('size', models.PositiveIntegerField(help_text='Total size in bytes')),
+                ('received', models.PositiveIntegerField(default=0, help_text='Bytes received so far (next expected offset)')),
+                ('checksum', models.CharField(blank=True, help_text='Optional client-supplied SHA-256 of the whole file', max_length=64)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('complete', 'Complete'), ('consumed', 'Consumed'), ('failed', 'Failed')], default='open', max_length=20)),
+                ('key', models.CharField(blank=True, help_text='Staged optimized image in media storage', max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'status'], name='content_upl_user_id_58ce58_idx'), models.Index(fields=['status', 'updated_at'], name='content_upl_status_d441d2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 03:30
+
+import content.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0019_deletion_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='random_key',
+            field=models.FloatField(db_index=True, default=content.models.random_key, help_text='Pre-shuffled order key for fast random queries'),
+        ),
+    ]
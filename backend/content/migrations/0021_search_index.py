@@ -0,0 +1,100 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSTGRES_SQL = [
+    # Questions and answers are indexed with both the English and the Arabic configuration
+    """
+    ALTER TABLE content_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', title), 'A') ||
+        setweight(to_tsvector('arabic', title_ar), 'A') ||
+        setweight(to_tsvector('english', body), 'B') ||
+        setweight(to_tsvector('arabic', body_ar), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX content_searchentry_document_gin ON content_searchentry USING GIN (document)",
+]
+
+SQLITE_SQL = [
+    """
+    CREATE VIRTUAL TABLE content_searchentry_fts USING fts5(
+        title, title_ar, body, body_ar,
+        content='content_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER content_searchentry_fts_insert AFTER INSERT ON content_searchentry BEGIN
+        INSERT INTO content_searchentry_fts (rowid, title, title_ar, body, body_ar)
+        VALUES (new.id, new.title, new.title_ar, new.body, new.body_ar);
+    END
+    """,
+    """
+    CREATE TRIGGER content_searchentry_fts_delete AFTER DELETE ON content_searchentry BEGIN
+        INSERT INTO content_searchentry_fts (content_searchentry_fts, rowid, title, title_ar, body, body_ar)
+        VALUES ('delete', old.id, old.title, old.title_ar, old.body, old.body_ar);
+    END
+    """,
+    """
+    CREATE TRIGGER content_searchentry_fts_update AFTER UPDATE ON content_searchentry BEGIN
+        INSERT INTO content_searchentry_fts (content_searchentry_fts, rowid, title, title_ar, body, body_ar)
+        VALUES ('delete', old.id, old.title, old.title_ar, old.body, old.body_ar);
+        INSERT INTO content_searchentry_fts (rowid, title, title_ar, body, body_ar)
+        VALUES (new.id, new.title, new.title_ar, new.body, new.body_ar);
+    END
+    """,
+]
+
+BACKFILL_SQL = [
+    """
+    INSERT INTO content_searchentry (kind, category_id, question_id, title, title_ar, body, body_ar, updated_at)
+    SELECT 'category', id, NULL, name, '', description, '', CURRENT_TIMESTAMP FROM content_category
+    """,
+    """
+    INSERT INTO content_searchentry (kind, category_id, question_id, title, title_ar, body, body_ar, updated_at)
+    SELECT 'question', category_id, id, text, text_ar, answer, answer_ar, CURRENT_TIMESTAMP FROM content_question
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRES_SQL, 'sqlite': SQLITE_SQL}.get(vendor, [])
+    for sql in statements + BACKFILL_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS content_searchentry_fts")
+    # The PostgreSQL column and index go away with the table
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0020_question_random_key_on_insert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('category', 'Category'), ('question', 'Question')], max_length=20)),
+                ('title', models.TextField(blank=True, help_text='Category name or question text')),
+                ('title_ar', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True, help_text='Category description or answer')),
+                ('body_ar', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='content.category')),
+                ('question', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='content.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'category'], name='content_sea_kind_9bec3a_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('kind', 'category')), fields=('category',), name='unique_category_search_entry')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
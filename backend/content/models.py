@@ -1,10 +1,21 @@
 import hashlib
+import random
+import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from io import BytesIO
 
+def random_key():
+    """Default Question.random_key: every new row gets its own place in the shuffled order."""
+    return random.random()
+
+
+UNSHUFFLED_RANDOM_KEY = 0.5  # Old default, left on rows created before keys were assigned on insert
+
+
 def get_file_hash(file):
     """Return a SHA-256 hash of the uploaded file contents."""
     hasher = hashlib.sha256()
@@ -16,6 +27,11 @@ class Collection(models.Model):
     name = models.CharField(max_length=100, help_text='Collection name (e.g., "Anime & Manga")')
     order = models.IntegerField(default=0, help_text='Display order (lower numbers first)')
 
+    # Packed WebP atlas of category thumbnails (see content/sprites.py)
+    sprite = models.FileField(upload_to='sprites/', max_length=255, blank=True, editable=False)
+    sprite_map = models.JSONField(default=dict, blank=True, editable=False, help_text='{category_id: [x, y]} tile offsets in the sprite')
+    sprite_signature = models.CharField(max_length=64, blank=True, editable=False, help_text='Hash of the inputs the sprite was built from')
+
     class Meta:
         ordering = ['order', 'name']
 
@@ -33,6 +49,10 @@ class Category(models.Model):
     locked = models.BooleanField(default=False)  # True = only premium users can access
     is_hidden = models.BooleanField(default=False, help_text='True = category is hidden from users (but not deleted)')
     image = models.ImageField(upload_to='categories/', blank=True, null=True, help_text='Category image/icon')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Responsive variants: {size: {"width": int, "webp": path, "avif": path}}')
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.CharField(max_length=64, blank=True, default='', editable=False, help_text='BlurHash placeholder')
     description = models.TextField(blank=True, help_text='Optional description for the category')
     collection = models.ForeignKey(Collection, on_delete=models.SET_NULL, null=True, blank=True, related_name='categories')
     
@@ -52,10 +72,18 @@ class Category(models.Model):
         ]
         ordering = ['-created_at']
 
+    def __init__(self, *args, **kwargs):
+        """Track the original collection so a move rebuilds both collections' sprites"""
+        super().__init__(*args, **kwargs)
+        # Read from __dict__ so a deferred field doesn't trigger a query
+        self._original_collection_id = self.__dict__.get('collection_id')
+
     def save(self, *args, **kwargs):
         """Optimize category image before saving"""
         import logging
-        from content.image_optimizer import validate_and_optimize_image
+        from content.image_optimizer import (
+            validate_and_optimize_image, pending_image_bytes, processed_image_fields, cleared_image_fields
+        )
         
         logger = logging.getLogger(__name__)
         
@@ -70,7 +98,28 @@ class Category(models.Model):
                 logger.warning(f"Category image optimization failed: {e}")
                 # Continue with original image
         
+        # Capture bytes before upload so variants don't need a download afterwards
+        new_image_bytes = pending_image_bytes(self.image)
+        if not self.image:
+            for attr, value in cleared_image_fields('image').items():
+                setattr(self, attr, value)
+        
         super().save(*args, **kwargs)
+        
+        # Variants, dimensions and placeholder are derived once the final storage name is known
+        if new_image_bytes is not None:
+            updates = processed_image_fields('image', new_image_bytes, self.image.name)
+            for attr, value in updates.items():
+                setattr(self, attr, value)
+            Category.objects.filter(pk=self.pk).update(**updates)
+        
+        # Rebuild affected collection sprites in the background once committed
+        # (a no-op when nothing they show changed)
+        affected_collections = {self._original_collection_id, self.collection_id} - {None}
+        if affected_collections:
+            from content.sprites import queue_sprite_rebuild
+            queue_sprite_rebuild(affected_collections)
+        self._original_collection_id = self.collection_id
 
     def __str__(self):
         return self.name
@@ -95,12 +144,22 @@ class Question(models.Model):
 
     image = models.ImageField(upload_to='questions/', blank=True, null=True, max_length=200)
     answer_image = models.ImageField(upload_to='answers/', blank=True, null=True, max_length=200)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Responsive variants of image')
+    answer_image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Responsive variants of answer_image')
+
+    # Stored at optimization time so clients can reserve layout and paint a placeholder
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_placeholder = models.CharField(max_length=64, blank=True, default='', editable=False, help_text='BlurHash placeholder')
+    answer_image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    answer_image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    answer_image_placeholder = models.CharField(max_length=64, blank=True, default='', editable=False, help_text='BlurHash placeholder')
 
     image_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
     answer_image_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
     difficulty = models.CharField(max_length=20, choices=DIFFICULTY_CHOICES, default='200')
-    random_key = models.FloatField(default=0.5, db_index=True, help_text='Pre-shuffled order key for fast random queries')
+    random_key = models.FloatField(default=random_key, db_index=True, help_text='Pre-shuffled order key for fast random queries')
 
     class Meta:
         indexes = [
@@ -127,7 +186,9 @@ class Question(models.Model):
         import logging
         import hashlib
         from django.core.files.base import ContentFile
-        from content.image_optimizer import validate_and_optimize_image
+        from content.image_optimizer import (
+            validate_and_optimize_image, pending_image_bytes, processed_image_fields, cleared_image_fields
+        )
         
         logger = logging.getLogger(__name__)
         
@@ -216,6 +277,7 @@ class Question(models.Model):
                     # Reuse existing image path instead of uploading duplicate
                     logger.info(f'♻️ Reusing existing image from question {existing.pk} (hash: {image_hash[:8]}...)')
                     self.image = existing.image.name
+                    self.copy_image_fields_from(existing, 'image')
                     self.image_hash = image_hash
                 else:
                     # New unique image OR fixing broken reference - save it with new name
@@ -256,6 +318,7 @@ class Question(models.Model):
                     # Reuse existing image path instead of uploading duplicate
                     logger.info(f'♻️ Reusing existing answer image from question {existing.pk} (hash: {answer_hash[:8]}...)')
                     self.answer_image = existing.answer_image.name
+                    self.copy_image_fields_from(existing, 'answer_image')
                     self.answer_image_hash = answer_hash
                 else:
                     # New unique image OR fixing broken reference - save it
@@ -271,12 +334,37 @@ class Question(models.Model):
                 logger.error(f"❌ Answer image optimization failed: {e}", exc_info=True)
                 # Continue with original
         
+        # Capture bytes of new uploads before super().save() sends them to storage
+        new_image_bytes = pending_image_bytes(self.image)
+        new_answer_image_bytes = pending_image_bytes(self.answer_image)
+        for field_name in ('image', 'answer_image'):
+            if not getattr(self, field_name):
+                for attr, value in cleared_image_fields(field_name).items():
+                    setattr(self, attr, value)
+        
         super().save(*args, **kwargs)
         
+        # Derive variants, dimensions and placeholders now that the final storage names are known
+        derived_updates = {}
+        if new_image_bytes is not None:
+            derived_updates.update(processed_image_fields('image', new_image_bytes, self.image.name))
+        if new_answer_image_bytes is not None:
+            derived_updates.update(processed_image_fields('answer_image', new_answer_image_bytes, self.answer_image.name))
+        if derived_updates:
+            for attr, value in derived_updates.items():
+                setattr(self, attr, value)
+            Question.objects.filter(pk=self.pk).update(**derived_updates)
+        
         # Update tracking after save so subsequent saves work correctly
         self._original_image = self.image.name if self.image else None
         self._original_answer_image = self.answer_image.name if self.answer_image else None
 
+    def copy_image_fields_from(self, other, field_name):
+        """Copy derived image data (variants, dimensions, placeholder) for a reused image path."""
+        for suffix in ('variants', 'width', 'height', 'placeholder'):
+            attr = f'{field_name}_{suffix}'
+            setattr(self, attr, getattr(other, attr))
+
     @property
     def points(self):
         return int(self.difficulty)
@@ -312,3 +400,193 @@ class CategoryLike(models.Model):
 
     def __str__(self):
         return f"{self.user.username} liked {self.category.name}"
+
+
+class MediaUpload(models.Model):
+    """
+    A direct-to-storage upload slot.
+
+    The client PUTs the file straight to the bucket with a presigned URL, then
+    confirms; validation, optimization and attaching to the target happen in a
+    background task reading the object back from storage.
+    """
+    PURPOSE_CHOICES = [
+        ('avatar', 'Avatar'),
+        ('category_image', 'Category image'),
+        ('question_image', 'Question image'),
+        ('answer_image', 'Answer image'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),        # Slot issued, waiting for the client's PUT + confirm
+        ('processing', 'Processing'),  # Confirmed, queued for optimization
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='media_uploads')
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    target_id = models.PositiveBigIntegerField(null=True, blank=True, help_text='Category or question id the image is for')
+    key = models.CharField(max_length=255, help_text='Staging object name in media storage')
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField(help_text='Declared size in bytes (signed into the upload URL)')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    result = models.CharField(max_length=255, blank=True, help_text='Final stored image name')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.purpose} upload {self.id} ({self.status})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked image upload.
+
+    Chunks are appended by offset to a part file on disk, so an interrupted
+    upload resumes from `received` instead of starting over. Finalizing
+    validates and optimizes the image and stages it in media storage, where a
+    category manifest can reference it by session id.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),          # Receiving chunks
+        ('complete', 'Complete'),  # Optimized and staged at `key`, ready to be referenced
+        ('consumed', 'Consumed'),  # Attached to a category/question by a manifest commit
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField(help_text='Total size in bytes')
+    received = models.PositiveIntegerField(default=0, help_text='Bytes received so far (next expected offset)')
+    checksum = models.CharField(max_length=64, blank=True, help_text='Optional client-supplied SHA-256 of the whole file')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    key = models.CharField(max_length=255, blank=True, help_text='Staged optimized image in media storage')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload session {self.id} ({self.received}/{self.size}, {self.status})"
+
+
+class StorageDeletion(models.Model):
+    """
+    Journal of media objects to delete from storage.
+
+    Rows are written in the same transaction that deletes the owning model rows
+    (see helpers/cloudflare/post_delete.py) and flushed after commit in batched
+    multi-object deletes, so a large cascade never waits on storage round trips.
+    A future next_attempt_at delays the delete (replaced sprite atlases).
+    """
+    key = models.CharField(max_length=255, help_text='Object name in media storage')
+    source = models.CharField(max_length=255, blank=True, help_text='File field value the key belongs to (itself or a variant)')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['attempts', 'next_attempt_at']),
+        ]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Delete {self.key} (attempts={self.attempts})"
+
+
+class DeletionJob(models.Model):
+    """
+    Background deletion of a user or category with a large cascade.
+
+    The target is soft-hidden when the job is queued; dependents are then removed
+    in bounded chunks (see content/deletion.py) with per-table progress.
+    """
+    TARGET_CHOICES = [
+        ('user', 'User'),
+        ('category', 'Category'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    target_type = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    target_id = models.PositiveBigIntegerField()
+    target_label = models.CharField(max_length=255, blank=True, help_text='Display name, kept after the target is gone')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.JSONField(default=dict, blank=True, help_text='Rows deleted so far, per table')
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['target_type', 'target_id']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Delete {self.target_type} {self.target_label or self.target_id} ({self.status})"
+
+
+class SearchEntry(models.Model):
+    """
+    Full-text search document for one category or question.
+
+    The searchable text is copied here on write (see content/search.py). The index
+    itself is backend-specific and created in the migration: a generated tsvector
+    column with a GIN index on PostgreSQL, an FTS5 table kept in sync by triggers
+    on SQLite.
+    """
+    KIND_CHOICES = [
+        ('category', 'Category'),
+        ('question', 'Question'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, null=True, blank=True, related_name='search_entry')
+    title = models.TextField(blank=True, help_text='Category name or question text')
+    title_ar = models.TextField(blank=True)
+    body = models.TextField(blank=True, help_text='Category description or answer')
+    body_ar = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category'],
+                condition=models.Q(kind='category'),
+                name='unique_category_search_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.question_id or self.category_id}: {self.title[:50]}"
@@ -0,0 +1,424 @@
+"""
+Streaming bulk import/export of the question bank.
+
+Question packs are read and written one row at a time as JSONL or CSV, so tens of
+thousands of questions never sit in memory at once. Import validates the whole file
+in a first streaming pass (nothing is written if it is invalid), then inserts in
+batches - with COPY on PostgreSQL, bulk_create elsewhere - bypassing Question.save().
+Images travel in a separate zip archive keyed by the paths used in the rows; they
+are optimized, deduplicated by hash and uploaded concurrently per batch.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .models import Category, Question, random_key
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('jsonl', 'csv')
+
+# Columns of an exported row; import accepts the same layout (id and category_id are informational)
+EXPORT_FIELDS = [
+    'id', 'category_id', 'category', 'text', 'text_ar', 'answer', 'answer_ar',
+    'choice_2', 'choice_3', 'choice_4', 'difficulty', 'image', 'answer_image',
+]
+IMAGE_FIELDS = ('image', 'answer_image')
+DIFFICULTIES = {value for value, _label in Question.DIFFICULTY_CHOICES}
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+
+def detect_format(path, fmt=None):
+    """Return the pack format from an explicit choice or the file extension."""
+    if fmt:
+        return fmt
+    lowered = str(path).lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise ValueError(f'Cannot tell the format of {path}; pass --format ({"/".join(FORMATS)})')
+
+
+# ------------------------------
+# Reading and validation
+# ------------------------------
+
+def iter_rows(stream, fmt):
+    """
+    Yield (line number, row dict) from a text stream.
+
+    Raises:
+        ValueError: On a line that is not a JSON object (JSONL)
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'line {line_number}: invalid JSON ({e.msg})') from e
+        if not isinstance(row, dict):
+            raise ValueError(f'line {line_number}: expected a JSON object')
+        yield line_number, row
+
+
+def _text(row, key):
+    value = row.get(key)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+class CategoryResolver:
+    """Map a row's category (by name, or a fixed override) to a category id, querying each name once."""
+
+    def __init__(self, category=None, create_missing=False):
+        self.category = category
+        self.create_missing = create_missing
+        self.ids = {}
+
+    def lookup(self, name):
+        """Return the id for `name`, None if it would be created, or raise ValueError."""
+        if self.category is not None:
+            return self.category.pk
+        if not name:
+            raise ValueError('category is required')
+        if name not in self.ids:
+            self.ids[name] = (
+                Category.objects.filter(name=name, is_custom=False)
+                .order_by('pk').values_list('pk', flat=True).first()
+            )
+        if self.ids[name] is None and not self.create_missing:
+            raise ValueError(f'unknown category "{name}"')
+        return self.ids[name]
+
+    def resolve(self, name):
+        """Like lookup(), creating a missing official category when allowed."""
+        category_id = self.lookup(name)
+        if category_id is None:
+            category_id = Category.objects.create(name=name, is_custom=False).pk
+            self.ids[name] = category_id
+            logger.info(f'📁 Created category "{name}" ({category_id}) during import')
+        return category_id
+
+
+def clean_row(row, categories, archive_names=None):
+    """
+    Validate one pack row and normalize it to Question column values
+    (images are still archive paths at this point).
+
+    Raises:
+        ValueError: With every problem found in the row
+    """
+    errors = []
+    values = {
+        'text': _text(row, 'text'),
+        'text_ar': _text(row, 'text_ar'),
+        'answer': _text(row, 'answer'),
+        'answer_ar': _text(row, 'answer_ar'),
+    }
+    for key in ('choice_2', 'choice_3', 'choice_4'):
+        values[key] = _text(row, key) or None
+
+    if not values['text']:
+        errors.append('text is required')
+    if not values['answer']:
+        errors.append('answer is required')
+    for key in ('answer', 'answer_ar', 'choice_2', 'choice_3', 'choice_4'):
+        limit = Question._meta.get_field(key).max_length
+        if values[key] and len(values[key]) > limit:
+            errors.append(f'{key} is longer than {limit} characters')
+
+    difficulty = _text(row, 'difficulty') or _text(row, 'points') or '200'
+    if difficulty not in DIFFICULTIES:
+        errors.append(f'difficulty must be one of {", ".join(sorted(DIFFICULTIES))}')
+    values['difficulty'] = difficulty
+
+    try:
+        values['category_id'] = categories.lookup(_text(row, 'category'))
+    except ValueError as e:
+        errors.append(str(e))
+    values['category_name'] = _text(row, 'category')
+
+    for field_name in IMAGE_FIELDS:
+        path = _text(row, field_name)
+        if path and archive_names is not None and path not in archive_names:
+            errors.append(f'{field_name} "{path}" is not in the images archive')
+        if path and len(path) > Question._meta.get_field(field_name).max_length:
+            errors.append(f'{field_name} path is too long')
+        values[field_name] = path or None
+
+    if errors:
+        raise ValueError('; '.join(errors))
+    return values
+
+
+def validate_pack(stream, fmt, categories, archive_names=None, max_errors=50):
+    """
+    Streaming validation pass over a whole pack.
+
+    Returns:
+        (int, list): Valid row count, error messages ('line N: ...', at most `max_errors`)
+    """
+    valid = 0
+    errors = []
+    try:
+        for line_number, row in iter_rows(stream, fmt):
+            try:
+                clean_row(row, categories, archive_names)
+                valid += 1
+            except ValueError as e:
+                errors.append(f'line {line_number}: {e}')
+                if len(errors) >= max_errors:
+                    break
+    except ValueError as e:
+        errors.append(str(e))
+    return valid, errors
+
+
+# ------------------------------
+# Images
+# ------------------------------
+
+class ArchiveImages:
+    """
+    Images referenced by a pack, read from its zip archive.
+
+    Each archive member is optimized once; identical images (by optimized hash) reuse
+    the stored object of an existing question instead of being uploaded again.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.stored = {}  # (field_name, archive path) -> column values for that image field
+
+    def names(self):
+        return set(self.archive.namelist())
+
+    def prepare(self, rows):
+        """Optimize, upload and attach the images of one batch of cleaned rows in place."""
+        from .image_optimizer import processed_image_fields
+        from .uploads import optimize_upload
+        from helpers.cloudflare.storages import save_many
+
+        pending = {}  # (field_name, path) -> (hash, optimized bytes)
+        for values in rows:
+            for field_name in IMAGE_FIELDS:
+                path = values[field_name]
+                if not path or (field_name, path) in self.stored or (field_name, path) in pending:
+                    continue
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                optimized = optimize_upload(self.archive.read(path), path.rsplit('/', 1)[-1], content_type).read()
+                pending[(field_name, path)] = (hashlib.sha256(optimized).hexdigest(), optimized)
+
+        # Reuse objects already stored for identical images
+        for field_name in IMAGE_FIELDS:
+            hashes = {digest for (name, _path), (digest, _data) in pending.items() if name == field_name}
+            if not hashes:
+                continue
+            columns = [field_name, f'{field_name}_hash', f'{field_name}_variants',
+                       f'{field_name}_width', f'{field_name}_height', f'{field_name}_placeholder']
+            existing = {
+                row[f'{field_name}_hash']: row
+                for row in Question.objects.filter(**{f'{field_name}_hash__in': hashes}).values(*columns)
+            }
+            for key in [key for key in pending if key[0] == field_name and pending[key][0] in existing]:
+                self.stored[key] = existing[pending.pop(key)[0]]
+
+        # Upload the rest concurrently; one object per distinct image
+        by_hash = {}
+        for (field_name, path), (digest, data) in pending.items():
+            by_hash.setdefault((field_name, digest), []).append(path)
+        uploads = []
+        for (field_name, digest), paths in by_hash.items():
+            base = paths[0].rsplit('/', 1)[-1].rsplit('.', 1)[0]
+            target = Question._meta.get_field(field_name).generate_filename(None, f'{base}.webp')
+            uploads.append((field_name, digest, paths, target, pending[(field_name, paths[0])][1]))
+        results = save_many([(target, data) for _f, _d, _p, target, data in uploads]) if uploads else []
+
+        for (field_name, digest, paths, _target, data), result in zip(uploads, results):
+            if result['error']:
+                raise RuntimeError(f'Failed to upload {paths[0]}: {result["error"]}')
+            stored = {field_name: result['saved_name'], f'{field_name}_hash': digest}
+            stored.update(processed_image_fields(field_name, data, result['saved_name']))
+            for path in paths:
+                self.stored[(field_name, path)] = stored
+
+        for values in rows:
+            for field_name in IMAGE_FIELDS:
+                if values[field_name]:
+                    values.update(self.stored[(field_name, values[field_name])])
+
+
+# ------------------------------
+# Import
+# ------------------------------
+
+QUESTION_COLUMNS = [field for field in Question._meta.concrete_fields if not field.primary_key]
+
+
+def _copy_value(field, value):
+    """Encode one value for COPY ... FROM STDIN in PostgreSQL's text format."""
+    if value is None:
+        return '\\N'
+    if field.get_internal_type() == 'JSONField':
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_questions(questions):
+    """Insert Question instances with a single COPY statement (PostgreSQL only)."""
+    buffer = io.StringIO()
+    for question in questions:
+        buffer.write('\t'.join(
+            _copy_value(field, getattr(question, field.attname)) for field in QUESTION_COLUMNS
+        ))
+        buffer.write('\n')
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in QUESTION_COLUMNS)
+    sql = f'COPY {connection.ops.quote_name(Question._meta.db_table)} ({columns}) FROM STDIN'
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        if hasattr(cursor.cursor, 'copy_expert'):  # psycopg2
+            cursor.cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def insert_questions(questions, use_copy=None):
+    """Bulk-insert a batch without Question.save(); COPY on PostgreSQL unless disabled."""
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    if use_copy:
+        copy_questions(questions)
+    else:
+        Question.objects.bulk_create(questions, batch_size=500)
+
+
+def import_pack(stream, fmt, categories, images=None, batch_size=IMPORT_BATCH_SIZE, use_copy=None):
+    """
+    Insert every row of an already validated pack in batches.
+    Each batch is its own transaction, so a failure leaves earlier batches in place.
+    Imported questions are added to the search index at the end.
+
+    Returns:
+        int: Questions imported
+    """
+    imported = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        with transaction.atomic():
+            if images is not None:
+                images.prepare(batch)
+            questions = []
+            for values in batch:
+                category_id = values.pop('category_id') or categories.resolve(values['category_name'])
+                values.pop('category_name')
+                questions.append(Question(category_id=category_id, random_key=random_key(), **values))
+            insert_questions(questions, use_copy=use_copy)
+        imported += len(batch)
+        logger.info(f'📥 Imported {imported} questions')
+        batch.clear()
+
+    for _line_number, row in iter_rows(stream, fmt):
+        # Rows were validated in the first pass; re-cleaning is cheap and resolves new categories
+        batch.append(clean_row(row, categories))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if imported:
+        from .search import index_questions
+        index_questions(Question.objects.filter(search_entry__isnull=True))
+    return imported
+
+
+def open_archive(path):
+    """Open an images archive for reading; None when no archive was given."""
+    if not path:
+        return None
+    return ArchiveImages(zipfile.ZipFile(path))
+
+
+# ------------------------------
+# Export
+# ------------------------------
+
+def export_queryset(category_ids=None, official_only=False):
+    queryset = Question.objects.order_by('pk')
+    if category_ids:
+        queryset = queryset.filter(category_id__in=category_ids)
+    if official_only:
+        queryset = queryset.filter(category__is_custom=False)
+    return queryset
+
+
+def iter_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield export rows; iterator() streams through a server-side cursor on PostgreSQL."""
+    columns = [('category__name' if name == 'category' else name) for name in EXPORT_FIELDS]
+    for values in queryset.values_list(*columns).iterator(chunk_size=chunk_size):
+        yield dict(zip(EXPORT_FIELDS, values))
+
+
+def write_pack(rows, stream, fmt, archive=None):
+    """
+    Write rows to a text stream, adding each referenced image to `archive` (a ZipFile) once.
+
+    Returns:
+        (int, int): Rows written, images archived
+    """
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+
+    written = archived = 0
+    archived_names = set()
+    for row in rows:
+        if archive is not None:
+            for field_name in IMAGE_FIELDS:
+                name = row[field_name]
+                if not name or name in archived_names:
+                    continue
+                archived_names.add(name)
+                try:
+                    with default_storage.open(name, 'rb') as fh:
+                        archive.writestr(name, fh.read())
+                    archived += 1
+                except Exception as e:
+                    logger.warning(f'Could not archive {name}: {e}')
+                    row[field_name] = None
+
+        if writer is not None:
+            writer.writerow({key: ('' if value is None else value) for key, value in row.items()})
+        else:
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write('\n')
+        written += 1
+    return written, archived
@@ -0,0 +1,205 @@
+"""
+Full-text search over categories and questions (English and Arabic).
+
+Searchable text is copied into SearchEntry rows whenever a category or question is
+saved; bulk paths (add_questions, import_questions) index their rows set-based and
+`rebuild_search_index` rebuilds everything. Matching and ranking run in the database:
+a GIN-indexed tsvector on PostgreSQL, an FTS5 table on SQLite (see migration 0021).
+Other backends fall back to a plain substring filter.
+"""
+import logging
+import re
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Category, Question, SearchEntry
+
+logger = logging.getLogger(__name__)
+
+INDEX_BATCH_SIZE = 2000
+MAX_QUERY_TERMS = 8
+
+# websearch_to_tsquery understands quotes, OR and -exclusions; both configurations are tried
+POSTGRES_TSQUERY = "(websearch_to_tsquery('english', %s) || websearch_to_tsquery('arabic', %s))"
+
+
+def category_entry(category):
+    return SearchEntry(
+        kind='category',
+        category_id=category.pk,
+        title=category.name or '',
+        body=category.description or '',
+    )
+
+
+def question_entry(question):
+    return SearchEntry(
+        kind='question',
+        category_id=question.category_id,
+        question_id=question.pk,
+        title=question.text or '',
+        title_ar=question.text_ar or '',
+        body=question.answer or '',
+        body_ar=question.answer_ar or '',
+    )
+
+
+@receiver(post_save, sender=Category, dispatch_uid='search_index_category')
+def index_category(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    entry = category_entry(instance)
+    SearchEntry.objects.update_or_create(
+        kind='category', category_id=instance.pk,
+        defaults={'title': entry.title, 'body': entry.body},
+    )
+
+
+@receiver(post_save, sender=Question, dispatch_uid='search_index_question')
+def index_question(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    entry = question_entry(instance)
+    SearchEntry.objects.update_or_create(
+        question_id=instance.pk,
+        defaults={
+            'kind': 'question', 'category_id': entry.category_id, 'title': entry.title,
+            'title_ar': entry.title_ar, 'body': entry.body, 'body_ar': entry.body_ar,
+        },
+    )
+
+
+def index_questions(queryset, batch_size=INDEX_BATCH_SIZE):
+    """
+    (Re)index many questions set-based, for paths that skip save() signals.
+
+    Returns:
+        int: Questions indexed
+    """
+    indexed = 0
+    queryset = queryset.order_by('pk').only('pk', 'category_id', 'text', 'text_ar', 'answer', 'answer_ar')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            SearchEntry.objects.filter(question_id__in=[q.pk for q in batch]).delete()
+            SearchEntry.objects.bulk_create([question_entry(q) for q in batch])
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+    return indexed
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE):
+    """
+    Rebuild every search entry from the current categories and questions.
+
+    Returns:
+        dict: {'categories': int, 'questions': int}
+    """
+    with transaction.atomic():
+        SearchEntry.objects.filter(kind='category').delete()
+        categories = [category_entry(c) for c in Category.objects.only('pk', 'name', 'description')]
+        SearchEntry.objects.bulk_create(categories, batch_size=batch_size)
+
+    # Questions are replaced batch by batch, so search keeps working during a rebuild
+    questions = index_questions(Question.objects.all(), batch_size=batch_size)
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO content_searchentry_fts (content_searchentry_fts) VALUES ('rebuild')")
+    return {'categories': len(categories), 'questions': questions}
+
+
+def query_terms(query):
+    """Words of a user query (letters and digits in any script), at most MAX_QUERY_TERMS."""
+    return re.findall(r'\w+', query or '')[:MAX_QUERY_TERMS]
+
+
+def fts5_match(terms):
+    """FTS5 MATCH expression: every term must occur, the last one as a prefix (search-as-you-type)."""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_entries(query, kind):
+    """
+    Matching SearchEntry rows of one kind, annotated with `rank` (higher is better)
+    and ordered best first. Returns an empty queryset for a query without words.
+    """
+    entries = SearchEntry.objects.filter(kind=kind)
+    terms = query_terms(query)
+    if not terms:
+        return entries.none()
+
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        text = query.strip()
+        entries = entries.filter(
+            RawSQL(f'"content_searchentry"."document" @@ {POSTGRES_TSQUERY}', [text, text], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'ts_rank_cd("content_searchentry"."document", {POSTGRES_TSQUERY})', [text, text], output_field=FloatField())
+        )
+    elif vendor == 'sqlite':
+        match = fts5_match(terms)
+        entries = entries.filter(
+            RawSQL(
+                '"content_searchentry"."id" IN (SELECT rowid FROM content_searchentry_fts WHERE content_searchentry_fts MATCH %s)',
+                [match], output_field=BooleanField(),
+            )
+        ).annotate(
+            # bm25() is lower-is-better; titles weigh more than answers/descriptions
+            rank=RawSQL(
+                '(SELECT -bm25(content_searchentry_fts, 10.0, 10.0, 2.0, 2.0) FROM content_searchentry_fts '
+                'WHERE content_searchentry_fts MATCH %s AND rowid = "content_searchentry"."id")',
+                [match], output_field=FloatField(),
+            )
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(title__icontains=term) | Q(title_ar__icontains=term) |
+                Q(body__icontains=term) | Q(body_ar__icontains=term)
+            )
+        entries = entries.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+    return entries.order_by('-rank', 'pk')
+
+
+def visible_category_filter(user, prefix='category__'):
+    """Categories a user may discover: visible official ones and approved public custom ones (staff: all)."""
+    if user.is_authenticated and user.is_staff:
+        return Q()
+    visible = Q(**{f'{prefix}is_hidden': False}) & (
+        Q(**{f'{prefix}is_custom': False}) |
+        Q(**{f'{prefix}is_approved': True, f'{prefix}privacy': 'public'})
+    )
+    if user.is_authenticated:
+        visible |= Q(**{f'{prefix}created_by': user})
+    return visible
+
+
+def search_categories(query, user):
+    """Ranked categories matching `query` (as SearchEntry rows, category preloaded)."""
+    return search_entries(query, 'category').filter(visible_category_filter(user)).select_related('category')
+
+
+def search_questions(query, category_id=None):
+    """Ranked questions matching `query` (staff/editor use)."""
+    entries = search_entries(query, 'question').select_related('question', 'category')
+    if category_id is not None:
+        entries = entries.filter(category_id=category_id)
+    return entries
+
+
+def matching_ids(query, kind, limit=None):
+    """Primary keys of the best matches, for admin changelist filtering."""
+    column = 'question_id' if kind == 'question' else 'category_id'
+    ids = search_entries(query, kind).values_list(column, flat=True)
+    return list(ids[:limit] if limit else ids)
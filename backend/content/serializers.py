@@ -1,6 +1,7 @@
 
 from rest_framework import serializers
-from .models import Collection, Category, Question, CategoryLike
+from .models import Collection, Category, Question, CategoryLike, MediaUpload, UploadSession
+from .image_optimizer import variants_srcset
 
 
 class CollectionSerializer(serializers.ModelSerializer):
@@ -25,10 +26,11 @@ class CategoryBasicSerializer(serializers.ModelSerializer):
     """Lightweight serializer for Category - used in nested serialization to avoid N+1 queries"""
     is_premium = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'locked', 'is_premium', 'image', 'description']
+        fields = ['id', 'name', 'locked', 'is_premium', 'image', 'image_srcset', 'image_width', 'image_height', 'image_placeholder', 'description']
     
     def get_is_premium(self, obj):
         return obj.locked
@@ -40,6 +42,9 @@ class CategoryBasicSerializer(serializers.ModelSerializer):
                 url = f'https://{url}'
             return url
         return None
+    
+    def get_image_srcset(self, obj):
+        return variants_srcset(obj.image_variants) if obj.image else None
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -49,11 +54,12 @@ class CategorySerializer(serializers.ModelSerializer):
     user_played_questions = serializers.SerializerMethodField()
     is_premium = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     created_by_id = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
-        fields = ['id', 'name', 'locked', 'is_premium', 'image', 'description', 'questions_count', 'total_questions', 'user_played_questions', 'is_custom', 'is_approved', 'privacy', 'created_by_id']
+        fields = ['id', 'name', 'locked', 'is_premium', 'image', 'image_srcset', 'image_width', 'image_height', 'image_placeholder', 'description', 'questions_count', 'total_questions', 'user_played_questions', 'is_custom', 'is_approved', 'privacy', 'created_by_id']
         
     def get_questions_count(self, obj):
         return obj.question_set.count()
@@ -91,6 +97,10 @@ class CategorySerializer(serializers.ModelSerializer):
                 url = f'https://{url}'
             return url
         return None
+    
+    def get_image_srcset(self, obj):
+        """Responsive URLs per format, e.g. {'webp': 'url 480w, url 1280w'}; None if no variants"""
+        return variants_srcset(obj.image_variants) if obj.image else None
 
 
 class UserQuestionSerializer(serializers.ModelSerializer):
@@ -235,6 +245,7 @@ class UserCategorySerializer(serializers.ModelSerializer):
     user_played_questions = serializers.SerializerMethodField()
     is_premium = serializers.SerializerMethodField()  # mirror locked mapping for consistency with CategorySerializer
     image_url = serializers.SerializerMethodField()  # Renamed to avoid conflict with writable image field
+    image_srcset = serializers.SerializerMethodField()
     is_saved = serializers.SerializerMethodField()
     saves_count = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
@@ -243,7 +254,7 @@ class UserCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = [
-            'id', 'name', 'description', 'image', 'image_url', 'privacy', 
+            'id', 'name', 'description', 'image', 'image_url', 'image_srcset', 'image_width', 'image_height', 'image_placeholder', 'privacy', 
             'is_custom', 'is_approved', 'created_by', 'created_by_id', 'created_by_username', 'created_by_avatar',
             'created_by_is_premium', 'created_at', 'updated_at', 'questions_count', 'total_questions', 'user_played_questions',
             'is_premium', 'is_saved', 'saves_count', 'likes_count', 'is_liked'
@@ -302,27 +313,9 @@ class UserCategorySerializer(serializers.ModelSerializer):
         if not obj.created_by:
             return False
 
-        try:
-            # Prefer a direct `is_premium` attribute on User (helper that reads UserProfile)
-            if hasattr(obj.created_by, 'is_premium'):
-                return bool(getattr(obj.created_by, 'is_premium'))
-
-            # Fallback: check UserProfile attached to the user
-            userprofile = getattr(obj.created_by, 'userprofile', None)
-            if userprofile is not None:
-                return bool(getattr(userprofile, 'is_premium', False))
-
-            # Legacy fallback for old Membership model (if still present)
-            if hasattr(obj.created_by, 'membership'):
-                try:
-                    membership = getattr(obj.created_by, 'membership')
-                    return bool(membership.is_active_premium())
-                except Exception:
-                    return False
-        except Exception:
-            return False
-
-        return False
+        # Querysets select_related('created_by__userprofile'), so this reads the joined row
+        from authentication.entitlements import entitlements_for
+        return entitlements_for(obj.created_by).is_premium
     
     def get_created_by_avatar(self, obj):
         """Get the avatar URL of the user who created this category"""
@@ -345,18 +338,25 @@ class UserCategorySerializer(serializers.ModelSerializer):
             return url
         return None
 
+    def get_image_srcset(self, obj):
+        return variants_srcset(obj.image_variants) if obj.image else None
+
 
 class QuestionSerializer(serializers.ModelSerializer):
     """Serializer for Question model - handles both read and write for images"""
     category = CategoryBasicSerializer(read_only=True)  # Use lightweight serializer to avoid N+1 queries
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
+    answer_image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Question
         fields = [
             'id', 'category', 'category_name', 'text', 'text_ar', 
             'answer', 'choice_2', 'choice_3', 'choice_4', 'answer_ar', 
-            'image', 'answer_image',
+            'image', 'answer_image', 'image_srcset', 'answer_image_srcset',
+            'image_width', 'image_height', 'image_placeholder',
+            'answer_image_width', 'answer_image_height', 'answer_image_placeholder',
             'difficulty', 'points'
         ]
     
@@ -387,6 +387,12 @@ class QuestionSerializer(serializers.ModelSerializer):
             
         return data
 
+    def get_image_srcset(self, obj):
+        return variants_srcset(obj.image_variants) if obj.image else None
+
+    def get_answer_image_srcset(self, obj):
+        return variants_srcset(obj.answer_image_variants) if obj.answer_image else None
+
     def to_representation(self, instance):
         """Transform image fields to URLs when reading"""
         data = super().to_representation(instance)
@@ -412,3 +418,76 @@ class QuestionSerializer(serializers.ModelSerializer):
             data['answer_image'] = None
         
         return data
+
+
+class MediaUploadRequestSerializer(serializers.Serializer):
+    """Input for requesting a direct-to-storage upload slot"""
+    purpose = serializers.ChoiceField(choices=MediaUpload.PURPOSE_CHOICES)
+    content_type = serializers.CharField(max_length=50)
+    size = serializers.IntegerField(min_value=1)
+    target_id = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+
+
+class MediaUploadSerializer(serializers.ModelSerializer):
+    """Status of a direct-to-storage upload"""
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MediaUpload
+        fields = ['id', 'purpose', 'target_id', 'key', 'content_type', 'size', 'status', 'result', 'result_url', 'error', 'created_at']
+        read_only_fields = fields
+
+    def get_result_url(self, obj):
+        if not obj.result:
+            return None
+        from django.core.files.storage import default_storage
+        url = default_storage.url(obj.result)
+        return url.replace('http://', 'https://', 1) if url.startswith('http://') else url
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    """Input for opening a resumable upload session"""
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=50)
+    size = serializers.IntegerField(min_value=1)
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True, default='')
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """State of a resumable upload session (clients resume from `received`)"""
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'size', 'received', 'status', 'error', 'created_at']
+        read_only_fields = fields
+
+
+class ManifestQuestionSerializer(serializers.ModelSerializer):
+    """A question in a category manifest; images reference finished upload sessions"""
+    image = serializers.UUIDField(required=False, allow_null=True)
+    answer_image = serializers.UUIDField(required=False, allow_null=True)
+
+    class Meta:
+        model = Question
+        fields = ['text', 'answer', 'image', 'answer_image']
+
+
+class CategoryManifestSerializer(serializers.ModelSerializer):
+    """
+    Compact JSON description of a new user category. Images are upload session ids
+    instead of file parts, so the commit request itself carries no image bytes.
+    """
+    image = serializers.UUIDField(required=False, allow_null=True)
+    questions = ManifestQuestionSerializer(many=True, required=False)
+
+    class Meta:
+        model = Category
+        fields = ['name', 'description', 'image', 'privacy', 'questions']
+
+    def asset_ids(self):
+        """Every upload session id the manifest references"""
+        data = self.validated_data
+        refs = [data.get('image')]
+        for question in data.get('questions', []):
+            refs += [question.get('image'), question.get('answer_image')]
+        return {str(ref) for ref in refs if ref}
@@ -0,0 +1,194 @@
+"""
+Collection sprite atlases.
+
+Each collection's visible category thumbnails are packed into a single WebP atlas
+(pyvips arrayjoin) so the category grid loads one image per collection instead of
+one per category. Atlases are published under a content-hashed name, so they can be
+cached forever by browsers and the CDN; a change in membership or images produces a
+new name. Rebuilds triggered by category edits run in a Celery task
+(content.tasks.rebuild_collection_sprites), outside the request.
+"""
+import hashlib
+import logging
+import math
+from datetime import timedelta
+
+import pyvips
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Collection, Category, StorageDeletion
+
+logger = logging.getLogger(__name__)
+
+SPRITE_TILE = 128      # Each category thumbnail is a TILE x TILE square
+SPRITE_COLUMNS = 8     # Tiles per atlas row
+SPRITE_QUALITY = 80
+# Replaced atlases outlive the 15-minute with_categories cache that may still point at them
+OLD_SPRITE_GRACE = timedelta(hours=1)
+
+
+def sprite_categories(collection):
+    """Categories that appear in the collection grid and have an image, in a stable order."""
+    return (
+        collection.categories
+        .filter(is_custom=False, is_hidden=False)
+        .exclude(image__isnull=True)
+        .exclude(image='')
+        .only('id', 'image', 'image_variants')
+        .order_by('id')
+    )
+
+
+def _thumbnail_source(category):
+    """Smallest stored rendition of the category image - saves downloading full-size files."""
+    variants = category.image_variants or {}
+    smallest = min(variants.values(), key=lambda entry: entry.get('width', 0), default=None)
+    if smallest and smallest.get('webp'):
+        return smallest['webp']
+    return category.image.name
+
+
+def _tile(image_bytes):
+    """Centre-cropped RGBA square so every tile can be joined into one image."""
+    tile = pyvips.Image.thumbnail_buffer(image_bytes, SPRITE_TILE, height=SPRITE_TILE, crop='centre')
+    if tile.interpretation != 'srgb':
+        tile = tile.colourspace('srgb')
+    if tile.bands == 3:
+        tile = tile.bandjoin(255)
+    # Pad anything smaller than a full tile (tiny sources are never upscaled by thumbnail)
+    if tile.width != SPRITE_TILE or tile.height != SPRITE_TILE:
+        tile = tile.gravity('centre', SPRITE_TILE, SPRITE_TILE, extend='background', background=[0, 0, 0, 0])
+    return tile
+
+
+def build_collection_sprite(collection, force=False):
+    """
+    (Re)build the sprite atlas for one collection.
+
+    The inputs (category ids + image paths) are hashed into sprite_signature, so an
+    unchanged collection costs a single query. Only tiles that made it into the atlas
+    are hashed, so a category whose image failed to download is retried next time.
+    The previous atlas is journaled for deletion after OLD_SPRITE_GRACE, since cached
+    with_categories payloads may still reference it.
+
+    Returns:
+        bool: True if the stored sprite changed
+    """
+    categories = list(sprite_categories(collection))
+    if not force and _signature(categories) == collection.sprite_signature:
+        return False
+
+    previous = collection.sprite.name if collection.sprite else ''
+    tiles = []
+    tiled = []
+    sprite_map = {}
+    for category in categories:
+        source = _thumbnail_source(category)
+        try:
+            with default_storage.open(source, 'rb') as fh:
+                tiles.append(_tile(fh.read()))
+        except Exception as e:
+            logger.warning(f"Skipping category {category.id} in sprite for collection {collection.id}: {e}")
+            continue
+        tiled.append(category)
+        index = len(tiles) - 1
+        sprite_map[str(category.id)] = [
+            (index % SPRITE_COLUMNS) * SPRITE_TILE,
+            (index // SPRITE_COLUMNS) * SPRITE_TILE,
+        ]
+
+    sprite = ''
+    if tiles:
+        columns = min(SPRITE_COLUMNS, len(tiles))
+        atlas = pyvips.Image.arrayjoin(tiles, across=columns, background=[0, 0, 0, 0])
+        data = atlas.webpsave_buffer(Q=SPRITE_QUALITY, strip=True)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        name = f"sprites/collection-{collection.id}-{digest}.webp"
+        # Content-addressed: identical bytes are already published under this name
+        sprite = name if default_storage.exists(name) else default_storage.save(name, ContentFile(data))
+        logger.info(
+            f"🧩 Built sprite for collection {collection.id}: {len(tiles)} tiles, "
+            f"{columns}x{math.ceil(len(tiles) / columns)} grid, {len(data)} bytes → {sprite}"
+        )
+
+    signature = _signature(tiled)
+    collection.sprite = sprite
+    collection.sprite_map = sprite_map
+    collection.sprite_signature = signature
+    with transaction.atomic():
+        Collection.objects.filter(pk=collection.pk).update(
+            sprite=sprite, sprite_map=sprite_map, sprite_signature=signature
+        )
+        if previous and previous != sprite:
+            # Flushed by the periodic flush-storage-deletions task once due
+            StorageDeletion.objects.create(
+                key=previous, source=previous, next_attempt_at=timezone.now() + OLD_SPRITE_GRACE,
+            )
+    return True
+
+
+def _signature(categories):
+    return hashlib.sha256(
+        f"{SPRITE_TILE}:{SPRITE_COLUMNS}|".encode('utf-8') +
+        '|'.join(f"{c.id}:{c.image.name}" for c in categories).encode('utf-8')
+    ).hexdigest()
+
+
+def rebuild_collection_sprites(collection_ids=None, force=False):
+    """
+    Rebuild sprites for the given collections (all when None) and drop the cached
+    with_categories payload if any atlas changed. Never raises - sprites are an
+    optimization and the grid still works from per-category images.
+
+    Returns:
+        int: Number of collections whose sprite changed
+    """
+    collections = Collection.objects.all()
+    if collection_ids is not None:
+        collections = collections.filter(pk__in=[pk for pk in collection_ids if pk])
+
+    changed = 0
+    for collection in collections:
+        try:
+            changed += build_collection_sprite(collection, force=force)
+        except Exception as e:
+            logger.warning(f"Sprite build failed for collection {collection.id}: {e}", exc_info=True)
+
+    if changed:
+        cache.delete_many([f'v1:collections:with_categories:{tier}' for tier in ('premium', 'free')])
+    return changed
+
+
+def queue_sprite_rebuild(collection_ids, force=False):
+    """Rebuild the given collections' sprites in a background task once the current transaction commits."""
+    collection_ids = sorted({pk for pk in collection_ids if pk})
+    if collection_ids:
+        from .tasks import rebuild_collection_sprites as rebuild_task
+        transaction.on_commit(lambda: rebuild_task.delay(collection_ids, force=force))
+    return len(collection_ids)
+
+
+def sprite_payload(collection):
+    """Sprite reference for API responses, or None when the collection has no atlas."""
+    if not collection.sprite:
+        return None
+    url = collection.sprite.url
+    if url.startswith('http://'):
+        url = url.replace('http://', 'https://', 1)
+    return {
+        'url': url,
+        'tile': SPRITE_TILE,
+        'map': collection.sprite_map,
+    }
+
+
+@receiver(post_delete, sender=Category)
+def rebuild_sprite_on_category_delete(sender, instance, **kwargs):
+    if instance.collection_id:
+        queue_sprite_rebuild([instance.collection_id])
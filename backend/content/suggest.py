@@ -0,0 +1,132 @@
+"""
+In-process prefix index for category typeahead.
+
+Every worker keeps the names of discoverable categories (visible official ones and
+approved public custom ones) in two sorted arrays - whole names and individual
+words - and answers prefix queries with bisect, without touching the database.
+
+The index is versioned by the categories table itself - the latest `updated_at` and
+the row count - so every worker sees the same version whatever cache backend runs.
+A worker re-reads that aggregate at most every SUGGEST_VERSION_CHECK_SECONDS and
+rebuilds its copy when it moved. Saves stamp `updated_at` and deletes change the
+count; set-based updates must stamp `updated_at` themselves (see touch_fields()).
+"""
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_VERSION_CHECK_SECONDS = 2
+SUGGEST_MAX_RESULTS = 20
+
+
+def normalize(text):
+    """Case-fold and strip diacritics (Latin accents, Arabic harakat) for matching."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).strip()
+
+
+def content_version():
+    """Version of the suggestible data: (latest updated_at, row count) of the categories table."""
+    stats = Category.objects.aggregate(updated=Max('updated_at'), total=Count('pk'))
+    updated = stats['updated']
+    return f"{updated.timestamp() if updated else 0:.6f}:{stats['total']}"
+
+
+def touch_fields():
+    """Extra fields for set-based category updates, so workers notice the change."""
+    return {'updated_at': timezone.now()}
+
+
+class CategoryPrefixIndex:
+    """Immutable snapshot of suggestible categories; rebuilt, never mutated."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.items = {}
+        names, words = [], []
+        for row in rows:
+            key = normalize(row['name'])
+            if not key:
+                continue
+            self.items[row['id']] = {
+                'id': row['id'],
+                'name': row['name'],
+                'is_custom': row['is_custom'],
+                'locked': row['locked'],
+            }
+            names.append((key, row['id']))
+            for word in key.split()[1:]:
+                words.append((word, row['id']))
+        self.names = sorted(names)
+        self.words = sorted(words)
+
+    @classmethod
+    def build(cls, version):
+        rows = Category.objects.filter(is_hidden=False).filter(
+            Q(is_custom=False) | Q(is_approved=True, privacy='public')
+        ).values('id', 'name', 'is_custom', 'locked')
+        return cls(list(rows), version)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Categories whose name, or a later word of it, starts with `prefix`.
+        Whole-name matches come first, then word matches, alphabetically within each.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        for keys in (self.names, self.words):
+            position = bisect_left(keys, (prefix,))
+            while position < len(keys) and len(found) < limit:
+                key, category_id = keys[position]
+                if not key.startswith(prefix):
+                    break
+                if category_id not in seen:
+                    seen.add(category_id)
+                    found.append(self.items[category_id])
+                position += 1
+        return found
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """The current index, rebuilt when the content version changed."""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < SUGGEST_VERSION_CHECK_SECONDS:
+        return _index
+
+    version = content_version()
+    if _index is not None and _index.version == version:
+        _checked_at = now
+        return _index
+
+    with _lock:
+        if _index is None or _index.version != version:
+            started = time.monotonic()
+            _index = CategoryPrefixIndex.build(version)
+            logger.info(
+                f"🔤 Built category prefix index v{version}: {len(_index.items)} categories "
+                f"in {(time.monotonic() - started) * 1000:.1f}ms"
+            )
+        _checked_at = now
+    return _index
+
+
+def suggest_categories(prefix, limit=10):
+    return get_index().suggest(prefix, min(limit, SUGGEST_MAX_RESULTS))
@@ -0,0 +1,63 @@
+"""
+Background tasks for the content app.
+Run eagerly in-process when no CELERY_BROKER_URL is configured.
+"""
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_media_upload(self, upload_id):
+    """Optimize a confirmed direct upload from storage and attach it to its target."""
+    from .models import MediaUpload
+    from .uploads import process_upload, fail_upload
+
+    upload = MediaUpload.objects.select_related('user').filter(pk=upload_id, status='processing').first()
+    if upload is None:
+        return  # Already handled (duplicate delivery) or the slot was removed
+
+    try:
+        process_upload(upload)
+    except ValueError as e:
+        fail_upload(upload, e)
+    except Exception as e:
+        if self.request.is_eager:
+            # Running inside the confirm request (no broker): don't retry inline. The upload
+            # stays 'processing' with its staged object, so a re-queue can still finish it;
+            # cleanup_media_uploads removes it if nothing does.
+            logger.error(f"Direct upload {upload_id} failed: {e}", exc_info=True)
+            return
+        if self.request.retries >= self.max_retries:
+            fail_upload(upload, e)
+            return
+        logger.warning(f"Retrying direct upload {upload_id}: {e}")
+        raise self.retry(exc=e)
+
+
+@shared_task
+def rebuild_collection_sprites(collection_ids, force=False):
+    """Rebuild category sprite atlases after edits (see content/sprites.py)."""
+    from .sprites import rebuild_collection_sprites as rebuild
+    rebuild(collection_ids, force=force)
+
+
+@shared_task
+def flush_storage_deletions():
+    """Delete journaled media objects from storage in batches (see helpers/cloudflare/post_delete.py)."""
+    from helpers.cloudflare.post_delete import flush_storage_deletions as flush
+    flush()
+
+
+@shared_task
+def run_deletion_job(job_id):
+    """Chunked deletion of a soft-hidden user or category (see content/deletion.py)."""
+    from .deletion import run_deletion_job as run
+    from .models import DeletionJob
+
+    job = DeletionJob.objects.filter(pk=job_id, status__in=['queued', 'failed']).first()
+    if job is None:
+        return  # Already running or finished (duplicate delivery)
+    run(job)
@@ -1,3 +1,743 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import boto3
+import pyvips
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from moto import mock_aws
+from rest_framework.test import APIClient
+
+from authentication.models import UserProfile
+from .models import Category, Collection, DeletionJob, MediaUpload, StorageDeletion
+from .tasks import process_media_upload
+
+TEST_BUCKET = 'media-test'
+
+# Media storage pointed at moto's in-process S3 stand-in instead of R2
+TEST_STORAGES = {
+    'default': {
+        'BACKEND': 'helpers.cloudflare.storages.CachedMediaFileStorage',
+        'OPTIONS': {
+            'bucket_name': TEST_BUCKET,
+            'endpoint_url': None,
+            'region_name': 'us-east-1',
+            'access_key': 'testing',
+            'secret_key': 'testing',
+            'default_acl': None,
+            'querystring_auth': True,
+        },
+    },
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+def jpeg_bytes(width=640, height=480):
+    return (pyvips.Image.black(width, height, bands=3) + [200, 30, 30]).jpegsave_buffer()
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='', SECURE_SSL_REDIRECT=False)
+class MediaUploadFlowTests(TestCase):
+    """presign -> PUT -> confirm -> process_media_upload against a local S3 stand-in"""
+
+    def setUp(self):
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=TEST_BUCKET)
+        cache.clear()
+        caches['media-metadata'].clear()
+
+        self.user = User.objects.create_user(username='uploader', email='uploader@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request_slot(self, data, content_type='image/jpeg', size=None):
+        response = self.client.post('/api/content/uploads/', {
+            'purpose': 'avatar',
+            'content_type': content_type,
+            'size': len(data) if size is None else size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def put(self, slot, data, headers=None):
+        response = requests.put(slot['upload']['url'], data=data, headers=headers or slot['upload']['headers'])
+        self.assertEqual(response.status_code, 200, response.text)
+
+    def confirm(self, slot):
+        return self.client.post(f"/api/content/uploads/{slot['id']}/confirm/", {'key': slot['key']}, format='json')
+
+    def test_upload_is_optimized_and_attached(self):
+        data = jpeg_bytes()
+        slot = self.request_slot(data)
+        self.put(slot, data)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.confirm(slot)
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['status'], 'processing')
+        self.assertEqual(len(callbacks), 1)
+
+        process_media_upload.apply(args=[slot['id']])
+
+        upload = MediaUpload.objects.get(pk=slot['id'])
+        self.assertEqual(upload.status, 'done', upload.error)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.avatar.name, upload.result)
+        # The staging object is removed once attached
+        s3 = boto3.client('s3', region_name='us-east-1')
+        staged = s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix=f"media/{slot['key']}")
+        self.assertEqual(staged.get('KeyCount'), 0)
+
+    def test_confirm_before_put_is_rejected(self):
+        slot = self.request_slot(jpeg_bytes())
+        response = self.confirm(slot)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MediaUpload.objects.get(pk=slot['id']).status, 'pending')
+
+    def test_size_mismatch_is_rejected(self):
+        data = jpeg_bytes()
+        slot = self.request_slot(data)
+        # Bypass the presigned URL so the stored object differs from the declared size
+        boto3.client('s3', region_name='us-east-1').put_object(
+            Bucket=TEST_BUCKET, Key=f"media/{slot['key']}", Body=data + b'extra', ContentType='image/jpeg',
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.confirm(slot)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.data['error'])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(MediaUpload.objects.get(pk=slot['id']).status, 'pending')
+
+    def test_content_type_mismatch_is_rejected(self):
+        data = jpeg_bytes()
+        slot = self.request_slot(data)
+        boto3.client('s3', region_name='us-east-1').put_object(
+            Bucket=TEST_BUCKET, Key=f"media/{slot['key']}", Body=data, ContentType='image/png',
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.confirm(slot)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type', response.data['error'])
+        self.assertEqual(callbacks, [])
+
+    def test_mislabelled_file_fails_processing(self):
+        data = b'not really an image' * 64
+        slot = self.request_slot(data)
+        self.put(slot, data)
+        with self.captureOnCommitCallbacks():
+            self.assertEqual(self.confirm(slot).status_code, 202)
+
+        process_media_upload.apply(args=[slot['id']])
+
+        upload = MediaUpload.objects.get(pk=slot['id'])
+        self.assertEqual(upload.status, 'failed')
+        self.assertTrue(upload.error)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exclude(avatar='').exists())
+
+    def test_unsupported_type_and_oversize_slots_are_refused(self):
+        response = self.client.post('/api/content/uploads/', {
+            'purpose': 'avatar', 'content_type': 'application/pdf', 'size': 100,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with self.settings(MEDIA_UPLOAD_MAX_MB=1):
+            response = self.client.post('/api/content/uploads/', {
+                'purpose': 'avatar', 'content_type': 'image/jpeg', 'size': 2 * 1024 * 1024,
+            }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_confirm_with_wrong_key_is_rejected(self):
+        slot = self.request_slot(jpeg_bytes())
+        response = self.client.post(f"/api/content/uploads/{slot['id']}/confirm/", {'key': 'uploads/other.jpg'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_storage_errors_are_not_retried_inline_when_eager(self):
+        data = jpeg_bytes()
+        slot = self.request_slot(data)
+        self.put(slot, data)
+        with self.captureOnCommitCallbacks():
+            self.confirm(slot)
+
+        with mock.patch('content.uploads.default_storage.open', side_effect=OSError('storage down')) as opened:
+            process_media_upload.apply(args=[slot['id']])
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(MediaUpload.objects.get(pk=slot['id']).status, 'processing')
+
+        # The staged object is kept, so a re-queue finishes the upload
+        process_media_upload.apply(args=[slot['id']])
+        self.assertEqual(MediaUpload.objects.get(pk=slot['id']).status, 'done')
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='')
+class CachedMediaStorageTests(TestCase):
+    """Metadata memo and local-disk cache of CachedMediaFileStorage"""
+
+    def setUp(self):
+        from helpers.cloudflare import storages as storage_module
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=TEST_BUCKET)
+        cache.clear()
+        caches['media-metadata'].clear()
+        storage_module._disk_usage.clear()
+        self.disk_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.disk_dir, True)
+
+    def storage(self, **options):
+        config = {**TEST_STORAGES['default'], 'OPTIONS': {**TEST_STORAGES['default']['OPTIONS'], **options}}
+        return storages.create_storage(config)
+
+    def test_memo_lives_in_its_own_cache(self):
+        storage = self.storage()
+        name = storage.save('memo/a.txt', ContentFile(b'hello'))
+        self.s3.delete_object(Bucket=TEST_BUCKET, Key=f'media/{name}')
+
+        self.assertTrue(storage.exists(name))  # Memoized by the save, no round trip
+        self.assertEqual(storage.size(name), 5)
+        self.assertFalse(cache._cache)  # Nothing landed in (or culled) the default cache
+        caches['media-metadata'].clear()
+        self.assertFalse(storage.exists(name))
+
+    def test_positive_answers_expire_after_metadata_timeout(self):
+        storage = self.storage(metadata_timeout=1)
+        name = storage.save('memo/b.txt', ContentFile(b'hello'))
+        self.s3.delete_object(Bucket=TEST_BUCKET, Key=f'media/{name}')
+        later = time.time() + 5
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: later)):
+            self.assertFalse(storage.exists(name))
+
+    def test_open_falls_back_to_r2_when_the_disk_copy_vanishes(self):
+        storage = self.storage(disk_cache_dir=self.disk_dir)
+        name = storage.save('disk/c.txt', ContentFile(b'cached bytes'))
+        storage.open(name).close()  # Populates the disk copy
+        self.assertTrue(os.path.exists(storage._disk_path(name)))
+
+        # Evicted by another worker between the exists() check and the open
+        with mock.patch('helpers.cloudflare.storages.os.utime', side_effect=FileNotFoundError):
+            with storage.open(name) as fh:
+                self.assertEqual(fh.read(), b'cached bytes')
+
+    def test_disk_cache_stays_within_budget_without_walking_on_every_miss(self):
+        storage = self.storage(disk_cache_dir=self.disk_dir, disk_cache_max_bytes=4000)
+        names = [storage.save(f'disk/{i}.bin', ContentFile(bytes([i]) * 900)) for i in range(8)]
+
+        with mock.patch('helpers.cloudflare.storages.os.walk', wraps=os.walk) as walk:
+            for name in names:
+                storage.open(name).close()
+
+        on_disk = sum(
+            os.path.getsize(os.path.join(root, f)) for root, _dirs, files in os.walk(self.disk_dir) for f in files
+        )
+        self.assertLessEqual(on_disk, 4000)
+        # One walk to establish the count, then only when the budget is crossed
+        self.assertLess(walk.call_count, len(names))
+        self.assertTrue(os.path.exists(storage._disk_path(names[-1])))
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='')
+class CollectionSpriteTests(TestCase):
+    def setUp(self):
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=TEST_BUCKET)
+        caches['media-metadata'].clear()
+        self.collection = Collection.objects.create(name='History')
+
+    def category(self, name, image):
+        category = Category.objects.create(name=name, collection=self.collection)
+        Category.objects.filter(pk=category.pk).update(image=image)
+        return category
+
+    def test_category_save_queues_a_background_rebuild(self):
+        with mock.patch('content.tasks.rebuild_collection_sprites.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name='Rome', collection=self.collection)
+        delay.assert_called_once_with([self.collection.pk], force=False)
+
+    def test_failed_tiles_are_left_out_of_the_signature(self):
+        from django.core.files.storage import default_storage
+        from .sprites import build_collection_sprite
+        stored = default_storage.save('categories/rome.jpg', ContentFile(jpeg_bytes()))
+        rome = self.category('Rome', stored)
+        self.category('Greece', 'categories/missing.jpg')
+
+        self.assertTrue(build_collection_sprite(self.collection))
+        self.assertEqual(list(self.collection.sprite_map), [str(rome.pk)])
+        # The missing image is retried on the next rebuild instead of being stamped as done
+        self.assertTrue(build_collection_sprite(self.collection))
+
+    def test_replaced_atlas_is_deleted_after_a_grace_period(self):
+        from django.core.files.storage import default_storage
+        from .sprites import build_collection_sprite
+        self.category('Rome', default_storage.save('categories/rome.jpg', ContentFile(jpeg_bytes())))
+        build_collection_sprite(self.collection)
+        first = self.collection.sprite.name
+        self.category('Greece', default_storage.save('categories/greece.jpg', ContentFile(jpeg_bytes(320, 200))))
+
+        self.assertTrue(build_collection_sprite(self.collection))
+        self.assertNotEqual(self.collection.sprite.name, first)
+        self.assertTrue(default_storage.exists(first))
+        pending = StorageDeletion.objects.get(key=first)
+        self.assertGreater(pending.next_attempt_at, timezone.now())
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='')
+class StorageDeletionJournalTests(TestCase):
+    """Deleted rows journal their files; flushes delete them from storage in batches"""
+
+    def setUp(self):
+        from django.core.files.storage import default_storage
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=TEST_BUCKET)
+        cache.clear()
+        caches['media-metadata'].clear()
+        self.storage = default_storage
+
+    def category_with_image(self, name='Rome', image='categories/rome.webp'):
+        image = self.storage.save(image, ContentFile(b'image'))
+        variant = self.storage.save(f'{image}.320.webp', ContentFile(b'variant'))
+        category = Category.objects.create(name=name)
+        Category.objects.filter(pk=category.pk).update(image=image, image_variants={'320': {'width': 320, 'webp': variant}})
+        category.refresh_from_db()
+        return category, image, variant
+
+    def test_delete_journals_files_and_flushes_after_commit(self):
+        category, image, variant = self.category_with_image()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            category.delete()
+            self.assertEqual(set(StorageDeletion.objects.values_list('key', flat=True)), {image, variant})
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertFalse(self.storage.exists_uncached(image))
+        self.assertFalse(self.storage.exists_uncached(variant))
+
+    def test_rolled_back_delete_keeps_files(self):
+        from django.db import transaction
+        category, image, _variant = self.category_with_image()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    category.delete()
+                    raise RuntimeError('abort')
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertTrue(self.storage.exists_uncached(image))
+
+    def test_files_still_referenced_elsewhere_are_kept(self):
+        from helpers.cloudflare.post_delete import flush_storage_deletions
+        category, image, _variant = self.category_with_image()
+        # Deduplicated uploads share one object between rows
+        Category.objects.create(name='Rome again', image=image)
+        with self.captureOnCommitCallbacks():
+            category.delete()
+
+        flush_storage_deletions()
+
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertTrue(self.storage.exists_uncached(image))
+
+    def test_failed_deletes_back_off_and_delayed_rows_wait(self):
+        from datetime import timedelta
+        from helpers.cloudflare.post_delete import flush_storage_deletions
+        StorageDeletion.objects.create(key='sprites/later.webp', source='sprites/later.webp', next_attempt_at=timezone.now() + timedelta(hours=1))
+        StorageDeletion.objects.create(key='categories/a.webp', source='categories/a.webp')
+
+        with mock.patch('helpers.cloudflare.storages.delete_many', return_value={'categories/a.webp': 'AccessDenied'}) as delete:
+            self.assertEqual(flush_storage_deletions(), (0, 1))
+        delete.assert_called_once_with(['categories/a.webp'], storage=None)
+
+        failed = StorageDeletion.objects.get(key='categories/a.webp')
+        self.assertEqual((failed.attempts, failed.last_error), (1, 'AccessDenied'))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        self.assertTrue(StorageDeletion.objects.filter(key='sprites/later.webp', attempts=0).exists())
+
+    def test_journal_files_covers_set_based_deletes(self):
+        from helpers.cloudflare.post_delete import journal_files
+        _category, image, variant = self.category_with_image()
+        queryset = Category.objects.filter(name='Rome')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(journal_files(queryset), 2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(set(StorageDeletion.objects.values_list('key', flat=True)), {image, variant})
+
+
+class CategorySuggestTests(TestCase):
+    """The typeahead index follows category changes through the database, not the cache"""
+
+    def setUp(self):
+        from . import suggest
+        self.suggest = suggest
+        suggest._index, suggest._checked_at = None, 0.0
+        self.addCleanup(setattr, suggest, '_index', None)
+        self.category = Category.objects.create(name='Ancient History')
+
+    def names(self, prefix):
+        self.suggest._checked_at = 0.0  # Skip the recheck interval
+        return [item['name'] for item in self.suggest.suggest_categories(prefix)]
+
+    def test_prefix_and_word_matches(self):
+        Category.objects.create(name='History of Art')
+        self.assertEqual(self.names('hist'), ['History of Art', 'Ancient History'])
+
+    def test_save_and_delete_rebuild_the_index(self):
+        self.assertEqual(self.names('anc'), ['Ancient History'])
+        self.category.name = 'Modern History'
+        self.category.save()
+        self.assertEqual(self.names('anc'), [])
+        self.assertEqual(self.names('mod'), ['Modern History'])
+        self.category.delete()
+        self.assertEqual(self.names('mod'), [])
+
+    def test_set_based_updates_rebuild_the_index(self):
+        from .suggest import touch_fields
+        self.assertEqual(self.names('anc'), ['Ancient History'])
+        Category.objects.filter(pk=self.category.pk).update(is_hidden=True, **touch_fields())
+        self.assertEqual(self.names('anc'), [])
+
+    def test_version_is_rechecked_only_after_the_interval(self):
+        index = self.suggest.get_index()
+        Category.objects.create(name='Anatomy')
+        self.assertIs(self.suggest.get_index(), index)
+
+
+class ShuffleQuestionsTests(TestCase):
+    def setUp(self):
+        from .models import Question
+        self.category = Category.objects.create(name='Shuffled')
+        Question.objects.bulk_create(
+            Question(category=self.category, text=f'Q{i}?', answer='A', difficulty='200', random_key=0.5) for i in range(20)
+        )
+        self.keys = lambda: list(Question.objects.values_list('random_key', flat=True))
+
+    def test_keys_stay_in_the_unit_interval(self):
+        from .utils import shuffle_questions
+        self.assertEqual(shuffle_questions(chunk_size=7), 20)
+        keys = self.keys()
+        self.assertTrue(all(0 <= key < 1 for key in keys), keys)
+        self.assertGreater(len(set(keys)), 1)
+
+    def test_category_command_honours_chunk_size(self):
+        from django.core.management import call_command
+        from . import utils
+        with mock.patch('content.utils.shuffle_questions', wraps=utils.shuffle_questions) as shuffle:
+            call_command('shuffle_questions', '--category', str(self.category.pk), '--chunk-size', '3', stdout=mock.Mock())
+        self.assertEqual(shuffle.call_args.kwargs['chunk_size'], 3)
+        self.assertNotIn(0.5, self.keys())
+
+
+@override_settings(STORAGES=TEST_STORAGES, MEDIA_STORAGE_MANIFEST_PATH='')
+class QuestionPackTests(TestCase):
+    """Streaming import/export of question packs (content/question_io.py)"""
+
+    def setUp(self):
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket=TEST_BUCKET)
+        caches['media-metadata'].clear()
+        self.category = Category.objects.create(name='Geography')
+
+    def export(self, fmt):
+        from .question_io import export_queryset, iter_export_rows, write_pack
+        stream = io.StringIO()
+        write_pack(iter_export_rows(export_queryset([self.category.pk])), stream, fmt)
+        stream.seek(0)
+        return stream
+
+    def test_jsonl_and_csv_round_trip(self):
+        from .models import Question
+        from .question_io import CategoryResolver, import_pack, validate_pack
+        Question.objects.create(category=self.category, text='Capital of "France"?', answer='Paris', answer_ar='باريس', difficulty='400', choice_2='Lyon')
+        Question.objects.create(category=self.category, text='Line\nbreak, comma?', answer='Yes', difficulty='600')
+        fields = ['text', 'answer', 'answer_ar', 'choice_2', 'choice_3', 'difficulty']
+        original = list(Question.objects.order_by('pk').values(*fields))
+
+        for fmt in ('jsonl', 'csv'):
+            with self.subTest(fmt=fmt):
+                target = Category.objects.create(name=f'Copy {fmt}')
+                self.assertEqual(validate_pack(self.export(fmt), fmt, CategoryResolver()), (2, []))
+                self.assertEqual(import_pack(self.export(fmt), fmt, CategoryResolver(target)), 2)
+                self.assertEqual(list(Question.objects.filter(category=target).order_by('pk').values(*fields)), original)
+
+    def test_invalid_pack_is_rejected_before_any_write(self):
+        from django.core.management import CommandError, call_command
+        from .models import Question
+        rows = [
+            {'category': 'Geography', 'text': 'Fine?', 'answer': 'Yes'},
+            {'category': 'Geography', 'text': 'No answer?'},
+            {'category': 'Nowhere', 'text': 'Unknown?', 'answer': 'A', 'difficulty': '999'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as fh:
+            fh.write('\n'.join(json.dumps(row) for row in rows))
+        self.addCleanup(os.remove, fh.name)
+
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, 'nothing was imported'):
+            call_command('import_questions', fh.name, stdout=out)
+        self.assertIn('line 2: answer is required', out.getvalue())
+        self.assertIn('line 3: difficulty must be one of', out.getvalue())
+        self.assertIn('unknown category "Nowhere"', out.getvalue())
+        self.assertFalse(Question.objects.exists())
+
+    def test_archive_images_are_deduplicated(self):
+        from .models import Question
+        from .question_io import ArchiveImages, CategoryResolver, import_pack
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('img/a.jpg', jpeg_bytes())
+            zf.writestr('img/copy-of-a.jpg', jpeg_bytes())
+        rows = [
+            {'category': 'Geography', 'text': 'One?', 'answer': 'A', 'image': 'img/a.jpg'},
+            {'category': 'Geography', 'text': 'Two?', 'answer': 'B', 'image': 'img/copy-of-a.jpg', 'answer_image': 'img/a.jpg'},
+        ]
+        pack = lambda: io.StringIO('\n'.join(json.dumps(row) for row in rows))
+
+        images = ArchiveImages(zipfile.ZipFile(archive))
+        self.assertEqual(import_pack(pack(), 'jsonl', CategoryResolver(), images=images, batch_size=1), 2)
+        first, second = Question.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)  # Identical bytes, one object
+        self.assertTrue(first.image_hash)
+
+        # A later pack with the same image reuses the stored object instead of uploading again
+        with mock.patch('helpers.cloudflare.storages.save_many') as save_many:
+            import_pack(pack(), 'jsonl', CategoryResolver(), images=ArchiveImages(zipfile.ZipFile(archive)))
+        save_many.assert_not_called()
+        self.assertEqual(set(Question.objects.values_list('image', flat=True)), {first.image.name})
+        images_listed = self.s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix='media/questions/')
+        self.assertEqual(images_listed['KeyCount'], 1)
+
+    def test_bulk_insert_assigns_random_keys(self):
+        from .models import Question, UNSHUFFLED_RANDOM_KEY
+        from .question_io import CategoryResolver, import_pack
+        pack = io.StringIO(''.join(f'{{"text": "Q{i}?", "answer": "A"}}\n' for i in range(30)))
+
+        import_pack(pack, 'jsonl', CategoryResolver(self.category), batch_size=7, use_copy=False)
+
+        keys = list(Question.objects.values_list('random_key', flat=True))
+        self.assertEqual(len(keys), 30)
+        self.assertNotIn(UNSHUFFLED_RANDOM_KEY, keys)
+        self.assertTrue(all(0 <= key < 1 for key in keys))
+        self.assertGreater(len(set(keys)), 25)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 index (migration 0021) is SQLite-specific')
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FullTextSearchTests(TestCase):
+    """SearchEntry rows and the FTS5 table kept in sync by the 0021 triggers"""
+
+    def setUp(self):
+        from .models import Question
+        self.history = Category.objects.create(name='History', description='Kings and battles')
+        self.historic = Category.objects.create(name='Historic Buildings', description='Castles')
+        self.question = Question.objects.create(category=self.history, text='Who won at Hastings?', answer='William', text_ar='من انتصر في هاستينغز؟', difficulty='200')
+
+    def fts_rowids(self, match):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM content_searchentry_fts WHERE content_searchentry_fts MATCH %s', [match])
+            return {row[0] for row in cursor.fetchall()}
+
+    def entry(self, **filters):
+        from .models import SearchEntry
+        return SearchEntry.objects.get(**filters)
+
+    def test_triggers_follow_insert_update_and_delete(self):
+        entry = self.entry(question=self.question)
+        self.assertEqual(self.fts_rowids('"hastings"'), {entry.pk})
+        self.assertEqual(self.fts_rowids('"هاستينغز"'), {entry.pk})
+
+        self.question.text = 'Who won at Agincourt?'
+        self.question.save()
+        self.assertEqual(self.fts_rowids('"hastings"'), set())
+        self.assertEqual(self.fts_rowids('"agincourt"'), {entry.pk})
+
+        self.question.delete()
+        self.assertEqual(self.fts_rowids('"agincourt"'), set())
+
+    def test_last_term_matches_as_a_prefix_and_titles_rank_first(self):
+        from .search import fts5_match, query_terms, search_entries
+        self.assertEqual(fts5_match(query_terms('old hist')), '"old" "hist"*')
+        Category.objects.create(name='Geography', description='Rivers with a long history')
+
+        names = [entry.category.name for entry in search_entries('hist', 'category').select_related('category')]
+        # Both prefix matches in a title outrank the description match
+        self.assertEqual(set(names[:2]), {'History', 'Historic Buildings'})
+        self.assertEqual(names[2:], ['Geography'])
+        self.assertFalse(search_entries('"*', 'category').exists())  # No words, no MATCH syntax errors
+
+    def test_visible_category_filter(self):
+        from django.contrib.auth.models import AnonymousUser
+        from .search import search_categories
+        owner = User.objects.create_user(username='owner', email='owner@example.com')
+        Category.objects.create(name='History of Secrets', is_custom=True, privacy='private', created_by=owner)
+        Category.objects.create(name='History of Drafts', is_custom=True, is_approved=False, created_by=owner)
+        Category.objects.create(name='History Shared', is_custom=True, is_approved=True, privacy='public', created_by=owner)
+        Category.objects.create(name='History Hidden', is_hidden=True)
+        staff = User.objects.create_user(username='staff', email='staff@example.com', is_staff=True)
+
+        def visible(user):
+            return {entry.category.name for entry in search_categories('history', user)}
+
+        public = {'History', 'History Shared'}
+        self.assertEqual(visible(AnonymousUser()), public)
+        self.assertEqual(visible(owner), public | {'History of Secrets', 'History of Drafts'})
+        self.assertEqual(visible(staff), public | {'History of Secrets', 'History of Drafts', 'History Hidden'})
+
+    def test_rebuild_index_restores_missing_entries(self):
+        from .models import SearchEntry
+        from .search import rebuild_index, search_entries
+        SearchEntry.objects.all()._raw_delete(connection.alias)
+        self.assertFalse(search_entries('hastings', 'question').exists())
+
+        self.assertEqual(rebuild_index(batch_size=1), {'categories': 2, 'questions': 1})
+        self.assertEqual([e.question_id for e in search_entries('hastings', 'question')], [self.question.pk])
+
+    def test_search_endpoint(self):
+        client = APIClient()
+        response = client.get('/api/content/search/', {'q': 'histor'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual({row['name'] for row in response.data['results']}, {'History', 'Historic Buildings'})
+        self.assertEqual(response.data['count'], 2)
+
+        self.assertEqual(client.get('/api/content/search/', {'q': 'hastings', 'type': 'questions'}).status_code, 403)
+        client.force_authenticate(User.objects.create_user(username='editor', email='editor@example.com', is_staff=True))
+        response = client.get('/api/content/search/', {'q': 'hastings', 'type': 'questions', 'category_id': self.history.pk})
+        self.assertEqual([row['answer'] for row in response.data['results']], ['William'])
+        self.assertEqual(client.get('/api/content/search/', {'q': ''}).status_code, 400)
+
+    def test_admin_changelist_searches_the_index(self):
+        admin_user = User.objects.create_superuser(username='root', email='root@example.com', password='pw')
+        self.client.force_login(admin_user)
+
+        response = self.client.get('/admin/content/category/', {'q': 'castles'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.name for c in response.context['cl'].result_list], ['Historic Buildings'])
+
+        response = self.client.get('/admin/content/category/', {'q': str(self.history.pk)})
+        self.assertIn(self.history, response.context['cl'].result_list)
+
+
+class UserDeletionTests(TestCase):
+    def category_with_dependents(self, owner=None):
+        from gameplay.models import Game, PlayedQuestion
+        from .models import CategoryLike, Question, SavedCategory
+        player = User.objects.create_user(username='player', email='player@example.com')
+        category = Category.objects.create(name='Doomed', created_by=owner)
+        questions = [Question.objects.create(category=category, text=f'Q{i}?', answer=f'A{i}', difficulty='200') for i in range(3)]
+        game = Game.objects.create(player=player, mode='solo')
+        game.categories.add(category)
+        PlayedQuestion.objects.bulk_create(PlayedQuestion(game=game, question=q) for q in questions)
+        CategoryLike.objects.create(user=player, category=category)
+        SavedCategory.objects.create(user=player, category=category)
+        return category
+
+    def test_queue_deletion_soft_hides_at_once(self):
+        from rest_framework.authtoken.models import Token
+        from .deletion import queue_deletion
+        user = User.objects.create_user(username='leaving', email='leaving@example.com')
+        Token.objects.create(user=user)
+        category = Category.objects.create(name='Mine', created_by=user)
+
+        with mock.patch('content.tasks.run_deletion_job.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                job = queue_deletion(user)
+        delay.assert_called_once_with(job.pk)  # The job itself runs after commit
+        self.assertEqual(job.status, 'queued')
+
+        user.refresh_from_db()
+        category.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertFalse(Token.objects.filter(user=user).exists())
+        self.assertTrue(category.is_hidden)
+        self.assertEqual(queue_deletion(user), job)  # Queuing again returns the active job
+
+    def test_category_job_removes_dependents(self):
+        from gameplay.models import Game, PlayedQuestion
+        from .deletion import run_deletion_job
+        from .models import CategoryLike, Question, SavedCategory, SearchEntry
+        category = self.category_with_dependents()
+        self.assertTrue(SearchEntry.objects.filter(category=category, kind='question').exists())
+        job = DeletionJob.objects.create(target_type='category', target_id=category.pk)
+
+        run_deletion_job(job, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.progress['played_questions'], 3)
+        self.assertEqual(job.progress['questions'], 3)
+        self.assertFalse(Category.objects.filter(pk=category.pk).exists())
+        self.assertFalse(Question.objects.exists())
+        self.assertFalse(PlayedQuestion.objects.exists())
+        self.assertFalse(CategoryLike.objects.exists())
+        self.assertFalse(SavedCategory.objects.exists())
+        self.assertFalse(SearchEntry.objects.filter(category_id=category.pk).exists())
+        self.assertTrue(Game.objects.exists())  # Games only lose the category link
+
+    def test_resume_picks_up_a_failed_job(self):
+        from django.core.management import CommandError, call_command
+        from .models import Question
+        category = self.category_with_dependents()
+
+        with mock.patch('content.deletion.Category.delete', side_effect=RuntimeError('lock timeout')):
+            with self.assertRaises(CommandError):
+                call_command('delete_in_background', 'category', category.pk, '--sync', '--chunk-size', '2', stdout=mock.Mock())
+        job = DeletionJob.objects.get(target_id=category.pk)
+        self.assertEqual((job.status, job.error), ('failed', 'lock timeout'))
+        self.assertFalse(Question.objects.exists())  # Chunks done before the failure stay done
+
+        call_command('delete_in_background', '--resume', str(job.pk), stdout=mock.Mock())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertFalse(Category.objects.filter(pk=category.pk).exists())
+
+    def test_payments_and_their_webhook_payloads_are_removed(self):
+        from payments.models import Payment, WebhookEvent, WebhookPayload
+        from payments.webhooks import process_event, record_event
+        from .deletion import run_deletion_job
+
+        user = User.objects.create_user(username='leaving', email='leaving@example.com')
+        data = {
+            'meta': {'event_name': 'order_created', 'custom_data': {'user_id': user.pk}},
+            'data': {'id': '1001', 'attributes': {'total': 900, 'first_order_item': {'variant_id': 42}}},
+        }
+        with self.captureOnCommitCallbacks():
+            event, _ = record_event(json.dumps(data).encode(), data)
+        process_event(event)
+        payment = Payment.objects.get(order_id='1001')
+        self.assertEqual(payment.webhook_data, data)
+        job = DeletionJob.objects.create(target_type='user', target_id=user.pk)
+
+        run_deletion_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.progress['webhook_payloads'], 1)
+        self.assertFalse(Payment.objects.filter(pk=payment.pk).exists())
+        self.assertFalse(WebhookPayload.objects.exists())
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
@@ -0,0 +1,372 @@
+"""
+Direct-to-storage uploads.
+
+Instead of streaming image bytes through Django's multipart parser, the client asks
+for an upload slot, PUTs the file straight to the media bucket with a presigned URL
+and confirms. A background task then reads the object back, validates and optimizes
+it, and attaches the result to its target (avatar, category or question image).
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import Category, Question, MediaUpload, UploadSession
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_UPLOAD_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+STAGING_PREFIX = 'uploads'
+
+
+def resolve_upload_target(user, purpose, target_id):
+    """
+    Return the object an upload will be attached to, checking the user may modify it.
+
+    Raises:
+        ValueError: If the target is missing or not editable by this user
+    """
+    if purpose == 'avatar':
+        return None
+    if target_id is None:
+        raise ValueError('target_id is required for this upload purpose')
+
+    if purpose == 'category_image':
+        target = Category.objects.filter(pk=target_id).first()
+        owner_id = target.created_by_id if target else None
+        is_custom = target.is_custom if target else False
+    else:
+        target = Question.objects.select_related('category').filter(pk=target_id).first()
+        owner_id = target.category.created_by_id if target else None
+        is_custom = target.category.is_custom if target else False
+
+    if target is None:
+        raise ValueError('Upload target not found')
+    if not user.is_staff and (not is_custom or owner_id != user.id):
+        raise ValueError('You do not have permission to modify this item')
+    return target
+
+
+def optimize_upload(data, name, content_type):
+    """
+    Validate and optimize uploaded bytes to WebP.
+
+    Returns:
+        ContentFile: Optimized image
+
+    Raises:
+        ValueError: If the file is not an acceptable image (never worth retrying)
+    """
+    from .image_optimizer import validate_and_optimize_image
+
+    source = ContentFile(data, name=name)
+    source.content_type = content_type
+    try:
+        return validate_and_optimize_image(
+            source,
+            max_size_mb=settings.MEDIA_UPLOAD_MAX_MB,
+            allowed_types=list(ALLOWED_UPLOAD_TYPES),
+        )
+    except ValueError:
+        raise
+    except Exception as e:
+        # pyvips couldn't decode it - not an image
+        raise ValueError(f'Failed to process image: {e}') from e
+
+
+def create_upload_slot(user, purpose, content_type, size, target_id=None):
+    """
+    Register a pending upload and presign a PUT URL for it.
+
+    Returns:
+        (MediaUpload, dict): The upload row and the client instructions
+        {'url', 'method', 'headers', 'expires_in'}
+
+    Raises:
+        ValueError: If the declared file or target is not acceptable
+    """
+    if content_type not in ALLOWED_UPLOAD_TYPES:
+        raise ValueError(f'Invalid file type. Allowed types: {", ".join(ALLOWED_UPLOAD_TYPES)}')
+    max_bytes = settings.MEDIA_UPLOAD_MAX_MB * 1024 * 1024
+    if size <= 0 or size > max_bytes:
+        raise ValueError(f'File too large. Maximum size is {settings.MEDIA_UPLOAD_MAX_MB}MB.')
+    resolve_upload_target(user, purpose, target_id)
+
+    upload_id = uuid.uuid4()
+    key = f"{STAGING_PREFIX}/{user.id}/{upload_id}.{ALLOWED_UPLOAD_TYPES[content_type]}"
+    upload = MediaUpload.objects.create(
+        id=upload_id,
+        user=user,
+        purpose=purpose,
+        target_id=target_id,
+        key=key,
+        content_type=content_type,
+        size=size,
+    )
+    expire = settings.MEDIA_UPLOAD_URL_EXPIRE
+    instructions = {
+        'url': default_storage.presigned_put(key, content_type, size, expire=expire),
+        'method': 'PUT',
+        'headers': {'Content-Type': content_type},
+        'expires_in': expire,
+    }
+    return upload, instructions
+
+
+def confirm_upload(upload):
+    """
+    Check the client's PUT landed and queue processing once the transaction commits.
+
+    Raises:
+        ValueError: If the object is missing or doesn't match the declared size or type
+    """
+    exists = getattr(default_storage, 'exists_uncached', default_storage.exists)
+    if not exists(upload.key):
+        raise ValueError('Uploaded file not found. PUT the file to the upload URL before confirming.')
+    if default_storage.size(upload.key) != upload.size:
+        raise ValueError('Uploaded file size does not match the declared size')
+    content_type = getattr(default_storage, 'content_type', None)
+    if content_type is not None and content_type(upload.key) != upload.content_type:
+        raise ValueError('Uploaded file type does not match the declared type')
+
+    # Conditional update so a double-submitted confirm only queues one task
+    claimed = MediaUpload.objects.filter(pk=upload.pk, status='pending').update(status='processing')
+    upload.status = 'processing'
+    if not claimed:
+        return
+
+    from .tasks import process_media_upload
+    transaction.on_commit(lambda: process_media_upload.delay(str(upload.pk)))
+
+
+def process_upload(upload):
+    """
+    Validate and optimize a confirmed upload from storage and attach it to its target.
+    The staging object is removed once the upload is done or rejected.
+
+    Raises:
+        ValueError: If the file is not an acceptable image (permanent failure)
+        Exception: Storage/transient errors, so the caller can retry
+    """
+    with default_storage.open(upload.key, 'rb') as fh:
+        data = fh.read()
+    optimized = optimize_upload(data, upload.key.rsplit('/', 1)[-1], upload.content_type)
+
+    target = resolve_upload_target(upload.user, upload.purpose, upload.target_id)
+    if upload.purpose == 'avatar':
+        from authentication.models import UserProfile
+        target, _ = UserProfile.objects.get_or_create(user=upload.user)
+        field = 'avatar'
+    elif upload.purpose == 'answer_image':
+        field = 'answer_image'
+    else:
+        field = 'image'
+
+    # The model's save() handles storage naming, variants and metadata as for form uploads
+    setattr(target, field, optimized)
+    target.save()
+
+    result = getattr(target, field).name
+    MediaUpload.objects.filter(pk=upload.pk).update(status='done', result=result, error='')
+    upload.status, upload.result = 'done', result
+    discard_staging_object(upload)
+    logger.info(f"✅ Direct upload {upload.id} attached as {upload.purpose} → {result}")
+    return result
+
+
+def fail_upload(upload, error):
+    MediaUpload.objects.filter(pk=upload.pk).update(status='failed', error=str(error)[:1000])
+    upload.status, upload.error = 'failed', str(error)
+    discard_staging_object(upload)
+    logger.warning(f"❌ Direct upload {upload.id} failed: {error}")
+
+
+def discard_staging_object(upload):
+    try:
+        default_storage.delete(upload.key)
+    except Exception as e:
+        logger.warning(f"Failed to delete staging object {upload.key}: {e}")
+
+
+# ------------------------------
+# Resumable upload sessions
+# ------------------------------
+
+def session_part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f"{session.id}.part")
+
+
+def create_upload_session(user, filename, content_type, size, checksum=''):
+    """
+    Open a resumable upload session.
+
+    Raises:
+        ValueError: If the declared file is not acceptable
+    """
+    if content_type not in ALLOWED_UPLOAD_TYPES:
+        raise ValueError(f'Invalid file type. Allowed types: {", ".join(ALLOWED_UPLOAD_TYPES)}')
+    if size <= 0 or size > settings.MEDIA_UPLOAD_MAX_MB * 1024 * 1024:
+        raise ValueError(f'File too large. Maximum size is {settings.MEDIA_UPLOAD_MAX_MB}MB.')
+
+    session = UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255] or 'upload',
+        content_type=content_type,
+        size=size,
+        checksum=checksum.lower(),
+    )
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    # Preallocate so chunks can be written at their offset in any order of retries
+    with open(session_part_path(session), 'wb') as fh:
+        fh.truncate(size)
+    return session
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk arrived past the next expected offset (the client must resume from `received`)."""
+    def __init__(self, received):
+        super().__init__(f'Expected offset {received}')
+        self.received = received
+
+
+def write_session_chunk(session, offset, data):
+    """
+    Write one chunk at `offset`. Re-sending a chunk that was already received is a no-op,
+    so clients can blindly retry the last chunk after a dropped connection.
+
+    Returns:
+        int: Bytes received so far
+
+    Raises:
+        ValueError: If the session is not open or the chunk doesn't fit
+        UploadOffsetMismatch: If the chunk would leave a gap; carries the offset to resume from
+    """
+    if session.status != 'open':
+        raise ValueError(f'Upload session is {session.status}')
+    if not data:
+        raise ValueError('Empty chunk')
+    if len(data) > settings.UPLOAD_CHUNK_MAX_BYTES:
+        raise ValueError(f'Chunk too large. Maximum chunk size is {settings.UPLOAD_CHUNK_MAX_BYTES} bytes.')
+    end = offset + len(data)
+    if offset < 0 or end > session.size:
+        raise ValueError('Chunk exceeds the declared file size')
+    if end <= session.received:
+        return session.received
+    if offset != session.received:
+        raise UploadOffsetMismatch(session.received)
+
+    with open(session_part_path(session), 'r+b') as fh:
+        fh.seek(offset)
+        fh.write(data)
+
+    # Conditional update: a concurrent duplicate of this chunk must not advance twice
+    advanced = UploadSession.objects.filter(pk=session.pk, received=offset).update(received=end)
+    if not advanced:
+        session.refresh_from_db(fields=['received'])
+        return session.received
+    session.received = end
+    return end
+
+
+def finalize_upload_session(session):
+    """
+    Verify the assembled file, optimize it and stage the result in media storage.
+    The session's part file is removed either way.
+
+    Raises:
+        ValueError: If the file is incomplete, corrupt or not an acceptable image
+    """
+    if session.status == 'complete':
+        return session
+    if session.status != 'open':
+        raise ValueError(f'Upload session is {session.status}')
+    if session.received != session.size:
+        raise ValueError(f'Upload incomplete: received {session.received} of {session.size} bytes')
+
+    path = session_part_path(session)
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if session.checksum and hashlib.sha256(data).hexdigest() != session.checksum:
+            # Keep the session open: the client can re-send chunks from scratch
+            UploadSession.objects.filter(pk=session.pk).update(received=0)
+            session.received = 0
+            raise ValueError('Checksum mismatch - upload the file again')
+        try:
+            optimized = optimize_upload(data, session.filename, session.content_type)
+        except ValueError as e:
+            UploadSession.objects.filter(pk=session.pk).update(status='failed', error=str(e)[:1000])
+            session.status = 'failed'
+            os.remove(path)
+            raise
+    except OSError as e:
+        raise ValueError('Upload data is no longer available - start a new session') from e
+
+    key = default_storage.save(f"{STAGING_PREFIX}/{session.user_id}/{session.id}.webp", optimized)
+    UploadSession.objects.filter(pk=session.pk).update(status='complete', key=key, error='')
+    session.status, session.key = 'complete', key
+    os.remove(path)
+    logger.info(f"📦 Upload session {session.id} finalized → {key}")
+    return session
+
+
+def delete_staged_objects(keys):
+    """Delete staged objects once their contents were copied to the final location."""
+    for key in keys:
+        try:
+            default_storage.delete(key)
+        except Exception as e:
+            logger.warning(f"Failed to delete staged object {key}: {e}")
+
+
+def discard_upload_session(session):
+    """Remove whatever a session left behind (part file and/or staged object)."""
+    try:
+        os.remove(session_part_path(session))
+    except OSError:
+        pass
+    if session.key and session.status != 'consumed':
+        try:
+            default_storage.delete(session.key)
+        except Exception as e:
+            logger.warning(f"Failed to delete staged session object {session.key}: {e}")
+
+
+def load_session_assets(user, session_ids):
+    """
+    Fetch staged images for completed sessions referenced by a manifest.
+
+    Returns:
+        dict: {session_id (str): optimized WebP bytes}
+
+    Raises:
+        ValueError: If any reference is unknown, not finished, or already used
+    """
+    wanted = {str(session_id) for session_id in session_ids}
+    if not wanted:
+        return {}
+    sessions = {
+        str(session.id): session
+        for session in UploadSession.objects.filter(user=user, id__in=wanted, status='complete')
+    }
+    missing = wanted - set(sessions)
+    if missing:
+        raise ValueError(f'Unknown or unfinished upload session(s): {", ".join(sorted(missing))}')
+
+    assets = {}
+    for session_id, session in sessions.items():
+        with default_storage.open(session.key, 'rb') as fh:
+            assets[session_id] = fh.read()
+    return assets
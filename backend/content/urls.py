@@ -8,6 +8,9 @@ router.register(r'collections', views.CollectionViewSet)
 router.register(r'categories', views.CategoryViewSet)
 router.register(r'questions', views.QuestionViewSet)
 router.register(r'user-categories', views.UserCategoryViewSet, basename='user-category')
+router.register(r'uploads', views.MediaUploadViewSet, basename='media-upload')
+router.register(r'upload-sessions', views.UploadSessionViewSet, basename='upload-session')
+router.register(r'search', views.SearchViewSet, basename='search')
 
 # Content API URL patterns
 urlpatterns = [
@@ -1,68 +1,86 @@
 """
 Utility functions for content management.
 """
-import random
-from django.db import transaction
-from .models import Question
+from django.db.models import Min, Max
+from django.db.models.functions import Random
+from .models import Question, UNSHUFFLED_RANDOM_KEY
 
+SHUFFLE_CHUNK_SIZE = 5000
 
-def shuffle_category_questions(category_id):
+
+class UnitRandom(Random):
+    """
+    Random() normalized to [0, 1) on every backend, matching the keys random_key()
+    gives new rows. SQLite's RANDOM() is a signed 64-bit integer; it is folded into
+    a non-negative remainder first (ABS() would overflow on the minimum value).
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return '(((RANDOM() % 1000000000) + 1000000000) % 1000000000) / 1e9', []
+
+
+def shuffle_questions(queryset=None, only_unshuffled=False, chunk_size=SHUFFLE_CHUNK_SIZE):
+    """
+    Assign new random_key values in the database (UPDATE ... SET random_key = random()).
+    
+    Rows are never loaded into Python. The update walks primary-key ranges of
+    `chunk_size`, each range its own short statement, so a full reshuffle of the
+    question bank never holds one long lock on the table.
+    
+    Args:
+        queryset: Questions to shuffle (default: all questions)
+        only_unshuffled: Only touch rows still carrying the old 0.5 default
+        chunk_size: Width of each primary-key range
+        
+    Returns:
+        int: Number of questions shuffled
+    """
+    queryset = Question.objects.all() if queryset is None else queryset
+    if only_unshuffled:
+        queryset = queryset.filter(random_key=UNSHUFFLED_RANDOM_KEY)
+    
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    
+    shuffled = 0
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        shuffled += queryset.filter(pk__gte=start, pk__lt=start + chunk_size).update(random_key=UnitRandom())
+    return shuffled
+
+
+def shuffle_category_questions(category_id, chunk_size=SHUFFLE_CHUNK_SIZE):
     """
     Shuffle questions in a specific category by assigning new random_key values.
     
-    This is a ONE-TIME operation that should be triggered manually via admin action.
-    It assigns each question a random float between 0 and 1, which is then used
-    for deterministic "random" ordering in queries.
+    Triggered manually via the admin shuffle button. New questions already get
+    a random key on insert; this re-deals the whole category.
     
     Args:
         category_id: The ID of the category to shuffle
+        chunk_size: Width of each primary-key range
         
     Returns:
         int: Number of questions shuffled
-        
-    Performance:
-        - Uses bulk_update for optimal database performance
-        - Wrapped in transaction for atomicity
-        - Only updates questions in the specified category
     """
-    with transaction.atomic():
-        # Get all questions for this category
-        questions = list(Question.objects.filter(category_id=category_id))
-        
-        if not questions:
-            return 0
-        
-        # Assign random keys
-        for question in questions:
-            question.random_key = random.random()
-        
-        # Bulk update for performance (much faster than saving individually)
-        Question.objects.bulk_update(questions, ['random_key'], batch_size=500)
-        
-        return len(questions)
+    return shuffle_questions(Question.objects.filter(category_id=category_id), chunk_size=chunk_size)
 
 
-def shuffle_all_categories():
+def shuffle_all_categories(only_unshuffled=False, chunk_size=SHUFFLE_CHUNK_SIZE):
     """
-    Shuffle questions in ALL categories.
+    Shuffle questions in ALL categories in one chunked, set-based pass.
     
-    This is useful for initial setup or bulk re-shuffling.
-    Use with caution in production as it affects all questions.
+    Use with caution in production as it affects all questions
+    (only_unshuffled=True limits it to rows that never got a key).
     
     Returns:
         dict: Statistics about the shuffle operation
     """
-    from .models import Category
-    
-    categories = Category.objects.all()
-    total_questions = 0
-    categories_shuffled = 0
-    
-    for category in categories:
-        count = shuffle_category_questions(category.id)
-        if count > 0:
-            categories_shuffled += 1
-            total_questions += count
+    queryset = Question.objects.all()
+    if only_unshuffled:
+        queryset = queryset.filter(random_key=UNSHUFFLED_RANDOM_KEY)
+    categories_shuffled = queryset.values('category_id').distinct().count()
+    total_questions = shuffle_questions(queryset, chunk_size=chunk_size)
     
     return {
         'categories_shuffled': categories_shuffled,
@@ -3,14 +3,17 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.exceptions import MethodNotAllowed, ValidationError as DRFValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 import logging, re
 from django.core.cache import cache
 from .models import SavedCategory
 from django.db.models import Q
-from .models import Collection, Category, Question, CategoryLike
+from .models import Collection, Category, Question, CategoryLike, MediaUpload, UploadSession
 from .serializers import (
     CollectionSerializer, CategorySerializer, QuestionSerializer,
-    UserCategoryCreateSerializer, UserCategorySerializer
+    UserCategoryCreateSerializer, UserCategorySerializer,
+    MediaUploadRequestSerializer, MediaUploadSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer, CategoryManifestSerializer
 )
 
 
@@ -27,9 +30,9 @@ class CollectionViewSet(viewsets.ReadOnlyModelViewSet):
         ONLY shows official categories (is_custom=False) - custom categories appear only on /categories/add
         """
         from django.db.models import Q
-        user = request.user
+        from .sprites import sprite_payload
         # Targeted caching: vary by premium tier (premium vs free/anon)
-        tier = 'premium' if (user.is_authenticated and getattr(user, 'is_premium', False)) else 'free'
+        tier = request.entitlements.tier
         # Cache key version: v1 - allows easy invalidation if format changes
         cache_key = f'v1:collections:with_categories:{tier}'
         cached = cache.get(cache_key)
@@ -61,7 +64,9 @@ class CollectionViewSet(viewsets.ReadOnlyModelViewSet):
                     'name': collection.name,
                     'order': collection.order,
                     'categories': categories_data,
-                    'categories_count': len(categories_data)
+                    'categories_count': len(categories_data),
+                    # One atlas for the whole grid; categories missing from sprite.map fall back to their own image
+                    'sprite': sprite_payload(collection),
                 }
                 collections_data.append(collection_data)
         
@@ -78,7 +83,8 @@ class CollectionViewSet(viewsets.ReadOnlyModelViewSet):
                 'name': 'Other Categories',
                 'order': 999,  # Put it at the end
                 'categories': uncategorized_data,
-                'categories_count': len(uncategorized_data)
+                'categories_count': len(uncategorized_data),
+                'sprite': None,
             }
             
             # Add the virtual collection to the response
@@ -153,6 +159,17 @@ class CollectionViewSet(viewsets.ReadOnlyModelViewSet):
             'fallback_categories': fallback_categories
         }, status=status.HTTP_200_OK)
 
+class SuggestAnonRateThrottle(AnonRateThrottle):
+    """Typeahead fires per keystroke; allow far more than the global anon rate"""
+    scope = 'suggest_anon'
+    rate = '600/min'
+
+
+class SuggestUserRateThrottle(UserRateThrottle):
+    scope = 'suggest_user'
+    rate = '1200/min'
+
+
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for Category model - read only"""
     queryset = Category.objects.all()
@@ -170,6 +187,21 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         # Do not filter out locked here; allow visibility. Enforcement for questions is in QuestionViewSet.
         return queryset
 
+    @action(detail=False, methods=['get'], throttle_classes=[SuggestAnonRateThrottle, SuggestUserRateThrottle])
+    def suggest(self, request):
+        """
+        Typeahead: GET /categories/suggest/?q=geo[&limit=10]
+        Served from the in-process prefix index (no database query), official and
+        approved public custom categories alike.
+        """
+        from .suggest import suggest_categories, SUGGEST_MAX_RESULTS
+        query = request.query_params.get('q', '')[:100]
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), SUGGEST_MAX_RESULTS))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': suggest_categories(query, limit)})
+
 class QuestionViewSet(viewsets.ModelViewSet):
     """Secure + validated ViewSet for Question model."""
     queryset = Question.objects.all()
@@ -220,13 +252,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category_id=category_id)
 
         # Membership filtering ALWAYS applied (previously only when category filter used)
-        user = self.request.user
-        is_premium = (
-            user.is_authenticated
-            and hasattr(user, "membership")
-            and user.membership.is_active_premium()
-        )
-        if not is_premium:
+        if not self.request.entitlements.is_premium:
             queryset = queryset.filter(category__locked=False)
 
         return queryset
@@ -263,13 +289,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         qs = Question.objects.filter(category_id=category_id)
 
         # Membership enforcement (duplicate of get_queryset logic, kept explicit for clarity)
-        user = request.user
-        is_premium = (
-            user.is_authenticated
-            and hasattr(user, "membership")
-            and user.membership.is_active_premium()
-        )
-        if not is_premium:
+        if not request.entitlements.is_premium:
             qs = qs.filter(category__locked=False)
 
         page = self.paginate_queryset(qs)
@@ -332,12 +352,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
             exclude_ids = self._validate_integer_list(exclude_ids_raw, "exclude_ids")
 
         # ---- 2. Membership logic ----
-        user = request.user
-        is_premium = (
-            user.is_authenticated 
-            and hasattr(user, "membership")
-            and user.membership.is_active_premium()
-        )
+        is_premium = request.entitlements.is_premium
 
         # ---- 3. Queryset filtering ----
         qs = Question.objects.filter(category_id__in=category_ids)
@@ -520,6 +535,68 @@ class UserCategoryViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'])
+    def manifest(self, request):
+        """
+        Create a category and its questions from a JSON manifest.
+        Images are ids of finished upload sessions (see UploadSessionViewSet),
+        so this request is small and safe to retry.
+        """
+        from django.core.files.base import ContentFile
+        from django.db import transaction
+        from .uploads import load_session_assets, delete_staged_objects
+        logger = logging.getLogger(__name__)
+
+        manifest = CategoryManifestSerializer(data=request.data)
+        manifest.is_valid(raise_exception=True)
+        data = dict(manifest.validated_data)
+        questions_data = data.pop('questions', [])
+        image_ref = data.pop('image', None)
+        asset_ids = manifest.asset_ids()
+
+        try:
+            assets = load_session_assets(request.user, asset_ids)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def asset(ref):
+            # A fresh file object per use - the same upload may be referenced more than once
+            return ContentFile(assets[str(ref)], name=f'{ref}.webp') if ref else None
+
+        with transaction.atomic():
+            # Claim the sessions first so a retried/duplicated commit can't attach them twice
+            claimed = UploadSession.objects.filter(
+                user=request.user, id__in=asset_ids, status='complete'
+            ).update(status='consumed')
+            if claimed != len(asset_ids):
+                transaction.set_rollback(True)
+                return Response({'error': 'Upload sessions were already used by another request'}, status=status.HTTP_409_CONFLICT)
+
+            category = Category(**data, is_custom=True, created_by=request.user, is_approved=False)
+            category.image = asset(image_ref)
+            category.save()
+            for question_data in questions_data:
+                Question(
+                    category=category,
+                    text=question_data['text'],
+                    answer=question_data['answer'],
+                    image=asset(question_data.get('image')),
+                    answer_image=asset(question_data.get('answer_image')),
+                ).save()
+            SavedCategory.objects.get_or_create(user=request.user, category=category)
+
+            staged_keys = list(UploadSession.objects.filter(id__in=asset_ids).values_list('key', flat=True))
+            transaction.on_commit(lambda: delete_staged_objects(staged_keys))
+
+        logger.info(f'✅ Category "{category.name}" (ID: {category.id}) created from manifest with {len(questions_data)} questions')
+        return Response(
+            {
+                'message': 'Category created successfully and submitted for approval',
+                'category': UserCategorySerializer(category, context=self.get_serializer_context()).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['get'])
     def my_categories(self, request):
         """Get all categories created by the current user"""
@@ -625,7 +702,33 @@ class UserCategoryViewSet(viewsets.ModelViewSet):
         questions_before = category.question_set.count()
         to_create = [Question(category=category, **question_data) for question_data in serializer.validated_data]
         if to_create:
+            from .image_optimizer import pending_image_bytes, processed_image_fields, upload_pending_files
+            # bulk_create skips Question.save(), so capture new image bytes for derived fields ourselves
+            pending = [(q, pending_image_bytes(q.image), pending_image_bytes(q.answer_image)) for q in to_create]
+            # Upload all new images concurrently instead of one by one inside bulk_create
+            upload_pending_files(to_create, ['image', 'answer_image'])
             Question.objects.bulk_create(to_create)
+            processed = []
+            derived_fields = set()
+            for q, image_bytes, answer_image_bytes in pending:
+                updates = {}
+                if image_bytes is not None:
+                    updates.update(processed_image_fields('image', image_bytes, q.image.name))
+                if answer_image_bytes is not None:
+                    updates.update(processed_image_fields('answer_image', answer_image_bytes, q.answer_image.name))
+                for attr, value in updates.items():
+                    setattr(q, attr, value)
+                if updates:
+                    processed.append(q)
+                    derived_fields.update(updates)
+            if processed and processed[0].pk is not None:
+                Question.objects.bulk_update(processed, sorted(derived_fields), batch_size=500)
+            # bulk_create skips the post_save search indexing as well
+            from .search import index_questions
+            if to_create[0].pk is not None:
+                index_questions(Question.objects.filter(pk__in=[q.pk for q in to_create]))
+            else:
+                index_questions(category.question_set.filter(search_entry__isnull=True))
         
         questions_after = category.question_set.count()
         logger.info(f'✅ Added {len(to_create)} questions to category {category.id}. Total: {questions_before} -> {questions_after}')
@@ -738,3 +841,168 @@ class UserCategoryViewSet(viewsets.ModelViewSet):
             'liked': liked,
             'likes_count': CategoryLike.objects.filter(category=category).count()
         }, status=status.HTTP_200_OK)
+
+
+class MediaUploadViewSet(viewsets.GenericViewSet):
+    """
+    Direct-to-storage image uploads (avatars, category and question images).
+
+    1. POST /uploads/                 -> upload slot with a presigned PUT URL
+    2. PUT the file to that URL (straight to the bucket, not through Django)
+    3. POST /uploads/{id}/confirm/    -> queued for validation + optimization
+    4. GET  /uploads/{id}/            -> poll until status is 'done' or 'failed'
+    """
+    serializer_class = MediaUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return MediaUpload.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        from .uploads import create_upload_slot
+        request_serializer = MediaUploadRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        try:
+            upload, instructions = create_upload_slot(request.user, **request_serializer.validated_data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            **MediaUploadSerializer(upload).data,
+            'upload': instructions,
+        }, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(MediaUploadSerializer(self.get_object()).data)
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """Confirm the client finished its PUT; processing continues in the background"""
+        from .uploads import confirm_upload
+        upload = self.get_object()
+        if request.data.get('key') != upload.key:
+            return Response({'error': 'Object key does not match this upload'}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.status != 'pending':
+            return Response(MediaUploadSerializer(upload).data)
+        try:
+            confirm_upload(upload)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(MediaUploadSerializer(upload).data, status=status.HTTP_202_ACCEPTED)
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked image uploads for large creator submissions.
+
+    1. POST /upload-sessions/                          -> open a session (filename, content_type, size[, checksum])
+    2. PUT  /upload-sessions/{id}/chunk/?offset=N      -> raw bytes of one chunk
+       A 409 response carries `received`; resume from there. GET the session to resume later.
+    3. POST /upload-sessions/{id}/finalize/            -> validated, optimized and staged
+    4. Reference the session id from POST /user-categories/manifest/
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        from .uploads import create_upload_session
+        request_serializer = UploadSessionCreateSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        try:
+            session = create_upload_session(request.user, **request_serializer.validated_data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(UploadSessionSerializer(self.get_object()).data)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """Append raw bytes at ?offset= (or the Upload-Offset header)"""
+        from .uploads import write_session_chunk, UploadOffsetMismatch
+        session = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', request.headers.get('Upload-Offset', '')))
+        except ValueError:
+            return Response({'error': 'offset is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            received = write_session_chunk(session, offset, request.body)
+        except UploadOffsetMismatch as e:
+            return Response({'error': str(e), 'received': e.received}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e), 'received': session.received}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'id': str(session.id), 'received': received, 'size': session.size})
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Verify the assembled file and stage the optimized image"""
+        from .uploads import finalize_upload_session
+        session = self.get_object()
+        try:
+            finalize_upload_session(session)
+        except ValueError as e:
+            return Response({'error': str(e), **UploadSessionSerializer(session).data}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+
+class SearchViewSet(viewsets.GenericViewSet):
+    """
+    Ranked full-text search (English and Arabic), paginated.
+
+    GET /search/?q=...                       -> categories the user can discover
+    GET /search/?q=...&type=questions        -> questions (staff only; answers included)
+        optional &category_id=N
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def list(self, request):
+        from .search import search_categories, search_questions
+        from .serializers import CategoryBasicSerializer
+
+        query = request.query_params.get('q', '').strip()
+        search_type = request.query_params.get('type', 'categories')
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(query) > 200:
+            return Response({'error': 'q is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if search_type == 'categories':
+            page = self.paginate_queryset(search_categories(query, request.user))
+            results = [
+                {
+                    **CategoryBasicSerializer(entry.category, context={'request': request}).data,
+                    'is_custom': entry.category.is_custom,
+                    'rank': entry.rank,
+                }
+                for entry in page
+            ]
+        elif search_type == 'questions':
+            if not request.user.is_staff:
+                return Response({'error': 'Question search is limited to staff'}, status=status.HTTP_403_FORBIDDEN)
+            raw_category = request.query_params.get('category_id')
+            try:
+                category_id = int(raw_category) if raw_category else None
+            except ValueError:
+                return Response({'error': 'category_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            page = self.paginate_queryset(search_questions(query, category_id))
+            results = [
+                {
+                    'id': entry.question_id,
+                    'category_id': entry.category_id,
+                    'category_name': entry.category.name,
+                    'text': entry.question.text,
+                    'text_ar': entry.question.text_ar,
+                    'answer': entry.question.answer,
+                    'answer_ar': entry.question.answer_ar,
+                    'difficulty': entry.question.difficulty,
+                    'rank': entry.rank,
+                }
+                for entry in page
+            ]
+        else:
+            return Response({'error': "type must be 'categories' or 'questions'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.get_paginated_response(results)
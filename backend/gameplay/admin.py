@@ -1,6 +1,13 @@
 from django.contrib import admin
+from utils.streaming_export import export_admin_action
 from .models import Game, PlayedQuestion
 
+GAME_EXPORT_FIELDS = ['id', 'player_id', 'player__username', 'mode', 'date_played', 'teams']
+PLAYED_QUESTION_EXPORT_FIELDS = [
+    'id', 'game_id', 'game__player_id', 'game__player__username', 'game__mode', 'game__date_played',
+    'question_id', 'question__category_id', 'question__category__name', 'question__difficulty',
+]
+
 
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
@@ -8,6 +15,10 @@ class GameAdmin(admin.ModelAdmin):
     list_filter = ['mode', 'date_played']
     search_fields = ['player__username']
     filter_horizontal = ['categories']
+    actions = [
+        export_admin_action('ndjson', GAME_EXPORT_FIELDS, 'games'),
+        export_admin_action('csv', GAME_EXPORT_FIELDS, 'games'),
+    ]
     
     def team_count(self, obj):
         """Show number of teams in the game"""
@@ -20,3 +31,7 @@ class PlayedQuestionAdmin(admin.ModelAdmin):
     list_display = ['game', 'question']
     list_filter = ['game__mode']
     search_fields = ['game__player__username', 'question__text']
+    actions = [
+        export_admin_action('ndjson', PLAYED_QUESTION_EXPORT_FIELDS, 'played-questions'),
+        export_admin_action('csv', PLAYED_QUESTION_EXPORT_FIELDS, 'played-questions'),
+    ]
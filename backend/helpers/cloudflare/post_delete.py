@@ -1,24 +1,164 @@
-from content.models import Question, Category
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import FileField
 from django.db.models.signals import post_delete
-from django.dispatch import receiver
-from django.db.models import FileField, ImageField
+from django.utils import timezone
 
-@receiver(post_delete)
-def auto_delete_files_on_delete(sender, instance, **kwargs):
+from content.models import StorageDeletion
+
+logger = logging.getLogger(__name__)
+
+# (model, field name) for every file field in the project, filled by connect_file_cleanup()
+FILE_FIELDS = []
+
+FLUSH_BATCH_SIZE = 1000     # Objects per multi-object DELETE
+MAX_DELETE_ATTEMPTS = 8     # After this, rows stay in the journal for inspection
+FLUSH_SCHEDULED_KEY = 'v1:storage-deletions:flush-scheduled'
+
+
+def connect_file_cleanup():
     """
-    Deletes all ImageField and FileField files from storage when their model instance is deleted.
-    Works across all apps.
+    Connect the post_delete receiver to models that actually have file fields
+    (ImageField included), instead of running for every deleted row of every model.
     """
-    # Skip built-in Django apps (admin, auth, etc.)
-    if sender._meta.app_label in ['contenttypes', 'sessions', 'admin', 'auth']:
-        return
+    for model in apps.get_models():
+        field_names = [field.name for field in model._meta.get_fields() if isinstance(field, FileField)]
+        if not field_names:
+            continue
+        FILE_FIELDS.extend((model, name) for name in field_names)
+        post_delete.connect(
+            auto_delete_files_on_delete,
+            sender=model,
+            dispatch_uid=f'auto_delete_files_{model._meta.label_lower}',
+        )
 
+
+def auto_delete_files_on_delete(sender, instance, **kwargs):
+    """
+    Journal every file (and responsive variant in a sibling `<field>_variants` JSON field)
+    of a deleted instance. The journal row is written in the deleting transaction, so a
+    rollback keeps the files; the actual storage deletes happen after commit, in batches.
+    """
+    entries = []
     for field in sender._meta.get_fields():
-        if isinstance(field, (FileField, ImageField)):
-            file_field = getattr(instance, field.name)
-            if file_field:
-                try:
-                    file_field.delete(save=False)
-                except Exception as e:
-                    print(f"Failed to delete {sender.__name__}.{field.name}: {e}")
+        if not isinstance(field, FileField):
+            continue
+        file_field = getattr(instance, field.name)
+        if not file_field:
+            continue
+        variants = getattr(instance, f"{field.name}_variants", None) or {}
+        keys = {file_field.name} | {
+            path
+            for entry in variants.values()
+            for fmt, path in entry.items()
+            if fmt != 'width'
+        }
+        entries.extend(StorageDeletion(key=key, source=file_field.name) for key in keys)
+
+    if entries:
+        StorageDeletion.objects.bulk_create(entries)
+        transaction.on_commit(schedule_storage_flush)
+
+
+def journal_files(queryset):
+    """
+    Set-based counterpart of the receiver for raw deletes that skip signals:
+    journal the files of every row in `queryset`. Call before deleting the rows.
+
+    Returns:
+        int: Number of journal entries written
+    """
+    model = queryset.model
+    field_names = [name for file_model, name in FILE_FIELDS if file_model is model]
+    if not field_names:
+        return 0
+    variant_fields = [f"{name}_variants" for name in field_names if hasattr(model, f"{name}_variants")]
+
+    entries = []
+    for row in queryset.values(*field_names, *variant_fields):
+        for name in field_names:
+            if not row[name]:
+                continue
+            variants = row.get(f"{name}_variants") or {}
+            keys = {row[name]} | {
+                path
+                for entry in variants.values()
+                for fmt, path in entry.items()
+                if fmt != 'width'
+            }
+            entries.extend(StorageDeletion(key=key, source=row[name]) for key in keys)
+
+    if entries:
+        StorageDeletion.objects.bulk_create(entries, batch_size=1000)
+        transaction.on_commit(schedule_storage_flush)
+    return len(entries)
+
+
+def schedule_storage_flush():
+    """Queue one flush for however many deletions a transaction just committed."""
+    if cache.add(FLUSH_SCHEDULED_KEY, 1, timeout=60):
+        from content.tasks import flush_storage_deletions
+        flush_storage_deletions.delay()
+
+
+def still_referenced(sources):
+    """Return which of `sources` are still stored in some file field (deduplicated images are shared)."""
+    referenced = set()
+    for model, field_name in FILE_FIELDS:
+        referenced.update(
+            model.objects.filter(**{f'{field_name}__in': sources}).values_list(field_name, flat=True)
+        )
+    return referenced
+
+
+def flush_storage_deletions(batch_size=FLUSH_BATCH_SIZE, storage=None):
+    """
+    Delete due journal entries from storage in batches of up to `batch_size` keys.
+    Failures are retried with exponential backoff; successes are removed from the journal.
+
+    Returns:
+        (int, int): Objects deleted, objects that failed this round
+    """
+    from .storages import delete_many
+
+    deleted = failed = 0
+    cache.delete(FLUSH_SCHEDULED_KEY)  # Deletions committed from now on schedule a new flush
+    while True:
+        batch = list(
+            StorageDeletion.objects
+            .filter(attempts__lt=MAX_DELETE_ATTEMPTS, next_attempt_at__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            break
+
+        # Another row may have adopted the same (deduplicated) file since it was journaled
+        kept = still_referenced({row.source for row in batch if row.source})
+        to_delete = sorted({row.key for row in batch if row.source not in kept})
+        errors = delete_many(to_delete, storage=storage) if to_delete else {}
+
+        done_ids = [row.id for row in batch if row.key not in errors]
+        StorageDeletion.objects.filter(id__in=done_ids).delete()
+        deleted += len({row.key for row in batch if row.key not in errors and row.source not in kept})
+
+        for row in batch:
+            if row.key in errors:
+                row.attempts += 1
+                row.last_error = errors[row.key][:1000]
+                row.next_attempt_at = timezone.now() + timedelta(seconds=30 * 2 ** row.attempts)
+        retry_rows = [row for row in batch if row.key in errors]
+        if retry_rows:
+            StorageDeletion.objects.bulk_update(retry_rows, ['attempts', 'last_error', 'next_attempt_at'])
+            failed += len(retry_rows)
+            logger.warning(f"Storage deletion failed for {len(retry_rows)} object(s), will retry: {retry_rows[0].last_error}")
+
+        if len(batch) < batch_size:
+            break
 
+    if deleted or failed:
+        logger.info(f"🗑️ Flushed storage deletions: {deleted} deleted, {failed} failed")
+    return deleted, failed
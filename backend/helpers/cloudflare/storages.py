@@ -1,8 +1,35 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.base import ContentFile
+
 try:
     # django-storages >= 1.14 renames the backend module to storages.backends.s3
     from storages.backends.s3 import S3Storage
 except ImportError:  # pragma: no cover - fallback for older versions
     from storages.backends.s3boto3 import S3Boto3Storage as S3Storage
+from storages.utils import clean_name
+
+logger = logging.getLogger(__name__)
+
+# Manifest size for objects we wrote without knowing their size: listed, size unknown
+UNKNOWN_SIZE = -1
+
+# Bytes held in each local-disk cache directory as this process last counted them.
+# Other processes may share the directory, so the count is resynced by a full walk
+# whenever it crosses the budget (see CachedMediaFileStorage._track_disk_usage).
+_disk_usage = {}
+_disk_usage_lock = threading.Lock()
+
 
 class StaticFileStorage(S3Storage):
 # helpers.cloudflare.storages.StaticFileStorage
@@ -11,3 +38,509 @@ class StaticFileStorage(S3Storage):
 class MediaFileStorage(S3Storage):
 # helpers.cloudflare.storages.MediaFileStorage
     location = "media"
+
+    def get_default_settings(self):
+        defaults = super().get_default_settings()
+        defaults.update({
+            'upload_concurrency': getattr(settings, 'MEDIA_UPLOAD_CONCURRENCY', 8),
+            'multipart_threshold': getattr(settings, 'MEDIA_MULTIPART_THRESHOLD_BYTES', 8 * 1024 * 1024),
+        })
+        return defaults
+
+    def save_many(self, items, max_workers=None, dry_run=False):
+        """
+        Upload a batch of (name, bytes) pairs concurrently.
+
+        Uploads run on a bounded thread pool sharing this storage's boto3 client
+        (clients are thread-safe and pool their connections), so the pool is capped
+        at the client's max_pool_connections. Objects above multipart_threshold go
+        up as multipart uploads.
+
+        With dry_run=True nothing is sent; names are resolved as they would be.
+
+        Returns:
+            list[dict]: One result per item, in input order:
+            {'name': requested, 'saved_name': str, 'size': int, 'error': None | str}
+        """
+        from boto3.s3.transfer import TransferConfig
+
+        prepared = [(name, self.get_available_name(clean_name(name)), data) for name, data in items]
+        if dry_run or not prepared:
+            return [{'name': name, 'saved_name': saved, 'size': len(data), 'error': None} for name, saved, data in prepared]
+
+        client = self.connection.meta.client
+        workers = max(1, min(max_workers or self.upload_concurrency, len(prepared), client.meta.config.max_pool_connections))
+        # Parallelism comes from the pool; parts of one large object go up sequentially
+        transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_threshold,
+            use_threads=False,
+        )
+
+        def upload(entry):
+            name, saved, data = entry
+            key = self._normalize_name(saved)
+            try:
+                client.upload_fileobj(
+                    BytesIO(data), self.bucket_name, key,
+                    ExtraArgs=self._get_write_parameters(key), Config=transfer_config,
+                )
+                return {'name': name, 'saved_name': saved, 'size': len(data), 'error': None}
+            except Exception as e:
+                logger.warning(f"Batch upload failed for {saved}: {e}")
+                return {'name': name, 'saved_name': saved, 'size': len(data), 'error': str(e)}
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-upload') as pool:
+            results = list(pool.map(upload, prepared))
+        failed = sum(1 for result in results if result['error'])
+        logger.info(
+            f"📤 Uploaded {len(results) - failed}/{len(results)} objects with {workers} workers "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return results
+
+    def iter_objects(self, prefix='', page_size=1000):
+        """
+        Yield (name, size) for every object under `prefix`, one listing page at a time.
+        Names are relative to the storage location, like FieldFile.name.
+        """
+        root = f"{self.location}/" if self.location else ''
+        paginator = self.connection.meta.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=root + prefix,
+            PaginationConfig={'PageSize': page_size},
+        )
+        for page in pages:
+            for entry in page.get('Contents', ()):
+                yield entry['Key'][len(root):], entry['Size']
+
+    def delete_many(self, names):
+        """
+        Delete objects with multi-object DELETE requests (up to 1000 keys each).
+
+        Returns:
+            dict: {name: error message} for every object that could not be deleted
+        """
+        names = [clean_name(name) for name in names]
+        client = self.connection.meta.client
+        failed = {}
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            keys = {self._normalize_name(name): name for name in chunk}
+            try:
+                response = client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+                )
+            except Exception as e:
+                failed.update({name: str(e) for name in chunk})
+                continue
+            for error in response.get('Errors', ()):
+                failed[keys.get(error['Key'], error['Key'])] = f"{error.get('Code')}: {error.get('Message')}"
+        return failed
+
+    def presigned_put(self, name, content_type, content_length, expire=900):
+        """
+        Return a presigned URL the client can PUT `name` to directly.
+        Content-Type and Content-Length are part of the signature, so the
+        client must send exactly what it declared.
+        """
+        return self.connection.meta.client.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': self._normalize_name(clean_name(name)),
+                'ContentType': content_type,
+                'ContentLength': content_length,
+            },
+            ExpiresIn=expire,
+            HttpMethod='PUT',
+        )
+
+    def content_type(self, name):
+        """Content-Type the object was stored with (a HEAD request, never cached)."""
+        return self.bucket.Object(self._normalize_name(clean_name(name))).content_type
+
+
+class ObjectManifest:
+    """
+    Process-wide index of bucket objects (name -> size in bytes).
+
+    Built from a full bucket listing and persisted to a local JSON file so every
+    worker on the host can load it without listing the bucket itself. Our own
+    writes and deletes are applied to the in-memory copy as they happen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+        self._generated_at = None
+        self._file_mtime = None
+
+    def load(self, path):
+        """(Re)load the manifest file if it changed since the last load."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable media manifest {path}: {e}")
+            return
+        with self._lock:
+            self._objects = data.get('objects', {})
+            self._generated_at = data.get('generated_at')
+            self._file_mtime = mtime
+
+    def replace(self, objects, path=None):
+        """Install a fresh listing, optionally writing it to `path` atomically."""
+        generated_at = time.time()
+        if path:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump({'generated_at': generated_at, 'objects': objects}, fh)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._objects = dict(objects)
+            self._generated_at = generated_at
+            self._file_mtime = os.path.getmtime(path) if path else None
+
+    def is_fresh(self, ttl):
+        return self._generated_at is not None and time.time() - self._generated_at < ttl
+
+    def lookup(self, name):
+        """Return the size of `name` (UNKNOWN_SIZE if not recorded), or None if the manifest doesn't list it."""
+        with self._lock:
+            return self._objects.get(name)
+
+    def add(self, name, size):
+        with self._lock:
+            self._objects[name] = UNKNOWN_SIZE if size is None else size
+
+    def discard(self, name):
+        with self._lock:
+            self._objects.pop(name, None)
+
+    def __len__(self):
+        return len(self._objects)
+
+
+# Shared by every CachedMediaFileStorage instance in this process
+media_manifest = ObjectManifest()
+
+
+def delete_many(names, storage=None):
+    """
+    Delete many objects from `storage` (default_storage by default), batched where the
+    backend supports it and one by one otherwise.
+
+    Returns:
+        dict: {name: error message} for every object that could not be deleted
+    """
+    from django.core.files.storage import default_storage
+
+    storage = storage or default_storage
+    if hasattr(storage, 'delete_many'):
+        return storage.delete_many(names)
+
+    failed = {}
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            failed[name] = str(e)
+    return failed
+
+
+def save_many(items, storage=None, max_workers=None, dry_run=False):
+    """
+    Upload a batch of (name, bytes) pairs through `storage` (default_storage by default).
+
+    Uses the storage's own concurrent save_many when it has one; any other backend
+    (e.g. FileSystemStorage in local development) gets a thread pool over save().
+    Results have the same shape as MediaFileStorage.save_many.
+    """
+    from django.core.files.storage import default_storage
+
+    storage = storage or default_storage
+    if hasattr(storage, 'save_many'):
+        return storage.save_many(items, max_workers=max_workers, dry_run=dry_run)
+
+    items = list(items)
+    if dry_run:
+        return [{'name': name, 'saved_name': storage.get_available_name(name), 'size': len(data), 'error': None} for name, data in items]
+
+    def upload(item):
+        name, data = item
+        try:
+            return {'name': name, 'saved_name': storage.save(name, ContentFile(data)), 'size': len(data), 'error': None}
+        except Exception as e:
+            return {'name': name, 'saved_name': name, 'size': len(data), 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers or 8, len(items) or 1))) as pool:
+        return list(pool.map(upload, items))
+
+
+class CachedMediaFileStorage(MediaFileStorage):
+    """
+    MediaFileStorage that avoids a network round trip for repeated metadata lookups.
+
+    - exists()/size()/url() results are memoized in the metadata_cache alias
+      (its own bounded space, so culling it never evicts app keys). "Missing"
+      answers are only kept for negative_timeout seconds, since another worker or
+      host may write the object meanwhile.
+    - A fresh object manifest (see refresh_manifest) answers exists()/size() for
+      listed objects without touching R2; names it doesn't list are checked on R2.
+    - Our own _save()/delete() calls keep both the memo and the manifest current.
+    - Optionally, object bytes read through _open() are kept in a bounded
+      local-disk cache (disabled unless disk_cache_dir is set).
+    """
+
+    def get_default_settings(self):
+        defaults = super().get_default_settings()
+        defaults.update({
+            'metadata_cache': getattr(settings, 'MEDIA_STORAGE_CACHE', 'media-metadata'),
+            'metadata_timeout': getattr(settings, 'MEDIA_STORAGE_METADATA_TIMEOUT', 120),
+            'negative_timeout': getattr(settings, 'MEDIA_STORAGE_NEGATIVE_TIMEOUT', 60),
+            'manifest_path': getattr(settings, 'MEDIA_STORAGE_MANIFEST_PATH', ''),
+            'manifest_ttl': getattr(settings, 'MEDIA_STORAGE_MANIFEST_TTL', 900),
+            'disk_cache_dir': getattr(settings, 'MEDIA_DISK_CACHE_DIR', ''),
+            'disk_cache_max_bytes': getattr(settings, 'MEDIA_DISK_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        })
+        return defaults
+
+    # ------------------------------
+    # Metadata memo (Django cache)
+    # ------------------------------
+
+    @property
+    def _memo(self):
+        return caches[self.metadata_cache]
+
+    def _cache_key(self, kind, name):
+        digest = hashlib.sha1(f"{self.bucket_name}:{name}".encode('utf-8')).hexdigest()
+        # Cache key version: v1 - allows easy invalidation if format changes
+        return f"v1:media:{kind}:{digest}"
+
+    def _remember(self, name, exists, size=None):
+        timeout = self.metadata_timeout if exists else self.negative_timeout
+        self._memo.set(self._cache_key('meta', name), {'exists': exists, 'size': size}, timeout=timeout)
+
+    def _forget(self, name):
+        self._memo.delete_many([self._cache_key('meta', name), self._cache_key('url', name)])
+
+    def _manifest(self):
+        """Return the shared manifest if it is fresh enough to be authoritative."""
+        if self.manifest_path:
+            media_manifest.load(self.manifest_path)
+        return media_manifest if media_manifest.is_fresh(self.manifest_ttl) else None
+
+    def exists(self, name):
+        name = clean_name(name)
+        meta = self._memo.get(self._cache_key('meta', name))
+        if meta is not None:
+            return meta['exists']
+
+        manifest = self._manifest()
+        if manifest is not None:
+            size = manifest.lookup(name)
+            if size is not None:
+                self._remember(name, True, None if size == UNKNOWN_SIZE else size)
+                return True
+            # Not listed: it may have been written elsewhere since the listing, so ask R2
+
+        return self.exists_uncached(name)
+
+    def exists_uncached(self, name):
+        """HEAD the object on R2 and refresh the cached answer. Use before destructive decisions."""
+        name = clean_name(name)
+        exists = super().exists(name)
+        self._remember(name, exists)
+        if not exists:
+            media_manifest.discard(name)
+        return exists
+
+    def size(self, name):
+        name = clean_name(name)
+        meta = self._memo.get(self._cache_key('meta', name))
+        if meta is not None and meta['size'] is not None:
+            return meta['size']
+
+        manifest = self._manifest()
+        size = manifest.lookup(name) if manifest is not None else None
+        if size is None or size == UNKNOWN_SIZE:
+            size = super().size(name)
+        self._remember(name, True, size)
+        return size
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        # Only the plain url(name) form is memoized; custom parameters always go to the signer
+        if parameters or expire is not None or http_method is not None:
+            return super().url(name, parameters=parameters, expire=expire, http_method=http_method)
+
+        name = clean_name(name)
+        key = self._cache_key('url', name)
+        url = self._memo.get(key)
+        if url is None:
+            url = super().url(name)
+            timeout = self.metadata_timeout
+            if self.querystring_auth:
+                # Never hand out a signed URL that is about to expire
+                timeout = min(timeout, self.querystring_expire // 2)
+            self._memo.set(key, url, timeout=timeout)
+        return url
+
+    # ------------------------------
+    # Writes keep memo + manifest current
+    # ------------------------------
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        self._record_saved(name, getattr(content, 'size', None))
+        return name
+
+    def save_many(self, items, max_workers=None, dry_run=False):
+        results = super().save_many(items, max_workers=max_workers, dry_run=dry_run)
+        if not dry_run:
+            for result in results:
+                if not result['error']:
+                    self._record_saved(result['saved_name'], result['size'])
+        return results
+
+    def _record_saved(self, name, size):
+        self._forget(name)
+        self._remember(name, True, size)
+        media_manifest.add(name, size)
+        self._drop_disk_copy(name)
+
+    def delete(self, name):
+        super().delete(name)
+        name = clean_name(name)
+        self._forget(name)
+        self._remember(name, False)
+        media_manifest.discard(name)
+        self._drop_disk_copy(name)
+
+    def delete_many(self, names):
+        failed = super().delete_many(names)
+        for name in names:
+            name = clean_name(name)
+            if name not in failed:
+                self._forget(name)
+                self._remember(name, False)
+                media_manifest.discard(name)
+                self._drop_disk_copy(name)
+        return failed
+
+    def refresh_manifest(self):
+        """
+        List every object under this storage's location and install the result
+        as the shared manifest (written to manifest_path when configured).
+
+        Returns:
+            int: Number of objects listed
+        """
+        objects = dict(self.iter_objects())
+        media_manifest.replace(objects, path=self.manifest_path or None)
+        logger.info(f"Media manifest refreshed: {len(objects)} objects under '{self.location}/'")
+        return len(objects)
+
+    # ------------------------------
+    # Bounded local-disk read-through cache
+    # ------------------------------
+
+    def _disk_path(self, name):
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_cache_dir, digest[:2], digest)
+
+    def _drop_disk_copy(self, name):
+        if self.disk_cache_dir:
+            path = self._disk_path(name)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self._track_disk_usage(-size)
+
+    def _open(self, name, mode='rb'):
+        if not self.disk_cache_dir or mode != 'rb':
+            return super()._open(name, mode)
+
+        name = clean_name(name)
+        path = self._disk_path(name)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Mark as recently used for eviction
+                return File(open(path, 'rb'), name=name)
+            except OSError:
+                pass  # Evicted by another worker since the check: read it from R2 instead
+
+        remote = super()._open(name, mode)
+        # Objects larger than a quarter of the budget would evict everything else
+        if remote.size > self.disk_cache_max_bytes // 4:
+            return remote
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as fh:
+                for chunk in remote.chunks():
+                    fh.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            remote.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._track_disk_usage(written)
+        return File(open(path, 'rb'), name=name)
+
+    def _track_disk_usage(self, delta):
+        """Add delta bytes to the running total, pruning only once it goes over the budget."""
+        with _disk_usage_lock:
+            total = _disk_usage.get(self.disk_cache_dir)
+            if total is not None:
+                total = _disk_usage[self.disk_cache_dir] = max(0, total + delta)
+        # The first write in a process has no count yet, so it takes one walk to establish it
+        if delta > 0 and (total is None or total > self.disk_cache_max_bytes):
+            self._prune_disk_cache()
+
+    def _prune_disk_cache(self):
+        """
+        Walk the cache, evict least recently used files until it fits disk_cache_max_bytes,
+        and store the resulting size as this process's running total.
+        """
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.disk_cache_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.disk_cache_max_bytes:
+            entries.sort()
+            for _mtime, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.disk_cache_max_bytes:
+                    break
+
+        with _disk_usage_lock:
+            _disk_usage[self.disk_cache_dir] = total
@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+
+class EntitlementsMiddleware:
+    """Expose `request.entitlements` (premium access etc.) for the authenticated user.
+
+    Evaluated lazily, so DRF token authentication has already replaced the user by
+    the time a view reads it; with CachedTokenAuthentication it costs no query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from authentication.entitlements import entitlements_for
+        request.entitlements = SimpleLazyObject(lambda: entitlements_for(request.user))
+        return self.get_response(request)
@@ -1,5 +1,29 @@
 from django.contrib import admin
-from .models import Payment, Subscription
+from django.db.models import Max
+from utils.streaming_export import export_admin_action
+from .models import Payment, Subscription, WebhookEvent, WebhookPayload
+
+PAYMENT_EXPORT_FIELDS = [
+    'id', 'user_id', 'user__username', 'user__email', 'order_id', 'customer_id', 'amount', 'currency',
+    'status', 'variant_id', 'product_name', 'created_at', 'updated_at', 'paid_at',
+]
+PAYMENT_EXPORT_EXTRA_FIELDS = ['webhook_data']
+SUBSCRIPTION_EXPORT_FIELDS = [
+    'id', 'user_id', 'user__username', 'user__email', 'subscription_id', 'customer_id', 'order_id',
+    'variant_id', 'product_name', 'status', 'trial_ends_at', 'renews_at', 'ends_at', 'created_at', 'updated_at',
+]
+
+
+def add_webhook_data(rows):
+    """Fill in each exported payment's latest webhook payload, one lookup per chunk of rows."""
+    latest = (
+        WebhookPayload.objects.filter(payment_id__in=[row['id'] for row in rows])
+        .values('payment_id').annotate(latest=Max('pk')).values('latest')
+    )
+    payloads = {payload.payment_id: payload for payload in WebhookPayload.objects.filter(pk__in=latest)}
+    for row in rows:
+        payload = payloads.get(row['id'])
+        row['webhook_data'] = payload.load() if payload else None
 
 
 @admin.register(Payment)
@@ -9,6 +33,16 @@ class PaymentAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email', 'order_id', 'customer_id']
     readonly_fields = ['created_at', 'updated_at', 'webhook_data']
     date_hierarchy = 'created_at'
+    actions = [
+        export_admin_action(
+            'ndjson', PAYMENT_EXPORT_FIELDS, 'payments',
+            extra_fields=PAYMENT_EXPORT_EXTRA_FIELDS, extend_chunk=add_webhook_data,
+        ),
+        export_admin_action(
+            'csv', PAYMENT_EXPORT_FIELDS, 'payments',
+            extra_fields=PAYMENT_EXPORT_EXTRA_FIELDS, extend_chunk=add_webhook_data,
+        ),
+    ]
 
 
 @admin.register(Subscription)
@@ -18,3 +52,29 @@ class SubscriptionAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email', 'subscription_id', 'customer_id']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
+    actions = [
+        export_admin_action('ndjson', SUBSCRIPTION_EXPORT_FIELDS, 'subscriptions'),
+        export_admin_action('csv', SUBSCRIPTION_EXPORT_FIELDS, 'subscriptions'),
+    ]
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event_name', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_name', 'received_at']
+    search_fields = ['dedup_key', 'event_name']
+    readonly_fields = [field.name for field in WebhookEvent._meta.fields] + ['payload']
+    date_hierarchy = 'received_at'
+    actions = ['replay']
+
+    def has_add_permission(self, request):
+        return False
+
+    def replay(self, request, queryset):
+        """Re-apply the selected events in the background (handlers are idempotent)"""
+        from .tasks import process_webhook_event
+        event_ids = list(queryset.values_list('pk', flat=True))
+        for event_id in event_ids:
+            process_webhook_event.delay(event_id, force=True)
+        self.message_user(request, f'🔁 Queued {len(event_ids)} webhook events for replay.')
+    replay.short_description = "Replay selected events"
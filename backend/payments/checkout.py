@@ -0,0 +1,92 @@
+"""
+Checkout session reuse.
+
+A checkout URL created for a user, variant and plan is cached for
+CHECKOUT_URL_CACHE_TTL seconds, so repeated "Go Premium" clicks reuse it instead of
+calling Lemon Squeezy again. Concurrent requests for the same key are single-flight:
+one caller creates the checkout while the others wait briefly for its URL.
+
+Both the URL and the single-flight lock live in the default cache. With the
+per-process LocMemCache configured in settings they only span one worker: a click
+landing on another worker creates its own checkout, which is harmless (just an extra
+API call). A shared cache backend (Redis) makes both span every worker. Either way a
+waiter gives up after CHECKOUT_WAIT_SECONDS and creates the checkout itself, so a
+stuck lock holder never holds a request for long.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_LOCK_SECONDS = 30  # longer than a checkout call can take with its retries
+CHECKOUT_WAIT_SECONDS = 2  # about one checkout API call; waiting longer only delays the user
+CHECKOUT_POLL_SECONDS = 0.1
+
+
+def checkout_cache_key(user_id, variant_id, plan):
+    plan_hash = hashlib.sha1(str(plan).encode()).hexdigest()[:12]
+    return f'v1:payments:checkout:{user_id}:{variant_id}:{plan_hash}'
+
+
+def forget_checkout(user_id, variant_id, plan='premium'):
+    """Drop a cached checkout URL (e.g. once the order went through)."""
+    cache.delete(checkout_cache_key(user_id, variant_id, plan))
+
+
+def _cached(key):
+    url = cache.get(key)
+    if url:
+        return {'success': True, 'checkout_url': url, 'cached': True}
+    return None
+
+
+def get_or_create_checkout(client, user, variant_id, plan):
+    """
+    A checkout URL for `user`, reused while cached.
+
+    Returns:
+        dict: LemonSqueezyClient.create_checkout's result ('cached': True when reused)
+    """
+    key = checkout_cache_key(user.id, variant_id, plan)
+    result = _cached(key)
+    if result:
+        return result
+
+    lock_key = f'{key}:lock'
+    locked = cache.add(lock_key, True, timeout=CHECKOUT_LOCK_SECONDS)
+    deadline = time.monotonic() + CHECKOUT_WAIT_SECONDS
+    while not locked:
+        # Another request is creating this checkout; take its URL when it lands
+        time.sleep(CHECKOUT_POLL_SECONDS)
+        result = _cached(key)
+        if result:
+            return result
+        if time.monotonic() >= deadline:
+            logger.warning(f"Checkout single-flight wait timed out for user {user.id}; creating directly")
+            break
+        locked = cache.add(lock_key, True, timeout=CHECKOUT_LOCK_SECONDS)
+
+    try:
+        result = _cached(key)  # Filled while we were acquiring the lock
+        if result:
+            return result
+        result = client.create_checkout(
+            variant_id=variant_id,
+            customer_email=user.email,
+            customer_name=user.username,
+            custom_data={
+                "user_id": str(user.id),
+                "username": user.username,
+                "plan": plan,
+            },
+        )
+        if result.get('success'):
+            cache.set(key, result['checkout_url'], timeout=settings.CHECKOUT_URL_CACHE_TTL)
+        return result
+    finally:
+        if locked:
+            cache.delete(lock_key)
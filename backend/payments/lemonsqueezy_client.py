@@ -8,6 +8,8 @@ from typing import Dict, Optional
 import requests
 from django.conf import settings
 
+from utils.http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,6 +30,8 @@ class LemonSqueezyClient:
                 "Please set LEMONSQUEEZY_API_KEY and LEMONSQUEEZY_STORE_ID in your .env file. "
                 
             )
+        # Shared keep-alive pool, retries and circuit breaker (see utils/http_client.py)
+        self.http = get_client('lemonsqueezy')
         
     def _get_headers(self) -> Dict[str, str]:
         """Get API headers with authentication"""
@@ -90,11 +94,10 @@ class LemonSqueezyClient:
             payload["data"]["attributes"]["checkout_data"]["name"] = customer_name
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 json=payload,
                 headers=self._get_headers(),
-                timeout=10
             )
             if response.status_code >= 400:
                 # Log detailed error info to help diagnose 404s (e.g., invalid variant/store)
@@ -182,10 +185,9 @@ class LemonSqueezyClient:
         url = f"{self.BASE_URL}/orders/{order_id}"
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 url,
                 headers=self._get_headers(),
-                timeout=10
             )
             response.raise_for_status()
             return response.json()
@@ -207,10 +209,9 @@ class LemonSqueezyClient:
         url = f"{self.BASE_URL}/subscriptions/{subscription_id}"
         
         try:
-            response = requests.get(
+            response = self.http.get(
                 url,
                 headers=self._get_headers(),
-                timeout=10
             )
             response.raise_for_status()
             return response.json()
@@ -0,0 +1,61 @@
+"""
+Management command to re-apply stored Lemon Squeezy webhook events.
+
+Handlers are idempotent (upserts on order/subscription ids), so replaying an event
+that was already applied leaves the same state. Use it after fixing a handler bug,
+or to recover events that ran out of retries.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import WebhookEvent
+from payments.webhooks import claim_event, process_event
+
+
+class Command(BaseCommand):
+    help = 'Replay stored webhook events (failed ones by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int, help='Specific event ids to replay (any status).')
+        parser.add_argument(
+            '--status',
+            action='append',
+            choices=[choice for choice, _ in WebhookEvent.STATUS_CHOICES],
+            help='Replay events with this status (repeatable; default: failed).',
+        )
+        parser.add_argument('--event', help='Only events with this event name (e.g. order_created).')
+        parser.add_argument('--since', help='Only events received on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the events that would be replayed.')
+
+    def handle(self, *args, **options):
+        events = WebhookEvent.objects.order_by('received_at')
+        if options['event_ids']:
+            events = events.filter(pk__in=options['event_ids'])
+        else:
+            events = events.filter(status__in=options['status'] or ['failed'])
+        if options['event']:
+            events = events.filter(event_name=options['event'])
+        if options['since']:
+            events = events.filter(received_at__date__gte=options['since'])
+
+        event_ids = list(events.values_list('pk', flat=True))
+        if not event_ids:
+            raise CommandError('No matching webhook events')
+        if options['dry_run']:
+            self.stdout.write(f'🔎 {len(event_ids)} event(s) would be replayed: {event_ids[:50]}')
+            return
+
+        replayed = failed = skipped = 0
+        for event_id in event_ids:
+            if not claim_event(event_id, force=True):
+                skipped += 1  # Being processed by a worker right now
+                continue
+            try:
+                process_event(WebhookEvent.objects.select_related('raw').get(pk=event_id))
+                replayed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f'❌ Event {event_id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Replayed {replayed} event(s), {failed} failed, {skipped} skipped (in progress)'
+        ))
@@ -0,0 +1,97 @@
+# Generated by Django 5.1.3 on 2026-10-19 15:30
+
+import gzip
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 500
+
+
+def _compress(payload):
+    # Frozen copy of payments/payloads.py compress(), so later changes there can't alter this migration
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    try:
+        import zstandard
+    except ImportError:
+        return 'gzip', gzip.compress(raw, compresslevel=6, mtime=0), len(raw)
+    return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw), len(raw)
+
+
+def _decompress(codec, blob):
+    if codec == 'zstd':
+        import zstandard
+        return json.loads(zstandard.ZstdDecompressor().decompress(bytes(blob)))
+    return json.loads(gzip.decompress(bytes(blob)))
+
+
+def move_payloads(apps, schema_editor):
+    """Copy inline webhook_data into compressed WebhookPayload rows, one committed chunk at a time."""
+    Payment = apps.get_model('payments', 'Payment')
+    WebhookPayload = apps.get_model('payments', 'WebhookPayload')
+    payments = Payment.objects.filter(webhook_data__isnull=False).order_by('pk')
+    last_pk = 0
+    while True:
+        chunk = list(payments.filter(pk__gt=last_pk).values('pk', 'webhook_data')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        rows = []
+        for payment in chunk:
+            codec, data, raw_size = _compress(payment['webhook_data'])
+            meta = payment['webhook_data'].get('meta') if isinstance(payment['webhook_data'], dict) else None
+            rows.append(WebhookPayload(
+                payment_id=payment['pk'],
+                event_name=((meta or {}).get('event_name') or '')[:100],
+                codec=codec,
+                data=data,
+                raw_size=raw_size,
+            ))
+        with transaction.atomic():
+            WebhookPayload.objects.bulk_create(rows)
+        last_pk = chunk[-1]['pk']
+
+
+def restore_payloads(apps, schema_editor):
+    """Reverse: put each payment's latest payload back inline."""
+    Payment = apps.get_model('payments', 'Payment')
+    WebhookPayload = apps.get_model('payments', 'WebhookPayload')
+    latest = {}
+    for payload in WebhookPayload.objects.order_by('pk').iterator(chunk_size=CHUNK_SIZE):
+        latest[payload.payment_id] = payload.pk
+    payload_ids = list(latest.values())
+    for start in range(0, len(payload_ids), CHUNK_SIZE):
+        with transaction.atomic():
+            for payload in WebhookPayload.objects.filter(pk__in=payload_ids[start:start + CHUNK_SIZE]):
+                Payment.objects.filter(pk=payload.payment_id).update(
+                    webhook_data=_decompress(payload.codec, payload.data)
+                )
+
+
+class Migration(migrations.Migration):
+    # The data move commits chunk by chunk instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('payments', '0002_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_name', models.CharField(blank=True, max_length=100)),
+                ('codec', models.CharField(choices=[('zstd', 'zstd'), ('gzip', 'gzip')], max_length=10)),
+                ('data', models.BinaryField()),
+                ('raw_size', models.PositiveIntegerField(help_text='Uncompressed size in bytes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_payloads', to='payments.payment')),
+            ],
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+        migrations.RemoveField(
+            model_name='payment',
+            name='webhook_data',
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:10
+
+import gzip
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 500
+ORDER_EVENTS = ('order_created', 'order_refunded')
+
+
+def _compress(payload):
+    # Frozen copy of payments/payloads.py compress(), so later changes there can't alter this migration
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    try:
+        import zstandard
+    except ImportError:
+        return 'gzip', gzip.compress(raw, compresslevel=6, mtime=0), len(raw)
+    return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw), len(raw)
+
+
+def _decompress(codec, blob):
+    if codec == 'zstd':
+        import zstandard
+        return json.loads(zstandard.ZstdDecompressor().decompress(bytes(blob)))
+    return json.loads(gzip.decompress(bytes(blob)))
+
+
+def _order_id(payload):
+    data = payload.get('data') or {}
+    attributes = data.get('attributes') or {}
+    return str(data.get('id') or attributes.get('order_id') or attributes.get('order_number'))
+
+
+def move_event_payloads(apps, schema_editor):
+    """Compress each event's inline payload into a WebhookPayload row it points at, one committed chunk at a time."""
+    Payment = apps.get_model('payments', 'Payment')
+    WebhookEvent = apps.get_model('payments', 'WebhookEvent')
+    WebhookPayload = apps.get_model('payments', 'WebhookPayload')
+    events = WebhookEvent.objects.filter(raw__isnull=True).order_by('pk')
+    while True:
+        chunk = list(events.values('pk', 'event_name', 'status', 'payload')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        # Applied order events become part of their payment's history, as new events do
+        order_ids = {
+            _order_id(event['payload']) for event in chunk
+            if event['status'] == 'processed' and event['event_name'] in ORDER_EVENTS and isinstance(event['payload'], dict)
+        }
+        payment_ids = dict(Payment.objects.filter(order_id__in=order_ids).values_list('order_id', 'pk'))
+        rows = []
+        for event in chunk:
+            codec, data, raw_size = _compress(event['payload'])
+            linked = event['status'] == 'processed' and event['event_name'] in ORDER_EVENTS
+            rows.append(WebhookPayload(
+                payment_id=payment_ids.get(_order_id(event['payload'])) if linked else None,
+                event_name=event['event_name'],
+                codec=codec,
+                data=data,
+                raw_size=raw_size,
+            ))
+        with transaction.atomic():
+            WebhookPayload.objects.bulk_create(rows)
+            for event, row in zip(chunk, rows):
+                WebhookEvent.objects.filter(pk=event['pk']).update(raw_id=row.pk)
+
+
+def restore_event_payloads(apps, schema_editor):
+    """Reverse: put each event's payload back inline and drop the rows no payment refers to."""
+    WebhookEvent = apps.get_model('payments', 'WebhookEvent')
+    WebhookPayload = apps.get_model('payments', 'WebhookPayload')
+    events = WebhookEvent.objects.filter(raw__isnull=False, payload__isnull=True).order_by('pk')
+    while True:
+        chunk = list(events.select_related('raw')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        with transaction.atomic():
+            for event in chunk:
+                WebhookEvent.objects.filter(pk=event.pk).update(payload=_decompress(event.raw.codec, event.raw.data))
+    WebhookEvent.objects.update(raw=None)
+    WebhookPayload.objects.filter(payment__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    # The data move commits chunk by chunk instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('payments', '0003_webhookpayload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookpayload',
+            name='payment',
+            field=models.ForeignKey(blank=True, help_text='Payment the event was applied to', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='webhook_payloads', to='payments.payment'),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='raw',
+            field=models.OneToOneField(help_text='Compressed webhook body', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='event', to='payments.webhookpayload'),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='payload',
+            field=models.JSONField(help_text='Parsed webhook body', null=True),
+        ),
+        migrations.RunPython(move_event_payloads, restore_event_payloads),
+        migrations.RemoveField(
+            model_name='webhookevent',
+            name='payload',
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='raw',
+            field=models.OneToOneField(help_text='Compressed webhook body', on_delete=django.db.models.deletion.CASCADE, related_name='event', to='payments.webhookpayload'),
+        ),
+    ]
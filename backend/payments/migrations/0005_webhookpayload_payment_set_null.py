@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_webhookevent_raw'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookpayload',
+            name='payment',
+            field=models.ForeignKey(blank=True, help_text='Payment the event was applied to', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='webhook_payloads', to='payments.payment'),
+        ),
+    ]
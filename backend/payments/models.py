@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 
 
 class Payment(models.Model):
@@ -32,8 +33,7 @@ class Payment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     paid_at = models.DateTimeField(null=True, blank=True)
     
-    # Raw webhook data for debugging
-    webhook_data = models.JSONField(null=True, blank=True, help_text='Raw webhook payload')
+    # Raw webhook bodies live compressed in WebhookPayload, keeping this table narrow
     
     class Meta:
         ordering = ['-created_at']
@@ -46,6 +46,58 @@ class Payment(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.order_id} - {self.status}"
 
+    @cached_property
+    def webhook_data(self):
+        """Latest raw webhook payload for debugging, fetched and decompressed on access."""
+        payload = self.webhook_payloads.order_by('-pk').first()
+        return payload.load() if payload else None
+
+
+class WebhookPayload(models.Model):
+    """
+    Raw webhook body, compressed (see payments/payloads.py).
+
+    Every stored WebhookEvent owns one (its only copy of the body). Once an event
+    has been applied to a payment the row is linked to it, so a payment keeps the
+    history of what Lemon Squeezy sent about it without widening the payments table.
+    Deleting a payment only unlinks its rows: the events and their dedup keys stay,
+    so a redelivered order is still recognized instead of re-creating the payment.
+    """
+    CODEC_CHOICES = [
+        ('zstd', 'zstd'),
+        ('gzip', 'gzip'),
+    ]
+
+    payment = models.ForeignKey(
+        Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhook_payloads',
+        help_text='Payment the event was applied to',
+    )
+    event_name = models.CharField(max_length=100, blank=True)
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    data = models.BinaryField()
+    raw_size = models.PositiveIntegerField(help_text='Uncompressed size in bytes')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        target = f"payment {self.payment_id}" if self.payment_id else 'no payment'
+        return f"{self.event_name or 'payload'} for {target} ({self.codec})"
+
+    @classmethod
+    def store(cls, payment, payload):
+        from .payloads import compress
+        codec, data, raw_size = compress(payload)
+        return cls.objects.create(
+            payment=payment,
+            event_name=(payload.get('meta') or {}).get('event_name') or '',
+            codec=codec,
+            data=data,
+            raw_size=raw_size,
+        )
+
+    def load(self):
+        from .payloads import decompress
+        return decompress(self.codec, self.data)
+
 
 class Subscription(models.Model):
     """Track subscription status"""
@@ -93,3 +145,47 @@ class Subscription(models.Model):
     def is_active(self):
         """Check if subscription provides access"""
         return self.status in ['on_trial', 'active']
+
+
+class WebhookEvent(models.Model):
+    """
+    A verified Lemon Squeezy webhook delivery, stored before processing.
+
+    `dedup_key` is a hash of the raw body, so redeliveries of the same event are
+    acknowledged without being stored or applied twice (see payments/webhooks.py).
+    The body itself is kept compressed in `raw`.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+
+    dedup_key = models.CharField(max_length=64, unique=True, help_text='SHA-256 of the raw webhook body')
+    event_name = models.CharField(max_length=100, blank=True)
+    raw = models.OneToOneField(
+        WebhookPayload, on_delete=models.CASCADE, related_name='event', help_text='Compressed webhook body',
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['event_name', '-received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_name or 'unknown'} #{self.pk} ({self.status})"
+
+    @cached_property
+    def payload(self):
+        """Parsed webhook body"""
+        return self.raw.load()
@@ -0,0 +1,45 @@
+"""
+Compression for stored webhook payloads.
+
+Payloads are JSON compressed with zstd when the `zstandard` package is installed,
+gzip otherwise. The codec is recorded per row, so rows written under either one
+stay readable.
+"""
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import zstandard
+except ImportError:  # Optional: gzip is used without it
+    zstandard = None
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def compress(payload):
+    """
+    Returns:
+        (str, bytes, int): Codec, compressed bytes and the uncompressed size
+    """
+    raw = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), len(raw)
+    return 'gzip', gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0), len(raw)
+
+
+def decompress(codec, blob):
+    """
+    Raises:
+        RuntimeError: For zstd rows when `zstandard` isn't installed
+    """
+    blob = bytes(blob)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read this webhook payload')
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = gzip.decompress(blob)
+    return json.loads(raw)
@@ -0,0 +1,47 @@
+"""
+Background tasks for the payments app.
+Run eagerly in-process when no CELERY_BROKER_URL is configured.
+"""
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=4, default_retry_delay=30)
+def process_webhook_event(self, event_id, force=False):
+    """Apply a stored webhook event (see payments/webhooks.py)."""
+    from .models import WebhookEvent
+    from .webhooks import claim_event, process_event
+
+    if not claim_event(event_id, force=force):
+        return  # Already processed or being processed (duplicate delivery)
+    event = WebhookEvent.objects.select_related('raw').get(pk=event_id)
+
+    try:
+        process_event(event)
+    except Exception as e:
+        if self.request.is_eager:
+            # Running inside the webhook request (no broker): don't retry inline. The event
+            # stays 'failed' for process_pending_webhook_events / replay_webhook_events.
+            logger.error(f"Webhook event {event_id} failed: {e}", exc_info=True)
+            return
+        if self.request.retries >= self.max_retries:
+            logger.error(f"Webhook event {event_id} failed for good: {e}", exc_info=True)
+            return
+        logger.warning(f"Retrying webhook event {event_id}: {e}")
+        raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+
+
+@shared_task
+def process_pending_webhook_events():
+    """Safety net: pick up events whose task was lost or whose retries ran out early."""
+    from .models import WebhookEvent
+    from .webhooks import WEBHOOK_MAX_ATTEMPTS
+
+    event_ids = WebhookEvent.objects.filter(
+        status__in=['pending', 'failed', 'processing'], attempts__lt=WEBHOOK_MAX_ATTEMPTS,
+    ).order_by('received_at').values_list('pk', flat=True)[:500]
+    for event_id in event_ids:
+        process_webhook_event.delay(event_id)
@@ -0,0 +1,372 @@
+"""
+Lemon Squeezy webhook ingestion and processing.
+
+The webhook view only verifies the signature and stores the raw event as a
+WebhookEvent, deduplicated by a hash of the body. Lemon Squeezy redelivers the
+same bytes, so a redelivery is acknowledged without being stored twice. A worker
+then applies the event. Handlers upsert on order/subscription ids, so processing
+the same event again (a retry or `replay_webhook_events`) leaves the same state.
+
+The body is stored once, compressed, as the event's WebhookPayload. Handlers that
+touch a payment return it, and that same row is then linked to the payment.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from authentication.models import UserProfile
+from .checkout import forget_checkout
+from .models import Payment, Subscription, WebhookEvent, WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_STALE_SECONDS = 300  # a 'processing' event older than this is assumed abandoned
+
+
+def dedup_key(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def record_event(body, data):
+    """
+    Store a verified webhook delivery.
+
+    Returns:
+        (WebhookEvent, bool): The event and whether it was new
+    """
+    key = dedup_key(body)
+    event = WebhookEvent.objects.filter(dedup_key=key).first()
+    if event is not None:
+        return event, False
+    try:
+        with transaction.atomic():
+            raw = WebhookPayload.store(None, data)
+            event = WebhookEvent.objects.create(dedup_key=key, event_name=raw.event_name, raw=raw)
+    except IntegrityError:
+        # A concurrent redelivery stored it first
+        return WebhookEvent.objects.get(dedup_key=key), False
+
+    from .tasks import process_webhook_event
+    transaction.on_commit(lambda: process_webhook_event.delay(event.pk))
+    return event, True
+
+
+def claim_event(event_id, force=False):
+    """
+    Mark an event as processing unless another worker has it (or it's done).
+    `force` also reclaims processed/ignored events, for replays.
+    """
+    stale = timezone.now() - timedelta(seconds=WEBHOOK_STALE_SECONDS)
+    claimable = Q(status__in=['pending', 'failed']) | Q(status='processing', updated_at__lt=stale)
+    if force:
+        claimable |= Q(status__in=['processed', 'ignored'])
+    claimed = WebhookEvent.objects.filter(claimable, pk=event_id).update(
+        status='processing', attempts=F('attempts') + 1, updated_at=timezone.now()
+    )
+    return bool(claimed)
+
+
+def process_event(event):
+    """
+    Apply an event's effects and record the outcome on it.
+
+    Raises:
+        Exception: Whatever the handler raised (the event is marked failed first)
+    """
+    handler = HANDLERS.get(event.event_name)
+    if handler is None:
+        logger.warning(f"Unhandled webhook event: {event.event_name}")
+        WebhookEvent.objects.filter(pk=event.pk).update(status='ignored', processed_at=timezone.now(), error='')
+        return 'ignored'
+
+    try:
+        with transaction.atomic():
+            payment = handler(event.payload)
+            if payment is not None:
+                # The event's body becomes part of the payment's history (once, even on replays)
+                WebhookPayload.objects.filter(pk=event.raw_id).update(payment=payment)
+            WebhookEvent.objects.filter(pk=event.pk).update(status='processed', processed_at=timezone.now(), error='')
+    except Exception as e:
+        WebhookEvent.objects.filter(pk=event.pk).update(status='failed', error=str(e)[:2000])
+        raise
+    logger.info(f"✅ Processed webhook {event.event_name} (event {event.pk})")
+    return 'processed'
+
+
+def _handle_order_created(data):
+    """Handle one-time purchase (lifetime access); returns the payment"""
+    attributes = data.get('data', {}).get('attributes', {})
+    # Lemon Squeezy passes checkout custom data under meta.custom_data
+    custom_data = data.get('meta', {}).get('custom_data', {})
+    
+    user_id = custom_data.get('user_id')
+    if not user_id:
+        logger.error("No user_id in custom_data")
+        return
+    
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User {user_id} not found")
+        return
+    
+    # Determine order identifiers safely
+    order_id = str(data.get('data', {}).get('id') or attributes.get('order_id') or attributes.get('order_number'))
+    customer_id = str(attributes.get('customer_id', ''))
+    first_item = attributes.get('first_order_item') or {}
+    variant_id = str(first_item.get('variant_id', ''))
+    product_name = first_item.get('product_name', '')
+    amount = attributes.get('total', 0)
+    currency = attributes.get('currency', '')
+    status_value = attributes.get('status', 'paid')
+
+    # A refund processed first (out-of-order delivery) must not be undone
+    refunded = Payment.objects.filter(order_id=order_id, status='refunded').first()
+    if refunded is not None:
+        logger.warning(f"Order {order_id} already refunded, not granting premium")
+        return refunded
+
+    # Upsert on order_id so redeliveries and replays are harmless
+    payment, _ = Payment.objects.update_or_create(
+        order_id=order_id,
+        defaults={
+            'user': user,
+            'customer_id': customer_id,
+            'amount': amount,
+            'currency': currency,
+            'status': status_value,
+            'variant_id': variant_id,
+            'product_name': product_name,
+        },
+        create_defaults={
+            'user': user,
+            'customer_id': customer_id,
+            'amount': amount,
+            'currency': currency,
+            'status': status_value,
+            'variant_id': variant_id,
+            'product_name': product_name,
+            'paid_at': timezone.now(),
+        },
+    )
+    # Grant lifetime premium access (no expiry)
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    profile.is_premium = True
+    profile.premium_expiry = None  # Lifetime access
+    profile.save()
+    
+    # The cached checkout is spent; a new click (e.g. after a refund) gets a fresh one
+    forget_checkout(user.id, variant_id, custom_data.get('plan', 'premium'))
+    logger.info(f"Granted lifetime premium to user {user.username} (order {order_id})")
+    return payment
+
+
+def _handle_order_refunded(data):
+    """Handle refund of a one-time purchase: revoke lifetime access; returns the payment"""
+    attributes = data.get('data', {}).get('attributes', {})
+    custom_data = data.get('meta', {}).get('custom_data', {})
+
+    user_id = custom_data.get('user_id')
+    if not user_id:
+        logger.error("No user_id in custom_data for refund")
+        return
+
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User {user_id} not found (refund)")
+        return
+
+    # Upsert, so a refund delivered before its order_created leaves a 'refunded' row
+    # that the order_created guard sees (otherwise the late order would re-grant premium)
+    order_id = str(data.get('data', {}).get('id') or attributes.get('order_id') or attributes.get('order_number'))
+    first_item = attributes.get('first_order_item') or {}
+    payment, created = Payment.objects.update_or_create(
+        order_id=order_id,
+        defaults={'status': 'refunded'},
+        create_defaults={
+            'user': user,
+            'customer_id': str(attributes.get('customer_id', '')),
+            'amount': attributes.get('total', 0),
+            'currency': attributes.get('currency', ''),
+            'status': 'refunded',
+            'variant_id': str(first_item.get('variant_id', '')),
+            'product_name': first_item.get('product_name', ''),
+        },
+    )
+    if created:
+        logger.warning(f"Refund for order {order_id} arrived before the order; recorded it as refunded")
+
+    # Revoke premium
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    profile.is_premium = False
+    # For lifetime, clear expiry; optionally set to today
+    profile.premium_expiry = timezone.now().date()
+    profile.save()
+
+    logger.info(f"Revoked lifetime premium from user {user.username} (order refunded {order_id})")
+    return payment
+
+
+def _handle_subscription_created(data):
+    """Handle new subscription"""
+    attributes = data['data']['attributes']
+    # Use meta.custom_data to retrieve our user mapping
+    custom_data = data.get('meta', {}).get('custom_data', {})
+    
+    user_id = custom_data.get('user_id')
+    if not user_id:
+        logger.error("No user_id in custom_data")
+        return
+    
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        logger.error(f"User {user_id} not found")
+        return
+    
+    # Parse dates
+    renews_at = None
+    if attributes.get('renews_at'):
+        renews_at = datetime.fromisoformat(attributes['renews_at'].replace('Z', '+00:00'))
+    
+    trial_ends_at = None
+    if attributes.get('trial_ends_at'):
+        trial_ends_at = datetime.fromisoformat(attributes['trial_ends_at'].replace('Z', '+00:00'))
+    
+    # Create (or, on redelivery, refresh) the subscription record
+    subscription, _ = Subscription.objects.update_or_create(
+        subscription_id=str(data['data']['id']),
+        defaults={
+            'user': user,
+            'customer_id': str(attributes['customer_id']),
+            'order_id': str(attributes.get('order_id', '')),
+            'variant_id': str(attributes['variant_id']),
+            'product_name': attributes['product_name'],
+            'status': attributes['status'],
+            'trial_ends_at': trial_ends_at,
+            'renews_at': renews_at,
+        },
+    )
+    
+    # Grant premium access if subscription is active
+    if subscription.is_active():
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        profile.is_premium = True
+        
+        # Set expiry to renewal date
+        if renews_at:
+            profile.premium_expiry = renews_at.date()
+        
+        profile.save()
+        logger.info(f"Granted premium to user {user.username} (subscription {subscription.subscription_id})")
+
+
+def _handle_subscription_updated(data):
+    """Handle subscription status changes (or create if doesn't exist)"""
+    attributes = data['data']['attributes']
+    subscription_id = str(data['data']['id'])
+    custom_data = data.get('meta', {}).get('custom_data', {})
+    
+    logger.info(f"📦 Processing subscription_updated for subscription {subscription_id}")
+    
+    try:
+        subscription = Subscription.objects.get(subscription_id=subscription_id)
+        logger.info(f"✅ Found existing subscription {subscription_id}")
+    except Subscription.DoesNotExist:
+        # Subscription doesn't exist yet - create it (first webhook might be update, not create)
+        logger.info(f"⚠️ Subscription {subscription_id} not found, creating it now")
+        
+        # Get user from custom_data
+        user_id = custom_data.get('user_id')
+        if not user_id:
+            logger.error("❌ No user_id in custom_data for new subscription")
+            return
+        
+        try:
+            user = User.objects.get(id=user_id)
+            logger.info(f"🎯 Found user: {user.username} (ID: {user.id})")
+        except User.DoesNotExist:
+            logger.error(f"❌ User {user_id} not found")
+            return
+        
+        # Parse dates
+        renews_at = None
+        if attributes.get('renews_at'):
+            renews_at = datetime.fromisoformat(attributes['renews_at'].replace('Z', '+00:00'))
+        
+        trial_ends_at = None
+        if attributes.get('trial_ends_at'):
+            trial_ends_at = datetime.fromisoformat(attributes['trial_ends_at'].replace('Z', '+00:00'))
+        
+        ends_at = None
+        if attributes.get('ends_at'):
+            ends_at = datetime.fromisoformat(attributes['ends_at'].replace('Z', '+00:00'))
+        
+        # Create subscription
+        subscription = Subscription.objects.create(
+            user=user,
+            subscription_id=subscription_id,
+            customer_id=str(attributes['customer_id']),
+            order_id=str(attributes.get('order_id', '')),
+            variant_id=str(attributes['variant_id']),
+            product_name=attributes['product_name'],
+            status=attributes['status'],
+            trial_ends_at=trial_ends_at,
+            renews_at=renews_at,
+            ends_at=ends_at
+        )
+        logger.info(f"💳 Created subscription with ID: {subscription.id}")
+    
+    # Update subscription fields
+    subscription.status = attributes['status']
+    
+    if attributes.get('renews_at'):
+        subscription.renews_at = datetime.fromisoformat(attributes['renews_at'].replace('Z', '+00:00'))
+    
+    if attributes.get('ends_at'):
+        subscription.ends_at = datetime.fromisoformat(attributes['ends_at'].replace('Z', '+00:00'))
+    
+    subscription.save()
+    logger.info(f"📝 Updated subscription status to: {subscription.status}")
+    
+    # Update profile-based premium status
+    profile, _ = UserProfile.objects.get_or_create(user=subscription.user)
+    
+    if subscription.is_active():
+        profile.is_premium = True
+        if subscription.renews_at:
+            profile.premium_expiry = subscription.renews_at.date()
+        logger.info(f"✅ Granted premium to user {subscription.user.username}")
+    else:
+        # Subscription not active - revoke premium
+        profile.is_premium = False
+        if subscription.ends_at:
+            profile.premium_expiry = subscription.ends_at.date()
+        logger.info(f"❌ Revoked premium from user {subscription.user.username}")
+    
+    profile.save()
+    logger.info(f"Final premium status: is_premium={profile.is_premium}, expiry={profile.premium_expiry}")
+
+
+def _handle_subscription_cancelled(data):
+    """Handle subscription cancellation"""
+    _handle_subscription_updated(data)
+
+
+def _handle_subscription_expired(data):
+    """Handle subscription expiration"""
+    _handle_subscription_updated(data)
+
+
+HANDLERS = {
+    'order_created': _handle_order_created,
+    'order_refunded': _handle_order_refunded,
+    # 'affiliate_activated': _handle_affiliate_activated,  # Optional: not enabled
+}
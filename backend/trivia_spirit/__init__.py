@@ -1 +1,4 @@
-# Celery removed - using synchronous image optimization instead
+# Load the Celery app when Django starts so @shared_task uses it
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
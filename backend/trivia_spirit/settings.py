@@ -74,7 +74,7 @@ CLOUDFLARE_R2_CONFIG_OPTIONS ={
 
 STORAGES = {
 "default": {
-"BACKEND": "helpers.cloudflare.storages.MediaFileStorage", # django-stor
+"BACKEND": "helpers.cloudflare.storages.CachedMediaFileStorage", # django-stor
 "OPTIONS": CLOUDFLARE_R2_CONFIG_OPTIONS,
 },
 "staticfiles": {
@@ -82,6 +82,21 @@ STORAGES = {
 "OPTIONS": CLOUDFLARE_R2_CONFIG_OPTIONS,
 },
 }
+
+# Media storage metadata caching (see helpers.cloudflare.storages.CachedMediaFileStorage)
+# exists()/size()/url() answers are memoized; the manifest is rebuilt by `manage.py refresh_media_manifest`
+MEDIA_STORAGE_CACHE = config('MEDIA_STORAGE_CACHE', default='media-metadata')  # CACHES alias for the memo
+MEDIA_STORAGE_METADATA_TIMEOUT = config('MEDIA_STORAGE_METADATA_TIMEOUT', cast=int, default=120)  # deletes on other hosts show up within this
+MEDIA_STORAGE_NEGATIVE_TIMEOUT = config('MEDIA_STORAGE_NEGATIVE_TIMEOUT', cast=int, default=60)  # 'missing' answers; other hosts may write meanwhile
+MEDIA_STORAGE_MANIFEST_PATH = config('MEDIA_STORAGE_MANIFEST_PATH', default=str(BASE_DIR / 'media_manifest.json'))
+MEDIA_STORAGE_MANIFEST_TTL = config('MEDIA_STORAGE_MANIFEST_TTL', cast=int, default=900)
+# Optional local-disk read-through cache for object bytes (empty = disabled)
+MEDIA_DISK_CACHE_DIR = config('MEDIA_DISK_CACHE_DIR', default='')
+MEDIA_DISK_CACHE_MAX_BYTES = config('MEDIA_DISK_CACHE_MAX_MB', cast=int, default=512) * 1024 * 1024
+# Batch uploads (MediaFileStorage.save_many): parallel uploads and the size above which multipart is used
+MEDIA_UPLOAD_CONCURRENCY = config('MEDIA_UPLOAD_CONCURRENCY', cast=int, default=8)
+MEDIA_MULTIPART_THRESHOLD_BYTES = config('MEDIA_MULTIPART_THRESHOLD_MB', cast=int, default=8) * 1024 * 1024
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'middleware.logging_middleware.RequestLoggingMiddleware',
@@ -90,6 +105,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'middleware.entitlements.EntitlementsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -144,9 +160,28 @@ LEMONSQUEEZY_API_KEY = config('LEMONSQUEEZY_API_KEY', default='')
 LEMONSQUEEZY_STORE_ID = config('LEMONSQUEEZY_STORE_ID', default='')
 LEMONSQUEEZY_WEBHOOK_SECRET = config('LEMONSQUEEZY_WEBHOOK_SECRET', default='')
 LEMONSQUEEZY_VARIANT_ID = config('LEMONSQUEEZY_VARIANT_ID', default='')  # Product variant ID for premium plan
+CHECKOUT_URL_CACHE_TTL = config('CHECKOUT_URL_CACHE_TTL', cast=int, default=600)  # seconds a user's checkout URL is reused
 
 # Google OAuth Configuration
 GOOGLE_OAUTH_CLIENT_ID = config('GOOGLE_OAUTH_CLIENT_ID', default='')  # Get from Google Cloud Console
+# Overridable so local setups and tests can point at a stand-in server
+GOOGLE_CERTS_URL = config('GOOGLE_CERTS_URL', default='https://www.googleapis.com/oauth2/v1/certs')
+GOOGLE_USERINFO_URL = config('GOOGLE_USERINFO_URL', default='https://www.googleapis.com/oauth2/v3/userinfo')
+
+# Outbound HTTP (utils/http_client.py): defaults for every integration's pooled client
+OUTBOUND_HTTP_CONNECT_TIMEOUT = config('OUTBOUND_HTTP_CONNECT_TIMEOUT', cast=float, default=3.05)  # seconds
+OUTBOUND_HTTP_READ_TIMEOUT = config('OUTBOUND_HTTP_READ_TIMEOUT', cast=float, default=10)  # seconds
+OUTBOUND_HTTP_RETRIES = config('OUTBOUND_HTTP_RETRIES', cast=int, default=2)
+OUTBOUND_HTTP_BACKOFF = config('OUTBOUND_HTTP_BACKOFF', cast=float, default=0.5)  # seconds, doubled per retry (jittered)
+OUTBOUND_HTTP_POOL_SIZE = config('OUTBOUND_HTTP_POOL_SIZE', cast=int, default=10)  # keep-alive connections per host
+OUTBOUND_HTTP_BREAKER_THRESHOLD = config('OUTBOUND_HTTP_BREAKER_THRESHOLD', cast=int, default=5)  # consecutive failures
+OUTBOUND_HTTP_BREAKER_RESET = config('OUTBOUND_HTTP_BREAKER_RESET', cast=float, default=30)  # seconds before a probe
+OUTBOUND_HTTP_STATS_INTERVAL = config('OUTBOUND_HTTP_STATS_INTERVAL', cast=int, default=300)  # seconds between per-process stats log lines, 0 disables
+
+# Email logins resolve in one indexed query; username logins (admin) still go through ModelBackend
+AUTHENTICATION_BACKENDS = [
+    'authentication.backends.EmailBackend',
+]
 
 
 
@@ -206,7 +241,7 @@ LOGOUT_REDIRECT_URL = 'home'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'authentication.token_auth.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -227,6 +262,10 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# Per-process cache of authenticated tokens (user + profile + entitlements), see authentication/token_auth.py
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', cast=int, default=300)  # seconds; revocation is still checked on every request
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', cast=int, default=10000)  # tokens per worker
+
 # Caching (In-Memory)
 # Using locmem cache for development. For production, configure Redis properly.
 CACHES = {
@@ -238,7 +277,17 @@ CACHES = {
         },
         'KEY_PREFIX': 'brainigo',
         'TIMEOUT': 300,  # 5 minutes default
-    }
+    },
+    # Media storage metadata memo (MEDIA_STORAGE_CACHE): kept apart so culling it never evicts app keys
+    'media-metadata': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'brainigo-media-metadata',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('MEDIA_STORAGE_CACHE_MAX_ENTRIES', cast=int, default=5000),
+        },
+        'KEY_PREFIX': 'brainigo',
+        'TIMEOUT': 120,
+    },
 }
 
 # Redis configuration (commented out due to version compatibility issues)
@@ -260,8 +309,43 @@ CORS_ALLOWED_ORIGINS = config("CORS_ALLOWED_ORIGINS", default="").split(",")
 
 CORS_ALLOW_CREDENTIALS = True
 
-# Note: Image optimization is now synchronous (happens during upload)
-# No Celery or background tasks needed!
+# Responsive image variants: also encode AVIF next to WebP (AV1 encoding is slow, so opt-in)
+IMAGE_VARIANTS_AVIF = config('IMAGE_VARIANTS_AVIF', cast=bool, default=False)
+
+# Celery (background tasks: optimizing direct uploads, etc.)
+# Without a broker, tasks run eagerly in-process so local setups need nothing extra.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_BEAT_SCHEDULE = {
+    'expire-premium-memberships': {
+        'task': 'authentication.tasks.expire_premium_memberships',
+        'schedule': 60 * 60,  # Hourly; premium_expiry is a date, so access ends within an hour of it passing
+    },
+    'deliver-email-outbox': {
+        'task': 'authentication.tasks.deliver_email_outbox',
+        'schedule': 60,  # Picks up retries; new mail is also delivered as soon as it's committed
+    },
+    'process-pending-webhook-events': {
+        'task': 'payments.tasks.process_pending_webhook_events',
+        'schedule': 5 * 60,  # Events are processed on receipt; this only catches lost tasks
+    },
+    'flush-storage-deletions': {
+        'task': 'content.tasks.flush_storage_deletions',
+        'schedule': 5 * 60,  # Retries failed deletes and picks up delayed ones (replaced sprites)
+    },
+}
+
+# Direct-to-storage uploads: presigned PUT URLs for the media bucket
+MEDIA_UPLOAD_URL_EXPIRE = config('MEDIA_UPLOAD_URL_EXPIRE', cast=int, default=900)  # seconds
+MEDIA_UPLOAD_MAX_MB = config('MEDIA_UPLOAD_MAX_MB', cast=int, default=5)
+
+# Resumable upload sessions: chunks are assembled on local disk before going to storage.
+# With several hosts, route a session to one host or point this at a shared volume.
+UPLOAD_SESSION_DIR = config('UPLOAD_SESSION_DIR', default=str(BASE_DIR / 'upload_sessions'))
+# Must stay below DATA_UPLOAD_MAX_MEMORY_SIZE (2.5MB) since chunks arrive as the raw request body
+UPLOAD_CHUNK_MAX_BYTES = config('UPLOAD_CHUNK_MAX_KB', cast=int, default=2048) * 1024
 
 # Print storage backend info
 # --- Force Cloudflare R2 as the default storage backend safely ---
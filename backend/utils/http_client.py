@@ -0,0 +1,269 @@
+"""
+Shared outbound HTTP layer for third-party integrations (Lemon Squeezy, ZeptoMail, Google).
+
+Each integration gets one long-lived client per process:
+- a requests Session whose adapter keeps a keep-alive connection pool per host,
+  so calls reuse TCP+TLS connections instead of handshaking every time;
+- default connect/read timeouts;
+- retries with exponential backoff and full jitter. Idempotent methods retry on
+  connection errors and 429/502/503/504. Other methods retry only when the request
+  can't have been processed: connect timeouts, 429 and 503;
+- a circuit breaker that fails fast (CircuitOpenError) after consecutive failures
+  and lets a single probe through once the reset timeout has passed;
+- latency and error counters, readable with outbound_stats() and logged as one
+  structured line per process every OUTBOUND_HTTP_STATS_INTERVAL seconds.
+
+CircuitOpenError subclasses requests.RequestException, so existing
+`except RequestException` handlers cover it.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+UNPROCESSED_STATUSES = frozenset({429, 503})  # Safe to retry any method
+MAX_RETRY_AFTER_SECONDS = 10
+LATENCY_SAMPLES = 500
+
+
+class CircuitOpenError(requests.RequestException):
+    """The integration failed repeatedly; calls are refused until the breaker resets."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class IntegrationStats:
+    """Per-integration counters and a window of recent latencies."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, duration_ms, failed):
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+            self.latencies_ms.append(duration_ms)
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies_ms)
+        percentile = lambda p: round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 1) if latencies else None
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'short_circuited': self.short_circuited,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+        }
+
+
+class HttpClient:
+    """Pooled, retrying, circuit-broken HTTP client for one integration."""
+
+    def __init__(
+        self,
+        name: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: float = 8.0,
+        pool_size: Optional[int] = None,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.OUTBOUND_HTTP_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.OUTBOUND_HTTP_READ_TIMEOUT,
+        )
+        self.retries = retries if retries is not None else settings.OUTBOUND_HTTP_RETRIES
+        self.backoff = backoff if backoff is not None else settings.OUTBOUND_HTTP_BACKOFF
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(
+            failure_threshold or settings.OUTBOUND_HTTP_BREAKER_THRESHOLD,
+            reset_timeout or settings.OUTBOUND_HTTP_BREAKER_RESET,
+        )
+        self.stats = IntegrationStats()
+
+        # Retries are handled here (with jitter and breaker bookkeeping), not by urllib3
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=pool_size or settings.OUTBOUND_HTTP_POOL_SIZE,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(int(retry_after), MAX_RETRY_AFTER_SECONDS))
+        self.stats.count('retries')
+        time.sleep(delay)
+
+    def request(self, method: str, url: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool.
+
+        Returns the last response even when its status is an error, like requests does.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            requests.RequestException: Connection errors/timeouts that outlasted the retries
+        """
+        log_outbound_stats_if_due()
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                self.stats.count('short_circuited')
+                raise CircuitOpenError(f'{self.name} circuit open after repeated failures')
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                duration_ms = (time.monotonic() - started) * 1000
+                self.stats.record(duration_ms, failed=True)
+                self.breaker.record_failure()
+                logger.warning(f"[OUTBOUND] {self.name} {method} {host} failed after {duration_ms:.0f}ms: {e}")
+                # A request that never connected can't have been processed, whatever the method
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if attempt < retries and retryable:
+                    self._sleep_before_retry(attempt)
+                    continue
+                raise
+
+            duration_ms = (time.monotonic() - started) * 1000
+            failed = response.status_code >= 500 or response.status_code == 429
+            self.stats.record(duration_ms, failed=failed)
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            logger.debug(f"[OUTBOUND] {self.name} {method} {host} {response.status_code} {duration_ms:.0f}ms")
+
+            retryable = response.status_code in (RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES)
+            if attempt < retries and retryable:
+                response.close()
+                self._sleep_before_retry(attempt, response)
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_clients: Dict[str, HttpClient] = {}
+_clients_lock = threading.Lock()
+_stats_logged_at = time.monotonic()
+_stats_lock = threading.Lock()
+
+
+def get_client(name: str, **options) -> HttpClient:
+    """The process-wide client for an integration (created with `options` on first use)."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = HttpClient(name, **options)
+    return client
+
+
+def outbound_stats() -> Dict[str, dict]:
+    """Latency/error metrics and breaker state per integration, for this process."""
+    return {
+        name: {**client.stats.snapshot(), 'circuit': client.breaker.state}
+        for name, client in _clients.items()
+    }
+
+
+def log_outbound_stats_if_due():
+    """Log outbound_stats() at most every OUTBOUND_HTTP_STATS_INTERVAL seconds (0 disables)."""
+    global _stats_logged_at
+    interval = settings.OUTBOUND_HTTP_STATS_INTERVAL
+    now = time.monotonic()
+    if not interval or now - _stats_logged_at < interval:
+        return
+    with _stats_lock:
+        if now - _stats_logged_at < interval:
+            return
+        _stats_logged_at = now
+    stats = outbound_stats()
+    if stats:
+        # One line per process; the JSON formatter keeps `outbound` as a structured field
+        logger.info(f"📊 [OUTBOUND] stats for {', '.join(sorted(stats))}", extra={'outbound': stats})
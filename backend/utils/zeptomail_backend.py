@@ -1,6 +1,8 @@
 """
 Custom Django email backend for ZeptoMail (Zoho transactional email service).
 Uses REST API instead of SMTP for better reliability and no timeout issues.
+Identical messages to many recipients can go out in one batch call (send_batch);
+FakeZeptoMailBackend records payloads locally for tests and development.
 """
 import requests
 from django.conf import settings
@@ -8,6 +10,8 @@ from django.core.mail.backends.base import BaseEmailBackend
 from django.core.mail.message import sanitize_address
 import logging
 
+from .http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +24,7 @@ class ZeptoMailBackend(BaseEmailBackend):
     - ZEPTOMAIL_API_ENDPOINT: Usually "https://api.zeptomail.eu/" for EU or "https://api.zeptomail.com/" for US
     - DEFAULT_FROM_EMAIL: Sender email address (must be verified in ZeptoMail)
     """
+    BATCH_MAX_RECIPIENTS = 500  # ZeptoMail batch endpoint limit per call
     
     def __init__(self, fail_silently=False, **kwargs):
         super().__init__(fail_silently=fail_silently)
@@ -32,6 +37,8 @@ class ZeptoMailBackend(BaseEmailBackend):
             logger.warning(msg)
             if not fail_silently:
                 raise ValueError(msg)
+        # Shared keep-alive pool, retries and circuit breaker (see utils/http_client.py)
+        self.http = get_client('zeptomail')
     
     def send_messages(self, email_messages):
         """
@@ -53,19 +60,15 @@ class ZeptoMailBackend(BaseEmailBackend):
         
         return num_sent
     
-    def _send(self, message):
-        """Send a single EmailMessage via ZeptoMail API."""
-        if not message.recipients():
-            return False
-        
-        # Prepare payload
+    def _payload(self, message, recipients=None):
+        """ZeptoMail API payload for a message (`recipients` overrides its To list)."""
         payload = {
             "from": {
                 "address": self.from_email,
             },
             "to": [
                 {"email_address": {"address": recipient}}
-                for recipient in message.to
+                for recipient in (recipients if recipients is not None else message.to)
             ],
             "subject": message.subject,
         }
@@ -87,40 +90,41 @@ class ZeptoMailBackend(BaseEmailBackend):
         if message.body:
             payload["textbody"] = message.body
         
-        if message.alternatives:
-            for content, mimetype in message.alternatives:
-                if mimetype == "text/html":
-                    payload["htmlbody"] = content
-                    break
+        for content, mimetype in getattr(message, 'alternatives', None) or []:
+            if mimetype == "text/html":
+                payload["htmlbody"] = content
+                break
         
         # Add reply-to if present
         if message.reply_to:
             payload["reply_to"] = {
                 "address": message.reply_to[0]
             }
-        
-        # Send via ZeptoMail API
-        headers = {
-            "Authorization": self.api_key,
-            "Content-Type": "application/json",
-        }
-        
+        return payload
+    
+    def _post(self, path, payload):
+        """POST a payload to the ZeptoMail API; returns (status_code, response text)."""
+        response = self.http.post(
+            f"{self.api_endpoint}{path}",
+            json=payload,
+            headers={
+                "Authorization": self.api_key,
+                "Content-Type": "application/json",
+            },
+        )
+        return response.status_code, response.text
+    
+    def _deliver(self, path, payload, recipients):
         try:
-            response = requests.post(
-                f"{self.api_endpoint}v1.1/email",
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
+            status_code, text = self._post(path, payload)
             
-            if response.status_code in [200, 201]:
-                logger.info(f"Email sent successfully to {message.to} via ZeptoMail")
+            if status_code in [200, 201]:
+                logger.info(f"Email sent successfully to {recipients} via ZeptoMail")
                 return True
             else:
-                error_msg = f"ZeptoMail API error: {response.status_code} - {response.text}"
+                error_msg = f"ZeptoMail API error: {status_code} - {text}"
                 logger.error(error_msg)
                 logger.error(f"Request payload: {payload}")
-                logger.error(f"Request headers: {headers}")
                 if not self.fail_silently:
                     raise Exception(error_msg)
                 return False
@@ -136,3 +140,52 @@ class ZeptoMailBackend(BaseEmailBackend):
             if not self.fail_silently:
                 raise
             return False
+    
+    def _send(self, message):
+        """Send a single EmailMessage via ZeptoMail API."""
+        if not message.recipients():
+            return False
+        return self._deliver("v1.1/email", self._payload(message), message.to)
+    
+    def send_batch(self, message, recipients):
+        """
+        Send one message to many recipients in a single batch API call.
+        Each address in `recipients` receives its own copy (they don't see each other).
+
+        Raises:
+            ValueError: If there are more than BATCH_MAX_RECIPIENTS recipients
+        """
+        if not recipients:
+            return False
+        if len(recipients) > self.BATCH_MAX_RECIPIENTS:
+            raise ValueError(f"ZeptoMail batches take at most {self.BATCH_MAX_RECIPIENTS} recipients")
+        payload = self._payload(message, recipients=recipients)
+        return self._deliver("v1.1/email/batch", payload, recipients)
+
+
+class FakeZeptoMailBackend(ZeptoMailBackend):
+    """
+    Local stand-in for ZeptoMail: builds the same API payloads but records them in
+    `FakeZeptoMailBackend.requests` instead of calling the API.
+    Set `fail_next` to make the next N calls fail with a 500.
+    """
+    requests = []
+    fail_next = 0
+
+    def __init__(self, fail_silently=False, **kwargs):
+        BaseEmailBackend.__init__(self, fail_silently=fail_silently)
+        self.api_key = 'fake'
+        self.api_endpoint = 'fake://zeptomail/'
+        self.from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', '')
+
+    def _post(self, path, payload):
+        if FakeZeptoMailBackend.fail_next > 0:
+            FakeZeptoMailBackend.fail_next -= 1
+            return 500, '{"error": "fake failure"}'
+        FakeZeptoMailBackend.requests.append({'path': path, 'payload': payload})
+        return 201, '{"message": "OK"}'
+
+    @classmethod
+    def reset(cls):
+        cls.requests = []
+        cls.fail_next = 0